@@ -0,0 +1,167 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple
+
+
+class _Submission:
+    """รายการที่ผู้เรียกหนึ่งรายส่งเข้ามา พร้อมตำแหน่งที่ส่งไปแล้วและผลลัพธ์ที่ได้กลับมา"""
+
+    __slots__ = ("items", "results", "next_index", "remaining", "future")
+
+    def __init__(self, items: list, future: asyncio.Future):
+        self.items = items
+        self.results = [None] * len(items)
+        self.next_index = 0 # index ถัดไปที่ยังไม่ได้ถูกใส่ลงใน batch
+        self.remaining = len(items) # จำนวนผลลัพธ์ที่ยังรออยู่
+        self.future = future
+
+
+class MicroBatcher:
+    """
+    รวมรายการจากผู้เรียกหลายรายที่เรียกพร้อมกัน (เช่น หลาย request ของ /analyze)
+    เป็น batch เดียว แล้วเรียก process_batch ครั้งเดียว จากนั้นส่งผลลัพธ์กลับให้ผู้เรียกแต่ละราย
+    - รอรวบรวมรายการได้นานสุด max_wait_ms หรือจนครบ max_batch_size
+    - ดึงรายการจากผู้เรียกแต่ละรายแบบวนรอบ (round-robin) ผู้เรียกที่ส่งมามากจึงไม่บังผู้เรียกรายอื่น
+    - ถ้าผู้เรียกยกเลิก รายการที่ยังไม่ถูกส่งจะถูกตัดออกจากคิว
+    """
+
+    def __init__(self, process_batch: Callable[[list], Awaitable[list]], max_batch_size: int = 64,
+                 max_wait_ms: float = 15.0, max_concurrent_batches: int = 2):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrent_batches = max_concurrent_batches
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Deque[_Submission] = deque()
+        self._pending_items = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running = set()
+        self._counters = {"submissions": 0, "items": 0, "batches": 0, "batched_items": 0, "cancelled": 0}
+
+    def _ensure_started(self) -> None:
+        """เริ่ม dispatcher ใน event loop ปัจจุบัน (เริ่มใหม่ถ้า loop เปลี่ยน)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._dispatcher is None or self._dispatcher.done():
+            self._loop = loop
+            self._queue.clear()
+            self._pending_items = 0
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._running = set()
+            self._dispatcher = loop.create_task(self._dispatch_loop())
+
+    async def submit(self, items: list) -> list:
+        """ส่งรายการเข้าคิวแล้วรอผลลัพธ์ (ลำดับเดียวกับ items)"""
+        if not items:
+            return []
+        self._ensure_started()
+        submission = _Submission(list(items), self._loop.create_future())
+        self._queue.append(submission)
+        self._pending_items += len(submission.items)
+        self._counters["submissions"] += 1
+        self._counters["items"] += len(submission.items)
+        self._wakeup.set()
+
+        try:
+            return await submission.future
+        except asyncio.CancelledError:
+            self._counters["cancelled"] += 1
+            self._discard(submission)
+            raise
+
+    def _discard(self, submission: _Submission) -> None:
+        """ตัดรายการที่ยังไม่ถูกส่งของผู้เรียกที่ยกเลิกหรือได้ผลเป็นข้อผิดพลาดไปแล้วออกจากคิว"""
+        if submission in self._queue:
+            self._queue.remove(submission)
+            self._pending_items -= len(submission.items) - submission.next_index
+        if not submission.future.done():
+            submission.future.cancel()
+
+    def _take_batch(self) -> List[Tuple[_Submission, int]]:
+        """ดึงรายการจากผู้เรียกแต่ละรายแบบวนรอบจนครบ max_batch_size"""
+        batch = []
+        while self._queue and len(batch) < self.max_batch_size:
+            submission = self._queue.popleft()
+            batch.append((submission, submission.next_index))
+            submission.next_index += 1
+            self._pending_items -= 1
+            if submission.next_index < len(submission.items):
+                self._queue.append(submission)
+        return batch
+
+    async def _dispatch_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # รอรายการจากผู้เรียกรายอื่นเพิ่มอีกเล็กน้อย ถ้า batch ยังไม่เต็ม
+            deadline = loop.time() + self.max_wait
+            while self._pending_items < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            await self._slots.acquire()
+            batch = self._take_batch()
+            if not batch:
+                self._slots.release()
+                continue
+            task = loop.create_task(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch: List[Tuple[_Submission, int]]) -> None:
+        try:
+            self._counters["batches"] += 1
+            self._counters["batched_items"] += len(batch)
+            try:
+                results = await self.process_batch([submission.items[index] for submission, index in batch])
+                if len(results) != len(batch):
+                    raise ValueError(f"process_batch returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                for submission, _ in batch:
+                    if not submission.future.done():
+                        submission.future.set_exception(e)
+                        # ผลที่เหลือของผู้เรียกรายนี้ไม่มีใครใช้แล้ว ไม่ต้องส่งไปยัง backend
+                        self._discard(submission)
+                return
+
+            for (submission, index), result in zip(batch, results):
+                if submission.future.done(): # ผู้เรียกยกเลิกหรือเกิดข้อผิดพลาดไปแล้ว
+                    continue
+                submission.results[index] = result
+                submission.remaining -= 1
+                if submission.remaining == 0:
+                    submission.future.set_result(submission.results)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """คืนค่าสถิติ เช่น จำนวน batch และขนาด batch เฉลี่ย"""
+        counters = dict(self._counters)
+        counters["avg_batch_size"] = round(counters["batched_items"] / counters["batches"], 2) if counters["batches"] else 0.0
+        counters["pending_items"] = self._pending_items
+        return counters
+
+    async def aclose(self) -> None:
+        """หยุด dispatcher และ batch ที่กำลังทำงาน"""
+        tasks = [task for task in (self._dispatcher, *self._running) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for submission in self._queue:
+            if not submission.future.done():
+                submission.future.cancel()
+        self._queue.clear()
+        self._pending_items = 0
+        self._dispatcher = None
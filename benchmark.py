@@ -0,0 +1,546 @@
+"""
+สคริปต์วัดประสิทธิภาพ (benchmark) ของขั้นตอนต่างๆ ในการวิเคราะห์ความคิดเห็น
+ตัวอย่างการใช้งาน:
+    python benchmark.py language --comments 1000 --repeat 5
+    python benchmark.py sentiment --comments 500
+    python benchmark.py clean --comments 20000
+    python benchmark.py listing --channel UCxxxxxxxxxxxxxxxxxxxxxx --pages 3
+    python benchmark.py micro --repeat 20
+    python benchmark.py load --endpoint analyze --requests 200 --concurrency 20 --youtube-latency lognormal:80:0.4
+    python benchmark.py startup --repeat 3
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import statistics
+import subprocess
+import time
+from types import SimpleNamespace
+
+# ตัวอย่างคอมเมนต์สำหรับสร้างชุดข้อมูลทดสอบ (ไทย, อังกฤษ, ผสม, อิโมจิ, ภาษาอื่น)
+SAMPLE_COMMENTS = [
+    "คลิปนี้ดีมากเลยครับ ขอบคุณที่ทำมาให้ดู",
+    "ชอบมากค่ะ รอติดตามตอนต่อไปนะคะ",
+    "เสียงเบาไปหน่อย แต่เนื้อหาดีมาก",
+    "This is the best video I have seen all week",
+    "first",
+    "nice video",
+    "The editing is great but the audio is a bit quiet",
+    "ดีมาก very good 555",
+    "สุดยอด!!! love this so much",
+    "555555",
+    "😂😂😂",
+    "👍👍",
+    "最高の動画でした",
+    "Отличное видео, спасибо",
+    "I don't get why people hate this, คลิปนี้ดีออก",
+]
+
+
+def make_comment_corpus(count: int, seed: int = 0) -> list:
+    """สร้างชุดคอมเมนต์จำลองแบบสุ่ม (กำหนด seed เพื่อให้ผลซ้ำได้)"""
+    rng = random.Random(seed)
+    return [rng.choice(SAMPLE_COMMENTS) + (" " + str(index) if rng.random() < 0.5 else "") for index in range(count)]
+
+
+def time_call(func, repeat: int) -> list:
+    """เรียก func ซ้ำ repeat ครั้ง แล้วคืนค่าเวลาที่ใช้แต่ละครั้ง (มิลลิวินาที)"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name: str, timings: list, items: int) -> None:
+    """พิมพ์สรุปเวลา (median/min) และจำนวนรายการต่อวินาที"""
+    median = statistics.median(timings)
+    print(f"{name:<40} median {median:9.2f} ms  min {min(timings):9.2f} ms  "
+          f"{items / (median / 1000) if median else float('inf'):12,.0f} items/s")
+
+
+# --- Language detection ---
+
+def bench_language(args) -> None:
+    """เปรียบเทียบเวลาตรวจจับภาษาต่อ batch: วนเรียก langdetect ทีละคอมเมนต์ vs. script histogram"""
+    from detect_language import needs_translation, needs_translation_batch
+
+    texts = make_comment_corpus(args.comments)
+    per_comment = time_call(lambda: [needs_translation(text) for text in texts], args.repeat)
+    batched = time_call(lambda: needs_translation_batch(texts), args.repeat)
+
+    agreement = sum(
+        a == b for a, b in zip([needs_translation(text) for text in texts], needs_translation_batch(texts))
+    ) / len(texts)
+    print(f"Language detection, {len(texts)} comments per batch")
+    report("per-comment langdetect loop", per_comment, len(texts))
+    report("script histogram + langdetect fallback", batched, len(texts))
+    print(f"decision agreement: {agreement:.1%}")
+
+
+# --- Text cleaning ---
+
+# กรณีพิเศษที่ต้องได้ผลตรงกับ clean_text แบบเดิม (รวมกับคอมเมนต์จำลองเป็น golden corpus)
+def make_clean_text_corpus(count: int, seed: int = 0) -> list:
+    """คอมเมนต์จำลอง + ข้อความสุ่มจากชุดอักขระที่ยาก (URL, อิโมจิ, สระซ้อน, ช่องว่างแปลกๆ)"""
+    rng = random.Random(seed)
+    alphabet = list(" \t\n\u00a0\u200b\u200c.,!?:/#@_-'\"()😂👍🇹🇭ก่้๊๋ัิีเแาำะๆ๏๙฿ewhtpsABC123日Пéๅํฺ")
+    fuzz = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60))) for _ in range(count // 2)]
+    return make_comment_corpus(count - len(fuzz), seed) + fuzz
+
+
+def bench_clean(args) -> None:
+    """
+    วัดจำนวนคอมเมนต์ต่อวินาทีของ clean_batch แต่ละโหมด
+    (ความถูกต้องเทียบกับการทำความสะอาดแบบเดิมตรวจใน tests/test_clean_text.py)
+    """
+    import clean_text
+
+    texts = make_clean_text_corpus(args.comments)
+    modes = [
+        ("clean_text (per comment)", lambda: [clean_text.clean_text(text) for text in texts]),
+        ("clean_batch, regex", lambda: clean_text.clean_batch(texts, mode="regex", process_threshold=0)),
+        ("clean_batch, translate", lambda: clean_text.clean_batch(texts, mode="translate", process_threshold=0)),
+        ("clean_batch, regex, process pool", lambda: clean_text.clean_batch(
+            texts, mode="regex", process_threshold=1, max_workers=args.workers)),
+    ]
+
+    print(f"Text cleaning, {len(texts)} comments per batch")
+    for name, func in modes:
+        report(name, time_call(func, args.repeat), len(texts))
+    clean_text.shutdown_process_pool()
+
+
+# --- Sentiment backends ---
+
+def make_tiny_checkpoint(path: str) -> str:
+    """
+    สร้าง checkpoint ขนาดเล็กที่สุ่มค่าน้ำหนัก (BERT 2 ชั้น, 3 labels) พร้อม tokenizer ระดับตัวอักษร
+    ใช้ทดสอบ/วัดความเร็ว backend ในเครื่องแบบ offline โดยไม่ต้องดาวน์โหลดโมเดลจริง
+    """
+    from transformers import BertConfig, BertForSequenceClassification, BertTokenizer
+
+    characters = sorted(set("".join(SAMPLE_COMMENTS)) | set("abcdefghijklmnopqrstuvwxyz0123456789"))
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + characters + [f"##{c}" for c in characters]
+    os.makedirs(path, exist_ok=True)
+    vocab_file = os.path.join(path, "vocab.txt")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab))
+
+    BertTokenizer(vocab_file, do_lower_case=True).save_pretrained(path)
+    config = BertConfig(
+        vocab_size=len(vocab), hidden_size=64, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=128, max_position_embeddings=512, num_labels=3,
+    )
+    BertForSequenceClassification(config).save_pretrained(path)
+    return path
+
+
+def bench_sentiment(args) -> None:
+    """วัดจำนวนคอมเมนต์ต่อวินาทีของ backend ในเครื่อง เทียบกับ Hugging Face Inference API (ถ้ามี HF_TOKEN)"""
+    from sentiment_backends import LocalTransformersBackend
+    import predict_sentiment
+
+    texts = make_comment_corpus(args.comments)
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model_path or make_tiny_checkpoint(os.path.join(tmp, "tiny-model"))
+        backend = LocalTransformersBackend(model_path, num_threads=args.threads, max_batch_size=args.batch_size)
+        backend.load()
+        no_bucketing = LocalTransformersBackend(model_path, num_threads=args.threads, max_batch_size=args.batch_size,
+                                                max_batch_tokens=10 ** 9)
+        no_bucketing.load()
+        # ปิดการจัดกลุ่มตามความยาว: แบ่งตามลำดับเดิมทีละ max_batch_size
+        no_bucketing.make_buckets = lambda lengths: [
+            list(range(start, min(start + args.batch_size, len(lengths))))
+            for start in range(0, len(lengths), args.batch_size)
+        ]
+        results.append(("local, length-bucketed", time_call(lambda: backend.predict_sync(texts), args.repeat)))
+        results.append(("local, arrival order", time_call(lambda: no_bucketing.predict_sync(texts), args.repeat)))
+
+    if args.remote_url:
+        predict_sentiment.API_URL = args.remote_url
+    if predict_sentiment.HF_TOKEN or args.remote_url:
+        remote = predict_sentiment.RemoteHFBackend()
+
+        async def run_remote():
+            try:
+                return [await asyncio.wait_for(remote.predict(texts), timeout=300)]
+            finally:
+                await remote.aclose()
+
+        results.append(("remote Inference API", time_call(lambda: asyncio.run(run_remote()), 1)))
+    else:
+        print("(ข้าม remote: ไม่พบ HF_TOKEN และไม่ได้ระบุ --remote-url)")
+
+    print(f"Sentiment inference, {len(texts)} comments per call")
+    for name, timings in results:
+        report(name, timings, len(texts))
+
+
+def bench_listing(args) -> None:
+    """เปรียบเทียบ quota และเวลาในการดึงรายการวิดีโอของช่อง: uploads playlist เทียบกับ search.list (ต้องมี YOUTUBE_API_KEY)"""
+    import fetch_channel_data
+    from metadata_cache import metadata_cache, uploads_playlist_cache_key
+    from rate_limiter import YOUTUBE_QUOTA_COSTS
+    from youtube_client import get_youtube_client, close_youtube_client
+
+    if not fetch_channel_data.YOUTUBE_API_KEY:
+        print("(ข้าม: ไม่พบ YOUTUBE_API_KEY)")
+        return
+
+    async def run_listing(fetch_page) -> tuple:
+        client = get_youtube_client()
+        original_list = client.list
+        units = {"total": 0}
+
+        async def counting_list(resource, **params):
+            units["total"] += YOUTUBE_QUOTA_COSTS.get(resource, 1)
+            return await original_list(resource, **params)
+
+        client.list = counting_list
+        metadata_cache.delete(uploads_playlist_cache_key(args.channel))
+        videos = 0
+        page_timings = []
+        page_token = None
+        try:
+            for _ in range(args.pages):
+                start = time.perf_counter()
+                page, page_token = await fetch_page(args.channel, max_results_per_page=50, page_token=page_token)
+                page_timings.append(time.perf_counter() - start)
+                videos += len(page)
+                if not page_token:
+                    break
+        finally:
+            await close_youtube_client()
+        return videos, units["total"], page_timings
+
+    print(f"Channel video listing for {args.channel}, up to {args.pages} pages of 50")
+    for name, fetch_page in (("uploads playlist", fetch_channel_data.fetch_channel_videos),
+                             ("search.list", fetch_channel_data.fetch_channel_videos_via_search)):
+        videos, units, page_timings = asyncio.run(run_listing(fetch_page))
+        print(f"  {name:<20} {videos:>5} videos  {units:>5} quota units"
+              f"  page median {statistics.median(page_timings) * 1000:8.1f} ms"
+              f"  total {sum(page_timings) * 1000:8.1f} ms")
+
+
+# ค่าตั้งต้นของ environment ที่ทำให้ benchmark ไม่ต้องใช้ network และไม่ถูกตัวจำกัดอัตราหน่วงเวลา
+# (rate_limiter.py และ token_utils.py อ่านค่าตอน import จึงต้องตั้งก่อน import โมดูลของแอป)
+OFFLINE_ENVIRONMENT = {"TOKEN_ENCODING": "approximate"} # ไม่ดาวน์โหลดไฟล์ BPE ของ tiktoken
+UNTHROTTLED_LIMITS = {
+    "YOUTUBE_REQUESTS_PER_SECOND": "1e9", "YOUTUBE_REQUEST_BURST": "1e9", "YOUTUBE_MAX_CONCURRENCY": "1000",
+    "YOUTUBE_DAILY_QUOTA": "1e12",
+    "OPENAI_REQUESTS_PER_MINUTE": "1e9", "OPENAI_REQUEST_BURST": "1e9", "OPENAI_TOKENS_PER_MINUTE": "1e12",
+    "OPENAI_MAX_CONCURRENCY": "1000",
+    "HF_REQUESTS_PER_SECOND": "1e9", "HF_REQUEST_BURST": "1e9", "HF_MAX_CONCURRENCY": "1000",
+}
+
+
+def bench_environment(throttled: bool = False) -> dict:
+    """
+    คืนค่า environment ของ benchmark: ใช้การประมาณจำนวนโทเค็นแทน tiktoken เสมอ
+    และยกเพดานของตัวจำกัดอัตราทุก upstream ยกเว้นเมื่อต้องการวัดพร้อมตัวจำกัดจริง (throttled=True)
+    ค่าที่ตั้งไว้แล้วใน environment มีผลเหนือกว่าค่าเหล่านี้
+    """
+    env = {**OFFLINE_ENVIRONMENT, **({} if throttled else UNTHROTTLED_LIMITS)}
+    return {**env, **{name: os.environ[name] for name in env if name in os.environ}}
+
+
+# --- Microbenchmarks ---
+
+class StubTranslationClient:
+    """OpenAI client จำลองในหน่วยความจำ (ตอบทันที) ใช้วัดเวลาของการคัดกรองภาษาและ cache แยกจาก network"""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, messages, **kwargs):
+        from fake_upstreams import NUMBERED_LINE_PATTERN
+
+        self.calls += 1
+        prompt = messages[-1]["content"]
+        numbered = NUMBERED_LINE_PATTERN.findall(prompt)
+        content = ("\n".join(f"[{number}] (แปล) {text}" for number, text in numbered) if numbered
+                   else "(แปล) " + prompt.rsplit("\n\n", 1)[-1])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def bench_micro(args) -> None:
+    """วัดเวลาของฟังก์ชันที่อยู่บนเส้นทางหลักของ /analyze ทีละฟังก์ชัน (ไม่ต้องใช้ network)"""
+    os.environ.update(bench_environment()) # ไม่ให้ openai_limiter หน่วงการแปลที่ตอบจาก client จำลองทันที
+    os.environ.setdefault("TRANSLATION_CACHE_PATH", "") # ไม่ให้ผลการวัดไปปนกับ cache บนดิสก์
+    import clean_text
+    import translate_text
+    from fetch_channel_data import parse_duration
+    from summarizer import truncate_text_by_tokens
+
+    texts = make_comment_corpus(args.comments)
+    durations = ["PT45S", "PT1M", "PT10M30S", "PT1H2M3S", "P1DT2H", "PT0S"] * (args.comments // 6 + 1)
+    long_text = " ".join(texts)
+
+    print(f"Microbenchmarks, {len(texts)} comments per batch")
+    report("clean_text (per comment)", time_call(lambda: [clean_text.clean_text(text) for text in texts],
+                                                args.repeat), len(texts))
+    report("clean_batch", time_call(lambda: clean_text.clean_batch(texts, process_threshold=0), args.repeat),
+           len(texts))
+    report("parse_duration", time_call(lambda: [parse_duration(duration) for duration in durations],
+                                       args.repeat), len(durations))
+    report("truncate_text_by_tokens (500 tokens)",
+           time_call(lambda: truncate_text_by_tokens(long_text, 500), args.repeat), 1) # ApproximateEncoding (ไม่ใช้ network)
+
+    from comment_batch import CommentBatch, LABEL_NAMES
+    from pipeline import new_tally, tally_batch
+
+    batch = CommentBatch([f"comment {index}" for index in range(args.comments * 10)])
+    batch.labels[:] = random.Random(0).choices(range(len(LABEL_NAMES)), k=len(batch))
+    report(f"tally_batch ({len(batch)} rows, bincount)", time_call(lambda: tally_batch(batch, new_tally()), args.repeat),
+           len(batch))
+    report("CommentBatch.display_rows", time_call(batch.display_rows, args.repeat), len(batch))
+
+    thai_texts = [text for text in texts if translate_text.needs_translation_batch([text]) == [False]]
+    client = StubTranslationClient()
+
+    def run_translation(batch):
+        translate_text.translation_cache.clear()
+        return asyncio.run(translate_text.translate_to_thai(batch, client))
+
+    report("translate_to_thai, Thai only (gated)", time_call(lambda: run_translation(thai_texts), args.repeat),
+           len(thai_texts))
+    report("translate_to_thai, mixed, cold cache", time_call(lambda: run_translation(texts), args.repeat), len(texts))
+    asyncio.run(translate_text.translate_to_thai(texts, client))
+    report("translate_to_thai, mixed, warm cache",
+           time_call(lambda: asyncio.run(translate_text.translate_to_thai(texts, client)), args.repeat), len(texts))
+    print(f"stub OpenAI calls: {client.calls}")
+
+
+# --- End-to-end load test ---
+
+def percentile_report(name: str, latencies: list, elapsed: float, statuses: dict) -> None:
+    """พิมพ์ p50/p95/p99 (มิลลิวินาที), throughput และจำนวน response แยกตาม status code"""
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+    print(f"{name:<28} p50 {p50:9.1f} ms  p95 {p95:9.1f} ms  p99 {p99:9.1f} ms  "
+          f"{len(latencies) / elapsed if elapsed else 0.0:8.2f} req/s  status {dict(sorted(statuses.items()))}")
+
+
+def load_requests(args, channel_id: str) -> list:
+    """สร้างรายการ request (method, path, data/params) ตาม endpoint ที่เลือก"""
+    requests = []
+    for index in range(args.requests):
+        video_id = f"v{index % args.distinct_videos:010d}"
+        if args.endpoint == "analyze":
+            requests.append(("POST", "/analyze", {"data": {
+                "input_url": f"https://www.youtube.com/watch?v={video_id}", "analysis_mode": "video"}}))
+        elif args.endpoint == "channel_videos":
+            requests.append(("POST", "/get_channel_videos", {"data": {
+                "channel_url": f"https://www.youtube.com/@benchmark{index % args.distinct_videos}"}}))
+        else:
+            requests.append(("GET", "/load_more_channel_videos", {"params": {
+                "channel_id": channel_id, "page_token": str(5 * (index % 10 + 1))}}))
+    return requests
+
+
+def bench_load(args) -> None:
+    """
+    ยิง request พร้อมกันไปยังแอปทั้งระบบ (ผ่าน ASGI ภายใน process) โดยให้ YouTube, OpenAI และ Hugging Face
+    เป็น server จำลองจาก fake_upstreams.py แล้วรายงาน p50/p95/p99 และ throughput
+    ตัวจำกัดอัตรา (rate_limiter.py) ถูกยกเพดานไว้ ใช้ --throttled เพื่อวัดพร้อมค่าที่ตั้งไว้จริง
+    """
+    import httpx
+    from fake_upstreams import FakeUpstreamServer, upstream_environment, upstreams_from_args
+
+    server = FakeUpstreamServer(upstreams_from_args(args))
+    base_url = server.start()
+    os.environ.update(upstream_environment(base_url))
+    os.environ.update(bench_environment(args.throttled))
+    for name in ("COMMENT_STORE_PATH", "TRANSLATION_CACHE_PATH", "SUMMARY_CACHE_PATH", "METADATA_CACHE_PATH",
+                 "JOB_RESULTS_PATH"):
+        os.environ.setdefault(name, "") # วัดแบบ cache ว่างในหน่วยความจำ ไม่แตะไฟล์ cache ของเครื่อง
+    import main as app_module # ต้อง import หลังตั้งค่า environment เพราะค่าต่างๆ ถูกอ่านตอน import
+    from youtube_client import close_youtube_client
+
+    channel_id = "UC" + "b" * 22
+    requests = load_requests(args, channel_id)
+
+    async def run() -> tuple:
+        latencies, statuses = [], {}
+        queue = asyncio.Queue()
+        for request in requests:
+            queue.put_nowait(request)
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=args.timeout) as client:
+            async def worker():
+                while not queue.empty():
+                    method, path, kwargs = queue.get_nowait()
+                    start = time.perf_counter()
+                    try:
+                        response = await client.request(method, path, **kwargs)
+                        status = response.status_code
+                    except Exception as e:
+                        status = type(e).__name__
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - start
+        await close_youtube_client()
+        return latencies, statuses, elapsed
+
+    try:
+        latencies, statuses, elapsed = asyncio.run(run())
+    finally:
+        server.stop()
+    print(f"Load test: {len(requests)} requests to {args.endpoint}, concurrency {args.concurrency}, "
+          f"{args.distinct_videos} distinct videos/channels")
+    percentile_report(args.endpoint, latencies, elapsed, statuses)
+    print(f"upstream requests: {dict(sorted(server.upstreams.requests.items()))}")
+
+
+# --- Cold start ---
+
+def startup_probe(warm: bool) -> None:
+    """
+    (รันใน process ใหม่จาก bench_startup) วัดเวลา import main, เวลา warm-up และเวลาของ /analyze ครั้งแรกและครั้งที่สอง
+    แล้วพิมพ์ผลเป็น JSON หนึ่งบรรทัด
+    """
+    import json
+
+    timings = {}
+    start = time.perf_counter()
+    import main as app_module
+    timings["import_main"] = time.perf_counter() - start
+
+    import httpx
+    from startup import warm_up
+    from youtube_client import close_youtube_client
+
+    async def run():
+        if warm:
+            start = time.perf_counter()
+            await warm_up({"openai_client": app_module.get_openai_client})
+            timings["warm_up"] = time.perf_counter() - start
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=300) as client:
+            for name, video_id in (("first_request", "v0000000001"), ("second_request", "v0000000002")):
+                start = time.perf_counter()
+                response = await client.post("/analyze", data={
+                    "input_url": f"https://www.youtube.com/watch?v={video_id}", "analysis_mode": "video"})
+                timings[name] = time.perf_counter() - start
+                timings[f"{name}_status"] = response.status_code
+        await close_youtube_client()
+
+    asyncio.run(run())
+    print(json.dumps(timings))
+
+
+def bench_startup(args) -> None:
+    """
+    เปรียบเทียบ cold start ของ replica ใหม่ ระหว่างไม่มี warm-up (งานครั้งแรกไปตกที่ request แรก)
+    กับ warm-up ใน lifespan โดยรันแต่ละรอบใน process ใหม่ และใช้ server จำลองจาก fake_upstreams.py
+    """
+    import json
+    from fake_upstreams import FakeUpstreamServer, upstream_environment, upstreams_from_args
+
+    server = FakeUpstreamServer(upstreams_from_args(args))
+    env = {**os.environ, **upstream_environment(server.start()), **bench_environment(), "LOG_LEVEL": "WARNING"}
+    for name in ("COMMENT_STORE_PATH", "TRANSLATION_CACHE_PATH", "SUMMARY_CACHE_PATH", "METADATA_CACHE_PATH",
+                 "JOB_RESULTS_PATH"):
+        env.setdefault(name, "")
+
+    results = {}
+    try:
+        for label, warm in (("no warm-up", False), ("lifespan warm-up", True)):
+            runs = []
+            for _ in range(args.repeat):
+                completed = subprocess.run(
+                    [sys.executable, "-c", f"import benchmark; benchmark.startup_probe({warm})"],
+                    cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True,
+                )
+                if completed.returncode != 0:
+                    print(completed.stderr)
+                    sys.exit(1)
+                runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+            results[label] = runs
+    finally:
+        server.stop()
+
+    print(f"Cold start, median of {args.repeat} fresh processes (seconds)")
+    print(f"{'':<20} {'import':>8} {'warm-up':>8} {'1st req':>8} {'2nd req':>8} {'to 1st response':>16}")
+    for label, runs in results.items():
+        def median(key):
+            return statistics.median(run.get(key, 0.0) for run in runs)
+        to_first = statistics.median(run["import_main"] + run.get("warm_up", 0.0) + run["first_request"] for run in runs)
+        print(f"{label:<20} {median('import_main'):8.3f} {median('warm_up'):8.3f} {median('first_request'):8.3f}"
+              f" {median('second_request'):8.3f} {to_first:16.3f}")
+        statuses = sorted({run[key] for run in runs for key in ("first_request_status", "second_request_status")})
+        if statuses != [200]:
+            print(f"{'':<20} (HTTP status: {statuses} — ดู log ของ process เพื่อหาสาเหตุ)")
+
+
+def main():
+    from fake_upstreams import add_upstream_arguments
+
+    parser = argparse.ArgumentParser(description="Benchmarks for the YouTube sentiment pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    language = subparsers.add_parser("language", help="language detection latency per batch")
+    language.add_argument("--comments", type=int, default=1000)
+    language.add_argument("--repeat", type=int, default=5)
+    language.set_defaults(func=bench_language)
+
+    sentiment = subparsers.add_parser("sentiment", help="comments/second of local vs. remote sentiment backends")
+    sentiment.add_argument("--comments", type=int, default=500)
+    sentiment.add_argument("--repeat", type=int, default=3)
+    sentiment.add_argument("--model-path", default="", help="local checkpoint (default: tiny random checkpoint)")
+    sentiment.add_argument("--threads", type=int, default=None)
+    sentiment.add_argument("--batch-size", type=int, default=32)
+    sentiment.add_argument("--remote-url", default="", help="override the Inference API URL (e.g. a local stand-in)")
+    sentiment.set_defaults(func=bench_sentiment)
+
+    clean = subparsers.add_parser("clean", help="comments/second of each clean_text mode")
+    clean.add_argument("--comments", type=int, default=20000)
+    clean.add_argument("--repeat", type=int, default=3)
+    clean.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    clean.set_defaults(func=bench_clean)
+
+    listing = subparsers.add_parser("listing", help="quota and latency of channel video listing paths")
+    listing.add_argument("--channel", required=True, help="channel ID (UC...)")
+    listing.add_argument("--pages", type=int, default=3)
+    listing.set_defaults(func=bench_listing)
+
+    micro = subparsers.add_parser("micro", help="hot-path functions: cleaning, durations, truncation, translation gating")
+    micro.add_argument("--comments", type=int, default=1000)
+    micro.add_argument("--repeat", type=int, default=10)
+    micro.set_defaults(func=bench_micro)
+
+    load = subparsers.add_parser("load", help="end-to-end latency percentiles against local fake upstreams")
+    load.add_argument("--endpoint", choices=("analyze", "channel_videos", "load_more"), default="analyze")
+    load.add_argument("--requests", type=int, default=100)
+    load.add_argument("--concurrency", type=int, default=10)
+    load.add_argument("--distinct-videos", type=int, default=1000, help="distinct video IDs / channel handles to cycle")
+    load.add_argument("--timeout", type=float, default=300.0)
+    load.add_argument("--throttled", action="store_true", help="keep the configured upstream rate limits")
+    add_upstream_arguments(load)
+    load.set_defaults(func=bench_load)
+
+    startup = subparsers.add_parser("startup", help="import time and first-request latency with/without warm-up")
+    startup.add_argument("--repeat", type=int, default=3)
+    add_upstream_arguments(startup)
+    startup.set_defaults(func=bench_startup, youtube_latency="fixed:0", openai_latency="fixed:0", hf_latency="fixed:0")
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
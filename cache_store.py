@@ -0,0 +1,306 @@
+import logging
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ค่าที่ใช้แทน "ไม่พบใน cache" (เพราะค่าที่เก็บอาจเป็น None ได้)
+MISSING = object()
+
+# จำนวน key สูงสุดต่อคำสั่ง SELECT ... IN (...) (ต่ำกว่าขีดจำกัดจำนวนพารามิเตอร์ของ SQLite)
+_SQLITE_MAX_KEYS_PER_QUERY = 500
+
+
+def normalize_cache_text(text: str) -> str:
+    """
+    ทำข้อความให้อยู่ในรูปแบบมาตรฐานก่อนนำไปสร้าง key
+    (Unicode NFC + ตัดช่องว่างหัวท้าย + รวมช่องว่างซ้ำเหลือช่องเดียว)
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def make_cache_key(*parts: str) -> str:
+    """สร้าง key แบบ content-addressed (SHA-256) จากหลายส่วน เช่น ข้อความ + โมเดล + เวอร์ชันของ prompt"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x1f")  # ตัวคั่นระหว่างส่วน ป้องกัน key ชนกันจากการต่อสตริง
+    return digest.hexdigest()
+
+
+class TieredCache:
+    """
+    Cache สองชั้นสำหรับค่าที่แปลงเป็น JSON ได้
+    - ชั้นแรก: LRU ในหน่วยความจำของ process (จำกัดจำนวนรายการ)
+    - ชั้นที่สอง: SQLite บนดิสก์ (โหมด WAL) ใช้ร่วมกันได้ระหว่าง worker และอยู่รอดหลัง restart
+    ทั้งสองชั้นรองรับ TTL และนับจำนวน hit/miss สำหรับใช้ปรับขนาด cache
+    โค้ด async ควรใช้ aget/aget_many/aset/aset_many ซึ่งอ่าน/เขียน SQLite ใน thread แยก ไม่บล็อก event loop
+    """
+
+    def __init__(self, name: str, max_entries: int = 10_000, ttl_seconds: Optional[float] = None,
+                 db_path: Optional[str] = None, max_disk_entries: int = 200_000):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.max_disk_entries = max_disk_entries
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()  # ป้องกัน LRU ในหน่วยความจำและตัวนับ
+        self._db_lock = threading.Lock()  # ใช้ connection ของ SQLite ทีละ thread (ไม่บล็อกการอ่านจากหน่วยความจำ)
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_writes = 0
+        self._counters = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "evictions": 0, "expired": 0}
+
+        if db_path:
+            self._open_db(db_path)
+
+    # --- SQLite tier ---
+
+    def _open_db(self, db_path: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+            self._db = db
+        except sqlite3.Error as e:
+            # ถ้าเปิดไฟล์ไม่ได้ ให้ทำงานต่อด้วย cache ในหน่วยความจำอย่างเดียว
+            logger.warning("เปิด cache '%s' บนดิสก์ไม่สำเร็จ (%s): %s", self.name, db_path, e)
+            self._db = None
+
+    def _transaction(self, statements: List[Tuple[str, list]]) -> None:
+        """รันหลาย executemany ใน transaction เดียว (commit ครั้งเดียวแทนหนึ่งครั้งต่อแถว)"""
+        self._db.execute("BEGIN")
+        try:
+            for sql, rows in statements:
+                if rows:
+                    self._db.executemany(sql, rows)
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _disk_get_many(self, keys: List[str], now: float) -> Tuple[Dict[str, tuple], int]:
+        """
+        คืนค่า ({key: (value, expires_at)} ของรายการที่พบและยังไม่หมดอายุ, จำนวนรายการที่หมดอายุ)
+        อ่านด้วย SELECT ... IN ทีละไม่เกิน _SQLITE_MAX_KEYS_PER_QUERY key แล้วลบรายการที่หมดอายุ
+        และอัปเดต accessed_at ของรายการที่พบใน transaction เดียว
+        """
+        rows = []
+        for start in range(0, len(keys), _SQLITE_MAX_KEYS_PER_QUERY):
+            chunk = keys[start:start + _SQLITE_MAX_KEYS_PER_QUERY]
+            rows.extend(self._db.execute(
+                f"SELECT key, value, expires_at FROM cache WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+
+        found, expired = {}, []
+        for key, value, expires_at in rows:
+            if expires_at is not None and expires_at <= now:
+                expired.append((key,))
+            else:
+                found[key] = (json.loads(value), expires_at)
+        if found or expired:
+            self._transaction([
+                ("DELETE FROM cache WHERE key = ?", expired),
+                ("UPDATE cache SET accessed_at = ? WHERE key = ?", [(now, key) for key in found]),
+            ])
+        return found, len(expired)
+
+    def _disk_set_many(self, items: Dict[str, Any], expires_at: Optional[float], now: float) -> None:
+        self._transaction([(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            [(key, json.dumps(value, ensure_ascii=False), expires_at, now) for key, value in items.items()],
+        )])
+        self._disk_writes += len(items)
+        # ตรวจขนาดเป็นระยะ (ไม่ต้องนับทุกครั้งที่เขียน) แล้วลบรายการที่ถูกใช้ล่าสุดนานที่สุดออก
+        if self._disk_writes >= max(1, self.max_disk_entries // 20):
+            self._disk_writes = 0
+            self._db.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            (count,) = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()
+            overflow = count - self.max_disk_entries
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (overflow,),
+                )
+                self._counters["evictions"] += overflow
+
+    # --- Memory tier ---
+
+    def _memory_put(self, key: str, value: Any, expires_at: Optional[float]) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    # --- Lookup steps (แยกส่วนหน่วยความจำออกจากส่วนดิสก์ เพื่อให้ส่วนดิสก์รันใน thread แยกได้) ---
+
+    def _memory_get_many(self, keys: Iterable[str], now: float) -> Tuple[Dict[str, Any], List[str]]:
+        """คืนค่า (รายการที่พบในหน่วยความจำ, key ที่ยังไม่พบ)"""
+        found, missing = {}, []
+        with self._lock:
+            for key in dict.fromkeys(keys):  # key ซ้ำกันให้ค้นหาเพียงครั้งเดียว
+                entry = self._memory.get(key)
+                if entry is not None:
+                    expires_at, value = entry
+                    if expires_at is None or expires_at > now:
+                        self._memory.move_to_end(key)
+                        self._counters["hits"] += 1
+                        self._counters["memory_hits"] += 1
+                        found[key] = value
+                        continue
+                    del self._memory[key]
+                    self._counters["expired"] += 1
+                missing.append(key)
+        return found, missing
+
+    def _disk_lookup(self, keys: List[str], now: float) -> Tuple[Dict[str, tuple], int]:
+        """อ่าน key ที่ไม่พบในหน่วยความจำจาก SQLite (blocking)"""
+        if not keys or self._db is None:
+            return {}, 0
+        with self._db_lock:
+            try:
+                return self._disk_get_many(keys, now)
+            except sqlite3.Error as e:
+                logger.warning("อ่าน cache '%s' จากดิสก์ไม่สำเร็จ: %s", self.name, e)
+                return {}, 0
+
+    def _finish_lookup(self, found: Dict[str, Any], missing: List[str],
+                       disk_entries: Dict[str, tuple], disk_expired: int) -> Dict[str, Any]:
+        """เลื่อนรายการที่พบบนดิสก์ขึ้นมาไว้ในหน่วยความจำ แล้วนับ hit/miss"""
+        with self._lock:
+            self._counters["expired"] += disk_expired
+            for key in missing:
+                entry = disk_entries.get(key)
+                if entry is None:
+                    self._counters["misses"] += 1
+                    continue
+                value, expires_at = entry
+                self._memory_put(key, value, expires_at)
+                self._counters["hits"] += 1
+                self._counters["disk_hits"] += 1
+                found[key] = value
+        return found
+
+    def _expires_at(self, ttl_seconds: Optional[float], now: float) -> Optional[float]:
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        return now + ttl if ttl else None
+
+    def _memory_set_many(self, items: Dict[str, Any], expires_at: Optional[float]) -> None:
+        with self._lock:
+            for key, value in items.items():
+                self._memory_put(key, value, expires_at)
+
+    def _disk_write(self, items: Dict[str, Any], expires_at: Optional[float], now: float) -> None:
+        """เขียนลง SQLite (blocking)"""
+        if self._db is None:
+            return
+        with self._db_lock:
+            try:
+                self._disk_set_many(items, expires_at, now)
+            except sqlite3.Error as e:
+                logger.warning("เขียน cache '%s' ลงดิสก์ไม่สำเร็จ: %s", self.name, e)
+
+    # --- Public API ---
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """คืนค่าที่เก็บไว้ของ key หรือ default ถ้าไม่พบหรือหมดอายุแล้ว"""
+        value = self.get_many([key]).get(key, MISSING)
+        return default if value is MISSING else value
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """ค้นหาหลาย key พร้อมกัน คืนค่า dict เฉพาะ key ที่พบ"""
+        now = time.time()
+        found, missing = self._memory_get_many(keys, now)
+        return self._finish_lookup(found, missing, *self._disk_lookup(missing, now))
+
+    async def aget(self, key: str, default: Any = None) -> Any:
+        """เหมือน get แต่อ่านดิสก์ใน thread แยก"""
+        value = (await self.aget_many([key])).get(key, MISSING)
+        return default if value is MISSING else value
+
+    async def aget_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """เหมือน get_many แต่อ่านดิสก์ใน thread แยก (รายการที่อยู่ในหน่วยความจำครบแล้วไม่ต้องสลับ thread)"""
+        now = time.time()
+        found, missing = self._memory_get_many(keys, now)
+        disk_result = ({}, 0)
+        if missing and self._db is not None:
+            disk_result = await asyncio.to_thread(self._disk_lookup, missing, now)
+        return self._finish_lookup(found, missing, *disk_result)
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """เก็บค่าลง cache (ttl_seconds ใช้แทนค่า TTL เริ่มต้นของ cache ได้)"""
+        self.set_many({key: value}, ttl_seconds=ttl_seconds)
+
+    def set_many(self, items: Dict[str, Any], ttl_seconds: Optional[float] = None) -> None:
+        """เก็บหลายค่าลง cache ในครั้งเดียว"""
+        if not items:
+            return
+        now = time.time()
+        expires_at = self._expires_at(ttl_seconds, now)
+        self._memory_set_many(items, expires_at)
+        self._disk_write(items, expires_at, now)
+
+    async def aset(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """เหมือน set แต่เขียนดิสก์ใน thread แยก"""
+        await self.aset_many({key: value}, ttl_seconds=ttl_seconds)
+
+    async def aset_many(self, items: Dict[str, Any], ttl_seconds: Optional[float] = None) -> None:
+        """เหมือน set_many แต่เขียนดิสก์ใน thread แยก (ค่าใหม่อ่านได้จากหน่วยความจำทันที)"""
+        if not items:
+            return
+        now = time.time()
+        expires_at = self._expires_at(ttl_seconds, now)
+        self._memory_set_many(items, expires_at)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_write, items, expires_at, now)
+
+    def delete(self, key: str) -> None:
+        """ลบ key ออกจากทั้งสองชั้น"""
+        with self._lock:
+            self._memory.pop(key, None)
+        if self._db is not None:
+            with self._db_lock:
+                try:
+                    self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                except sqlite3.Error as e:
+                    logger.warning("ลบ cache '%s' บนดิสก์ไม่สำเร็จ: %s", self.name, e)
+
+    def clear(self) -> None:
+        """ล้าง cache ทั้งหมด (ทั้งในหน่วยความจำและบนดิสก์)"""
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        """คืนค่าสถิติของ cache เช่น จำนวน hit/miss และอัตรา hit"""
+        with self._lock:
+            counters = dict(self._counters)
+            memory_entries = len(self._memory)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "name": self.name,
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "memory_entries": memory_entries,
+            "max_entries": self.max_entries,
+            "persistent": self._db is not None,
+        }
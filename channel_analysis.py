@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import logging
+import os
+import asyncio
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional
+
+from fetch_channel_data import fetch_channel_videos, fetch_channel_videos_via_search, get_uploads_playlist_id
+from fetch_comments import iter_comment_pages
+from pipeline import run_comment_pipeline, with_pending_counts
+from comment_store import comment_store
+from rate_limiter import YOUTUBE_QUOTA_COSTS
+
+if TYPE_CHECKING:
+    import openai  # ใช้เฉพาะใน type hint (openai ถูก import ตอนสร้าง client ดู main.get_openai_client)
+
+logger = logging.getLogger(__name__)
+
+# --- การตั้งค่าการวิเคราะห์ทั้งช่อง ---
+CHANNEL_DEFAULT_MAX_VIDEOS = int(os.getenv("CHANNEL_DEFAULT_MAX_VIDEOS", "10"))
+CHANNEL_MAX_VIDEOS_LIMIT = 50 # จำนวนวิดีโอสูงสุดที่รับได้ต่อหนึ่งงาน
+CHANNEL_COMMENTS_PER_VIDEO = int(os.getenv("CHANNEL_COMMENTS_PER_VIDEO", "200"))
+# จำนวนวิดีโอที่วิเคราะห์พร้อมกันได้สูงสุด (รวมทุกงานใน process)
+MAX_CONCURRENT_CHANNEL_VIDEOS = int(os.getenv("MAX_CONCURRENT_CHANNEL_VIDEOS", "3"))
+# งบ quota ของ YouTube Data API ต่อหนึ่งงาน (หน่วย)
+CHANNEL_QUOTA_BUDGET = int(os.getenv("CHANNEL_QUOTA_BUDGET", "2000"))
+
+# ค่า quota โดยประมาณของแต่ละ request
+VIDEO_LISTING_PAGE_COST = 2 # playlistItems.list (1) + videos.list (1)
+SEARCH_LISTING_PAGE_COST = YOUTUBE_QUOTA_COSTS["search"] + 1 # search.list (100) + videos.list (1) เมื่อไม่มี uploads playlist
+COMMENT_PAGE_COST = 1 # commentThreads.list
+
+_video_slots = asyncio.Semaphore(MAX_CONCURRENT_CHANNEL_VIDEOS)
+
+
+class QuotaBudget:
+    """นับ quota ของ YouTube ที่ใช้ไปในงานหนึ่ง และปฏิเสธ request ที่จะทำให้เกินงบ"""
+
+    def __init__(self, units: int):
+        self.units = units
+        self.spent = 0
+        self.exhausted = False
+
+    def try_spend(self, cost: int) -> bool:
+        if self.spent + cost > self.units:
+            self.exhausted = True
+            return False
+        self.spent += cost
+        return True
+
+    def refund(self, cost: int) -> None:
+        self.spent -= cost
+
+
+async def select_channel_videos(channel_id: str, budget: QuotaBudget, max_videos: int = CHANNEL_DEFAULT_MAX_VIDEOS,
+                                published_after: Optional[str] = None,
+                                published_before: Optional[str] = None) -> List[dict]:
+    """
+    เลือกวิดีโอล่าสุดของช่องไม่เกิน max_videos รายการ
+    กรองตามช่วงวันที่ได้ (published_after/published_before รูปแบบ YYYY-MM-DD รวมวันที่ระบุ)
+    """
+    # คิด quota ตาม endpoint ที่ใช้จริง: ช่องที่หา uploads playlist ไม่พบต้องอ่านด้วย search.list ซึ่งแพงกว่ามาก
+    if await get_uploads_playlist_id(channel_id):
+        list_videos, page_cost = fetch_channel_videos, VIDEO_LISTING_PAGE_COST
+    else:
+        list_videos, page_cost = fetch_channel_videos_via_search, SEARCH_LISTING_PAGE_COST
+
+    selected = []
+    page_token = None
+    while len(selected) < max_videos and budget.try_spend(page_cost):
+        videos, page_token = await list_videos(channel_id, max_results_per_page=50, page_token=page_token)
+        for video in videos:
+            published_date = (video.get("published_at") or "")[:10]
+            if published_before and published_date > published_before:
+                continue
+            if published_after and published_date < published_after:
+                return selected # วิดีโอเรียงจากใหม่ไปเก่า ที่เหลือจึงเก่ากว่าช่วงที่ต้องการทั้งหมด
+            selected.append(video)
+            if len(selected) >= max_videos:
+                break
+        if not page_token:
+            break
+    return selected
+
+
+async def _budgeted_pages(pages: AsyncIterator[List[dict]], budget: QuotaBudget) -> AsyncIterator[List[dict]]:
+    """ส่งต่อหน้าคอมเมนต์จนกว่างบ quota จะหมด"""
+    try:
+        while budget.try_spend(COMMENT_PAGE_COST):
+            try:
+                page = await pages.__anext__()
+            except StopAsyncIteration:
+                budget.refund(COMMENT_PAGE_COST)
+                return
+            yield page
+    finally:
+        await pages.aclose()
+
+
+async def analyze_channel_video(video: dict, openai_client: openai.AsyncOpenAI, budget: QuotaBudget,
+                                max_comments: int = CHANNEL_COMMENTS_PER_VIDEO) -> Dict:
+    """วิเคราะห์คอมเมนต์ของวิดีโอหนึ่งรายการ แล้วคืนค่ายอดรวมของวิดีโอนั้น"""
+    video_id = video["video_id"]
+    result = {key: video.get(key) for key in ("video_id", "title", "thumbnail", "video_url", "published_at")}
+
+    async with _video_slots:
+        try:
+            if comment_store is not None:
+                # ใช้ผลที่เก็บไว้ และวิเคราะห์เฉพาะคอมเมนต์ที่เพิ่มขึ้น (เหมือนโหมดวิดีโอ)
+                pages = iter_comment_pages(video_id, max_comments=max_comments, order="time",
+                                           stop_at_ids=await comment_store.aknown_comment_ids(video_id))
+                save_page = lambda page: comment_store.asave_page(video_id, page)
+            else:
+                pages = iter_comment_pages(video_id, max_comments=max_comments)
+                save_page = None
+            pipeline_result = await run_comment_pipeline(_budgeted_pages(pages, budget), openai_client,
+                                                         on_page=save_page)
+        except Exception as e:
+            logger.warning("วิเคราะห์วิดีโอ %s ในโหมดช่องไม่สำเร็จ: %s", video_id, e)
+            result["error"] = str(e)
+            return result
+
+    totals = pipeline_result
+    if save_page is not None:
+        totals = with_pending_counts(await comment_store.aget_video_totals(video_id), pipeline_result)
+    for key in ("positive_count", "negative_count", "neutral_count", "total_comments",
+                "total_comments_analyzed", "total_comments_skipped_by_length"):
+        result[key] = totals.get(key, 0)
+    result["quota_exhausted"] = budget.exhausted
+    return result
+
+
+def _channel_totals(video_results: List[dict], videos_total: int, budget: QuotaBudget) -> Dict:
+    """รวมยอดของทุกวิดีโอที่วิเคราะห์เสร็จแล้วเป็นยอดระดับช่อง"""
+    totals = {"positive_count": 0, "negative_count": 0, "neutral_count": 0,
+              "total_comments": 0, "total_comments_analyzed": 0}
+    for video_result in video_results:
+        for key in totals:
+            totals[key] += video_result.get(key) or 0
+    analyzed = totals["total_comments_analyzed"]
+    totals["positive_ratio"] = round(totals["positive_count"] / analyzed, 4) if analyzed else 0.0
+    totals["negative_ratio"] = round(totals["negative_count"] / analyzed, 4) if analyzed else 0.0
+    totals["videos_done"] = len(video_results)
+    totals["videos_failed"] = sum(1 for video_result in video_results if "error" in video_result)
+    totals["videos_total"] = videos_total
+    totals["quota_spent"] = budget.spent
+    totals["quota_budget"] = budget.units
+    return totals
+
+
+async def stream_channel_analysis(
+    channel_id: str,
+    openai_client: openai.AsyncOpenAI,
+    max_videos: int = CHANNEL_DEFAULT_MAX_VIDEOS,
+    published_after: Optional[str] = None,
+    published_before: Optional[str] = None,
+    max_comments_per_video: int = CHANNEL_COMMENTS_PER_VIDEO,
+    quota_budget: int = CHANNEL_QUOTA_BUDGET,
+) -> AsyncIterator[Dict]:
+    """
+    วิเคราะห์ Sentiment ของวิดีโอล่าสุดหลายรายการของช่องพร้อมกัน (จำกัดด้วย MAX_CONCURRENT_CHANNEL_VIDEOS
+    และงบ quota) แล้วคืนค่า event ทีละรายการเมื่อแต่ละวิดีโอเสร็จ:
+    - {"type": "videos", "videos": [...]} รายการวิดีโอที่เลือก
+    - {"type": "video", "video": {...}, "channel": {...}} ผลของวิดีโอหนึ่งรายการ + ยอดรวมของช่องถึงตอนนี้
+    - {"type": "done", "channel": {...}} ยอดรวมสุดท้ายของช่อง
+    """
+    budget = QuotaBudget(quota_budget)
+    max_videos = max(1, min(max_videos, CHANNEL_MAX_VIDEOS_LIMIT))
+    videos = await select_channel_videos(channel_id, budget, max_videos, published_after, published_before)
+    yield {"type": "videos", "videos": videos}
+
+    tasks = [
+        asyncio.create_task(analyze_channel_video(video, openai_client, budget, max_comments_per_video))
+        for video in videos
+    ]
+    video_results = []
+    try:
+        for finished in asyncio.as_completed(tasks):
+            video_result = await finished
+            video_results.append(video_result)
+            yield {"type": "video", "video": video_result,
+                   "channel": _channel_totals(video_results, len(videos), budget)}
+    finally:
+        # ยกเลิกวิดีโอที่ยังค้างอยู่ (เช่น เมื่อผู้ใช้ปิดการเชื่อมต่อกลางทาง)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    yield {"type": "done", "channel": _channel_totals(video_results, len(videos), budget)}
@@ -1,5 +1,52 @@
+import os
 import re  # ใช้สำหรับ regular expressions เช่น การลบ URL, อักขระพิเศษ
-from pythainlp.util import normalize  # ใช้ normalize ตัวอักษรภาษาไทย เช่น การจัดรูปแบบซ้ำซ้อน
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+# --- Pattern ที่ compile ไว้ล่วงหน้า (ไม่ต้องค้นหาจาก cache ของ re ทุกครั้งที่เรียก) ---
+URL_PATTERN = re.compile(r"http\S+|www\S+|https\S+")
+SYMBOL_PATTERN = re.compile(r"[^\w\sก-๙]")
+# ลบ URL และอักขระพิเศษในรอบเดียว (URL เริ่มด้วยตัวอักษรเสมอ จึงไม่ทับกับอักขระพิเศษที่อยู่ก่อนหน้า)
+URL_OR_SYMBOL_PATTERN = re.compile(r"http\S+|www\S+|https\S+|[^\w\sก-๙]")
+# ข้อความที่ไม่มีอักษรไทยหรือ zero-width space ไม่ถูก normalize เปลี่ยนแปลง (นอกจากช่องว่างซึ่งถูกรวมภายหลังอยู่แล้ว)
+NEEDS_THAI_NORMALIZE_PATTERN = re.compile("[\u0e00-\u0e7f\u200b\u200c]")
+
+# --- การตั้งค่าการทำความสะอาดแบบกลุ่ม ---
+CLEAN_TEXT_MODE = os.getenv("CLEAN_TEXT_MODE", "regex") # "regex" หรือ "translate" (วัดความเร็วด้วย benchmark.py clean)
+# ใช้ process pool เมื่อจำนวนข้อความมากกว่าค่านี้ (สำหรับงาน offline ขนาดใหญ่; 0 = ไม่ใช้)
+CLEAN_TEXT_PROCESS_THRESHOLD = int(os.getenv("CLEAN_TEXT_PROCESS_THRESHOLD", "20000"))
+CLEAN_TEXT_PROCESS_WORKERS = int(os.getenv("CLEAN_TEXT_PROCESS_WORKERS", "0")) or None # None = จำนวน CPU
+CLEAN_TEXT_CHUNK_SIZE = 2000 # จำนวนข้อความต่อหนึ่งงานที่ส่งให้ process
+
+
+class _SymbolStripTable(dict):
+    """
+    ตารางสำหรับ str.translate ที่ลบอักขระพิเศษ (ตรงกับ SYMBOL_PATTERN) ในรอบเดียว
+    คำนวณผลของแต่ละ code point เมื่อพบครั้งแรกแล้วเก็บไว้ (อักขระที่ต้องลบ → None, อักขระอื่น → ตัวเอง)
+    """
+
+    def __missing__(self, code_point: int):
+        value = None if SYMBOL_PATTERN.match(chr(code_point)) else code_point
+        self[code_point] = value
+        return value
+
+
+_symbol_strip_table = _SymbolStripTable()
+
+_thai_normalize = None
+
+
+def normalize(text: str) -> str:
+    """
+    normalize ตัวอักษรไทยด้วย pythainlp (เช่น การจัดรูปแบบซ้ำซ้อน)
+    import pythainlp ตอนเรียกครั้งแรก เพราะการ import ทั้ง package ใช้เวลาหลายวินาที (ดู startup.py)
+    """
+    global _thai_normalize
+    if _thai_normalize is None:
+        from pythainlp.util import normalize as pythainlp_normalize
+        _thai_normalize = pythainlp_normalize
+    return _thai_normalize(text)
+
 
 def clean_text(text):
     """
@@ -9,24 +56,81 @@ def clean_text(text):
     - ลบ emoji และอักขระพิเศษที่ไม่ใช่ตัวอักษรหรือตัวเลข
     - ตัดช่องว่างที่เกินออก (เหลือเพียงช่องว่างเดียวระหว่างคำ)
     """
-    text = normalize(text)  # จัดการ normalize ตัวอักษรภาษาไทย เช่น "ก้" → "ก็"
-    
-    # ลบ URL (http, https, www) ออกจากข้อความ
-    text = re.sub(r"http\S+|www\S+|https\S+", "", text, flags=re.MULTILINE)
-    
-    # ลบอักขระที่ไม่ใช่: ตัวอักษรภาษาไทย, a-z, A-Z, ตัวเลข, หรือเว้นวรรค
-    text = re.sub(r"[^\w\sก-๙]", "", text)
-    
+    if NEEDS_THAI_NORMALIZE_PATTERN.search(text):
+        text = normalize(text)  # จัดการ normalize ตัวอักษรภาษาไทย เช่น "ก้" → "ก็"
+
+    # ลบ URL (http, https, www) และอักขระที่ไม่ใช่: ตัวอักษรภาษาไทย, a-z, A-Z, ตัวเลข, หรือเว้นวรรค
+    text = URL_OR_SYMBOL_PATTERN.sub("", text)
+
     # ลบช่องว่างซ้ำๆ เช่น tab/newline แล้วเหลือแค่ 1 ช่องว่าง
-    text = re.sub(r"\s+", " ", text).strip()
-    
-    return text  # คืนค่าข้อความที่ทำความสะอาดแล้ว
+    return " ".join(text.split())  # คืนค่าข้อความที่ทำความสะอาดแล้ว
+
+
+def clean_text_translate(text):
+    """เหมือน clean_text แต่ลบอักขระพิเศษด้วย str.translate แทน regex"""
+    if NEEDS_THAI_NORMALIZE_PATTERN.search(text):
+        text = normalize(text)
+    text = URL_PATTERN.sub("", text).translate(_symbol_strip_table)
+    return " ".join(text.split())
+
+
+CLEANERS = {"regex": clean_text, "translate": clean_text_translate}
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_workers: Optional[int] = None
+
+
+def _get_process_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """คืนค่า process pool ตัวเดียวที่ใช้ร่วมกัน (สร้างเมื่อใช้ครั้งแรก สร้างใหม่ถ้าขอจำนวน worker ต่างจากเดิม)"""
+    global _process_pool, _process_pool_workers
+    workers = max_workers or CLEAN_TEXT_PROCESS_WORKERS
+    if _process_pool is not None and workers != _process_pool_workers:
+        shutdown_process_pool()
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=workers)
+        _process_pool_workers = workers
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """ปิด process pool (เรียกจาก lifespan ของ FastAPI)"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+
+
+def _clean_chunk(texts: List[str], mode: str) -> List[str]:
+    """ทำความสะอาดข้อความหนึ่งกลุ่ม (ใช้ทั้งใน process หลักและใน process pool)"""
+    cleaner = CLEANERS[mode]
+    return [cleaner(text) for text in texts]
+
+
+def clean_batch(texts: List[str], mode: Optional[str] = None, process_threshold: Optional[int] = None,
+                max_workers: Optional[int] = None) -> List[str]:
+    """
+    ทำความสะอาดข้อความหลายรายการ (ผลลัพธ์เหมือน clean_text ทุกตัวอักษร)
+    - mode: "regex" (pattern รวมรอบเดียว) หรือ "translate" (ลบอักขระพิเศษด้วย str.translate)
+    - ถ้าจำนวนข้อความมากกว่า process_threshold จะแบ่งเป็นกลุ่มแล้วประมวลผลใน process pool
+    """
+    mode = mode or CLEAN_TEXT_MODE
+    if mode not in CLEANERS:
+        raise ValueError(f"Unknown clean_text mode: {mode}")
+    threshold = CLEAN_TEXT_PROCESS_THRESHOLD if process_threshold is None else process_threshold
+    if not threshold or len(texts) <= threshold:
+        return _clean_chunk(texts, mode)
+
+    chunks = [texts[start:start + CLEAN_TEXT_CHUNK_SIZE] for start in range(0, len(texts), CLEAN_TEXT_CHUNK_SIZE)]
+    results = _get_process_pool(max_workers).map(_clean_chunk, chunks, [mode] * len(chunks))
+    return [text for chunk in results for text in chunk]
+
 
 def clean_comments(comments):
     """
     ฟังก์ชันทำความสะอาดคอมเมนต์หลายข้อความ:
     - รับ list ของข้อความ
-    - วนลูปใช้ clean_text กับทุกข้อความใน list
+    - ทำความสะอาดทุกข้อความด้วย clean_batch
     - คืนค่าลิสต์ใหม่ของข้อความที่ถูกทำความสะอาดแล้ว
     """
-    return [clean_text(comment) for comment in comments]
+    return clean_batch(list(comments))
@@ -0,0 +1,130 @@
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ข้อความที่แสดงในหน้าผลลัพธ์สำหรับคอมเมนต์ที่ไม่ได้ถูกวิเคราะห์
+SKIPPED_BY_LENGTH_LABEL = "เกินขีดจำกัดความยาว (ข้าม)"
+UNANALYZABLE_LABEL = "ไม่สามารถวิเคราะห์ได้"
+
+# --- รหัส label (int8) — 0-2 ตรงกับ index ของ class ใน sentiment_backends.id2label ---
+LABEL_NEGATIVE = 0
+LABEL_NEUTRAL = 1
+LABEL_POSITIVE = 2
+LABEL_UNANALYZABLE = 3 # ยังไม่ถูกวิเคราะห์ หรือทำนายไม่สำเร็จ
+LABEL_SKIPPED = 4 # ยาวเกินกำหนด ไม่ได้ส่งไปวิเคราะห์
+LABEL_NAMES: Tuple[str, ...] = ("negative", "neutral", "positive", UNANALYZABLE_LABEL, SKIPPED_BY_LENGTH_LABEL)
+LABEL_CODES: Dict[str, int] = {name: code for code, name in enumerate(LABEL_NAMES)}
+SENTIMENT_LABEL_CODES = (LABEL_NEGATIVE, LABEL_NEUTRAL, LABEL_POSITIVE)
+
+# --- bitmask สถานะของแต่ละแถว (uint8) ---
+STATUS_TRANSLATED = 1 # ผ่านขั้นตรวจจับภาษา/แปลแล้ว
+STATUS_CLEANED = 2 # ผ่านการทำความสะอาดแล้ว (ส่งไปวิเคราะห์ต่อ)
+STATUS_ANALYZED = 4 # ได้ผลทำนายแล้ว
+STATUS_SKIPPED = 8 # ข้ามเพราะยาวเกินกำหนด
+STATUS_TRANSLATION_FAILED = 16 # ต้องแปลแต่แปลไม่สำเร็จ (ใช้ข้อความต้นฉบับแทน)
+
+
+class CommentBatch:
+    """
+    คอมเมนต์หนึ่งหน้าในรูปแบบ columnar ที่ทุกขั้นตอนของ pipeline อ่าน/เขียนร่วมกัน:
+    - ข้อความหนึ่งคอลัมน์ต่อขั้นตอน (ต้นฉบับ → คำแปล → ข้อความที่ทำความสะอาดแล้ว)
+    - labels: รหัส label (LABEL_*), scores: คะแนนของ label (NaN ถ้าไม่มี), status: bitmask (STATUS_*)
+    แถวที่ i ของทุกคอลัมน์คือคอมเมนต์เดียวกันเสมอ ขั้นตอนที่ประมวลผลเฉพาะบางแถวจะเขียนกลับด้วย index ของแถว
+    """
+
+    __slots__ = ("comment_ids", "texts", "published_at", "translations", "cleaned", "labels", "scores", "status")
+
+    def __init__(self, texts: List[str], comment_ids: Optional[List[Optional[str]]] = None,
+                 published_at: Optional[List[Optional[str]]] = None):
+        count = len(texts)
+        self.texts = texts
+        self.comment_ids = comment_ids if comment_ids is not None else [None] * count
+        self.published_at = published_at if published_at is not None else [None] * count
+        self.translations: List[str] = texts # ขั้นแปลจะแทนที่ทั้งคอลัมน์
+        self.cleaned: List[Optional[str]] = [None] * count
+        self.labels = np.full(count, LABEL_UNANALYZABLE, dtype=np.int8)
+        self.scores = np.full(count, np.nan)
+        self.status = np.zeros(count, dtype=np.uint8)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[dict]) -> "CommentBatch":
+        """สร้างจากหน้าคอมเมนต์ของ fetch_comments (list ของ {"comment_id", "text", "published_at"})"""
+        return cls(
+            [row["text"] for row in rows],
+            comment_ids=[row.get("comment_id") for row in rows],
+            published_at=[row.get("published_at") for row in rows],
+        )
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def has_status(self, flag: int) -> np.ndarray:
+        """mask ของแถวที่มีสถานะ flag"""
+        return (self.status & flag) != 0
+
+    def indexes_with_status(self, flag: int) -> np.ndarray:
+        return np.flatnonzero(self.has_status(flag))
+
+    def mark_translation_failed(self, indexes: List[int]) -> None:
+        self.status[np.asarray(indexes, dtype=np.intp)] |= STATUS_TRANSLATION_FAILED
+
+    def final_rows(self) -> np.ndarray:
+        """
+        mask ของแถวที่ได้ผลสุดท้ายแล้ว (ทำนายสำเร็จ หรือข้ามเพราะความยาว) จากคำแปลที่สำเร็จ
+        แถวอื่นล้มเหลวชั่วคราว (เช่น API แปลหรือทำนายล่ม) และควรถูกวิเคราะห์ใหม่ในครั้งถัดไป
+        """
+        return self.has_status(STATUS_ANALYZED | STATUS_SKIPPED) & ~self.has_status(STATUS_TRANSLATION_FAILED)
+
+    def mark_skipped(self, indexes: np.ndarray) -> None:
+        self.status[indexes] |= STATUS_SKIPPED
+        self.labels[indexes] = LABEL_SKIPPED
+
+    def set_cleaned(self, indexes: np.ndarray, cleaned_texts: List[str]) -> None:
+        """เขียนข้อความที่ทำความสะอาดแล้วกลับไปยังแถว indexes (ยาวเท่ากันเสมอ)"""
+        for index, cleaned_text in zip(indexes.tolist(), cleaned_texts):
+            self.cleaned[index] = cleaned_text
+        self.status[indexes] |= STATUS_CLEANED
+
+    def set_predictions(self, indexes: np.ndarray, results: Sequence[Optional[dict]]) -> None:
+        """
+        เขียนผลทำนายกลับไปยังแถว indexes ตามลำดับ ถ้า results สั้นกว่า indexes (เช่น backend ล้มเหลว)
+        แถวที่ไม่มีผลจะยังเป็น LABEL_UNANALYZABLE แทนที่จะเลื่อนไปปนกับแถวอื่น
+        """
+        for index, result in zip(indexes.tolist(), results):
+            if not result or "label" not in result:
+                continue
+            self.labels[index] = LABEL_CODES.get(result["label"], LABEL_UNANALYZABLE)
+            if result.get("score") is not None:
+                self.scores[index] = result["score"]
+            self.status[index] |= STATUS_ANALYZED
+
+    def label_counts(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """จำนวนแถวของแต่ละรหัส label (index = LABEL_*) ด้วย np.bincount เฉพาะแถว rows (mask หรือ index) ถ้าระบุ"""
+        labels = self.labels if rows is None else self.labels[rows]
+        return np.bincount(labels, minlength=len(LABEL_NAMES))
+
+    def label_names(self) -> List[str]:
+        return [LABEL_NAMES[code] for code in self.labels.tolist()]
+
+    def display_rows(self) -> List[Dict[str, str]]:
+        """แถวสำหรับแสดงผล (result.html / NDJSON): {"text", "sentiment"}"""
+        return [{"text": text, "sentiment": label} for text, label in zip(self.texts, self.label_names())]
+
+    def summary_texts(self) -> List[str]:
+        """ข้อความต้นฉบับของคอมเมนต์ที่ไม่ถูกข้ามเพราะความยาว (ใช้สร้างสรุป)"""
+        return [text for text, skipped in zip(self.texts, self.has_status(STATUS_SKIPPED).tolist()) if not skipped]
+
+    def store_rows(self) -> Iterator[tuple]:
+        """
+        แถวสำหรับบันทึกลงที่เก็บผล:
+        (index, comment_id, text, published_at, translation, sentiment, score, skipped, failed)
+        failed = ยังไม่ได้ผลสุดท้าย (ดู final_rows)
+        """
+        skipped = self.has_status(STATUS_SKIPPED).tolist()
+        final = self.final_rows().tolist()
+        scores = self.scores.tolist()
+        for index, label in enumerate(self.labels.tolist()):
+            score = scores[index]
+            yield (index, self.comment_ids[index], self.texts[index], self.published_at[index],
+                   self.translations[index], LABEL_NAMES[label], None if score != score else score, skipped[index],
+                   not final[index])
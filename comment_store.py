@@ -0,0 +1,204 @@
+import logging
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from comment_batch import CommentBatch, LABEL_NEGATIVE, LABEL_NEUTRAL, LABEL_POSITIVE, LABEL_SKIPPED, SENTIMENT_LABEL_CODES
+
+logger = logging.getLogger(__name__)
+
+# ชื่อคอลัมน์ของตัวนับใน videos ที่ตรงกับรหัส label ของ Sentiment
+SENTIMENT_COUNT_COLUMNS = {LABEL_POSITIVE: "positive_count", LABEL_NEGATIVE: "negative_count",
+                           LABEL_NEUTRAL: "neutral_count"}
+
+# ตั้งเป็นค่าว่างเพื่อปิดการเก็บผลรายคอมเมนต์ (ทุกครั้งจะวิเคราะห์ใหม่ทั้งหมด)
+COMMENT_STORE_PATH = os.getenv(
+    "COMMENT_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "comment_results.sqlite3")
+)
+
+
+class CommentResultStore:
+    """
+    เก็บผลวิเคราะห์รายคอมเมนต์ (คำแปล, label, score) ของแต่ละวิดีโอลง SQLite
+    พร้อมยอดรวมของวิดีโอ เพื่อให้การวิเคราะห์ซ้ำประมวลผลเฉพาะคอมเมนต์ใหม่
+    แล้วรวมเข้ากับยอดรวมเดิม
+    คอมเมนต์ที่แปลหรือทำนายไม่สำเร็จถูกเก็บเป็น failed (ไม่นับในยอดรวม) และจะถูกวิเคราะห์ใหม่ในครั้งถัดไป
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS comments ("
+            " video_id TEXT NOT NULL, comment_id TEXT NOT NULL, text TEXT NOT NULL,"
+            " published_at TEXT, translation TEXT, sentiment TEXT, score REAL,"
+            " skipped INTEGER NOT NULL DEFAULT 0, analyzed_at REAL NOT NULL,"
+            " failed INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (video_id, comment_id))"
+        )
+        if "failed" not in {column for _, column, *_ in db.execute("PRAGMA table_info(comments)")}:
+            # ไฟล์ที่สร้างก่อนมีคอลัมน์ failed
+            db.execute("ALTER TABLE comments ADD COLUMN failed INTEGER NOT NULL DEFAULT 0")
+        db.execute("CREATE INDEX IF NOT EXISTS comments_published_at ON comments (video_id, published_at)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS videos ("
+            " video_id TEXT PRIMARY KEY, total_comments INTEGER NOT NULL DEFAULT 0,"
+            " positive_count INTEGER NOT NULL DEFAULT 0, negative_count INTEGER NOT NULL DEFAULT 0,"
+            " neutral_count INTEGER NOT NULL DEFAULT 0, analyzed_count INTEGER NOT NULL DEFAULT 0,"
+            " skipped_count INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)"
+        )
+        self._db = db
+
+    def known_comment_ids(self, video_id: str, limit: int = 1000) -> Set[str]:
+        """
+        คืนค่า ID ของคอมเมนต์ล่าสุดที่เคยวิเคราะห์สำเร็จแล้ว (เรียงตามเวลาที่โพสต์)
+        ใช้เป็นจุดหยุดเมื่อไล่อ่านคอมเมนต์ใหม่แบบ order=time
+        (ใช้หลาย ID เผื่อคอมเมนต์ล่าสุดที่เคยเห็นถูกลบไปแล้ว)
+        ถ้ามีคอมเมนต์ที่ล้มเหลว จะคืนค่าเฉพาะคอมเมนต์ที่เก่ากว่าคอมเมนต์ที่ล้มเหลวที่เก่าที่สุด
+        การไล่อ่านครั้งถัดไปจึงผ่านคอมเมนต์ที่ล้มเหลวทุกรายการก่อนหยุด
+        """
+        with self._lock:
+            # '~' มากกว่าเวลาแบบ ISO 8601 ทุกค่า (ใช้เมื่อไม่มีคอมเมนต์ที่ล้มเหลว)
+            rows = self._db.execute(
+                "SELECT comment_id FROM comments WHERE video_id = ? AND failed = 0 AND published_at <"
+                " COALESCE((SELECT MIN(published_at) FROM comments WHERE video_id = ? AND failed = 1), '~')"
+                " ORDER BY published_at DESC LIMIT ?",
+                (video_id, video_id, limit),
+            ).fetchall()
+        return {comment_id for (comment_id,) in rows}
+
+    async def aknown_comment_ids(self, video_id: str, limit: int = 1000) -> Set[str]:
+        """เหมือน known_comment_ids แต่อ่าน SQLite ใน thread แยก ไม่บล็อก event loop"""
+        return await asyncio.to_thread(self.known_comment_ids, video_id, limit)
+
+    def save_page(self, video_id: str, batch: CommentBatch) -> None:
+        """
+        บันทึกผลของคอมเมนต์หนึ่งหน้าจาก pipeline แล้วเพิ่มยอดรวมของวิดีโอเฉพาะคอมเมนต์ที่เพิ่งได้ผลสำเร็จ
+        (ยังไม่เคยบันทึก หรือเคยล้มเหลว) คอมเมนต์ที่ล้มเหลวถูกบันทึกไว้เพื่อวิเคราะห์ใหม่ โดยไม่ทับผลที่สำเร็จแล้ว
+        """
+        now = time.time()
+        inserted_indexes = []
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for (index, comment_id, text, published_at, translation, sentiment, score, skipped,
+                     failed) in batch.store_rows():
+                    if not comment_id:
+                        continue
+                    row = (video_id, comment_id, text, published_at, translation, sentiment, score, int(skipped),
+                           now, int(failed))
+                    if failed:
+                        self._db.execute(
+                            "INSERT OR IGNORE INTO comments (video_id, comment_id, text, published_at, translation,"
+                            " sentiment, score, skipped, analyzed_at, failed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            row,
+                        )
+                    elif self._db.execute(
+                        "INSERT INTO comments (video_id, comment_id, text, published_at, translation,"
+                        " sentiment, score, skipped, analyzed_at, failed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                        " ON CONFLICT (video_id, comment_id) DO UPDATE SET translation = excluded.translation,"
+                        " sentiment = excluded.sentiment, score = excluded.score, skipped = excluded.skipped,"
+                        " analyzed_at = excluded.analyzed_at, failed = 0 WHERE comments.failed = 1",
+                        row,
+                    ).rowcount:
+                        inserted_indexes.append(index)
+
+                counts = batch.label_counts(np.array(inserted_indexes, dtype=np.intp))
+                deltas = {"total_comments": len(inserted_indexes),
+                          **{column: int(counts[code]) for code, column in SENTIMENT_COUNT_COLUMNS.items()},
+                          "analyzed_count": int(counts[list(SENTIMENT_LABEL_CODES)].sum()),
+                          "skipped_count": int(counts[LABEL_SKIPPED])}
+
+                self._db.execute(
+                    "INSERT INTO videos (video_id, updated_at) VALUES (?, ?)"
+                    " ON CONFLICT (video_id) DO UPDATE SET updated_at = excluded.updated_at",
+                    (video_id, now),
+                )
+                self._db.execute(
+                    "UPDATE videos SET " + ", ".join(f"{column} = {column} + ?" for column in deltas)
+                    + " WHERE video_id = ?",
+                    (*deltas.values(), video_id),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    async def asave_page(self, video_id: str, batch: CommentBatch) -> None:
+        """เหมือน save_page แต่เขียน SQLite ใน thread แยก ไม่บล็อก event loop (ใช้เป็น on_page ของ pipeline)"""
+        await asyncio.to_thread(self.save_page, video_id, batch)
+
+    def get_video_totals(self, video_id: str) -> Optional[Dict]:
+        """คืนค่ายอดรวมที่เก็บไว้ของวิดีโอ หรือ None ถ้ายังไม่เคยวิเคราะห์"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT total_comments, positive_count, negative_count, neutral_count, analyzed_count,"
+                " skipped_count, updated_at FROM videos WHERE video_id = ?",
+                (video_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("total_comments", "positive_count", "negative_count", "neutral_count",
+                "total_comments_analyzed", "total_comments_skipped_by_length", "updated_at")
+        return dict(zip(keys, row))
+
+    async def aget_video_totals(self, video_id: str) -> Optional[Dict]:
+        """เหมือน get_video_totals แต่อ่าน SQLite ใน thread แยก ไม่บล็อก event loop"""
+        return await asyncio.to_thread(self.get_video_totals, video_id)
+
+    def recent_comments(self, video_id: str, limit: int = 200,
+                        analyzed_before: Optional[float] = None) -> List[Dict]:
+        """
+        คืนค่าคอมเมนต์ที่วิเคราะห์สำเร็จและเก็บไว้ล่าสุด (ใหม่ไปเก่า) ในรูปแบบเดียวกับแถวของ pipeline
+        analyzed_before: เฉพาะคอมเมนต์ที่บันทึกก่อนเวลานี้ (time.time()) เช่น เพื่อไม่ให้ซ้ำกับผลของรอบที่เพิ่งรัน
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT comment_id, text, published_at, translation, sentiment, score, skipped"
+                " FROM comments WHERE video_id = ? AND failed = 0 AND analyzed_at < ?"
+                " ORDER BY published_at DESC LIMIT ?",
+                (video_id, float("inf") if analyzed_before is None else analyzed_before, limit),
+            ).fetchall()
+        return [
+            {"comment_id": comment_id, "text": text, "published_at": published_at, "translation": translation,
+             "sentiment": sentiment, "score": score, "skipped": bool(skipped)}
+            for comment_id, text, published_at, translation, sentiment, score, skipped in rows
+        ]
+
+    async def arecent_comments(self, video_id: str, limit: int = 200,
+                               analyzed_before: Optional[float] = None) -> List[Dict]:
+        """เหมือน recent_comments แต่อ่าน SQLite ใน thread แยก ไม่บล็อก event loop"""
+        return await asyncio.to_thread(self.recent_comments, video_id, limit, analyzed_before)
+
+    def forget_video(self, video_id: str) -> None:
+        """ลบผลที่เก็บไว้ทั้งหมดของวิดีโอ (การวิเคราะห์ครั้งถัดไปจะเริ่มใหม่ทั้งหมด)"""
+        with self._lock:
+            self._db.execute("DELETE FROM comments WHERE video_id = ?", (video_id,))
+            self._db.execute("DELETE FROM videos WHERE video_id = ?", (video_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def open_comment_store(db_path: str = COMMENT_STORE_PATH) -> Optional[CommentResultStore]:
+    """เปิด store ตาม path ที่ตั้งไว้ หรือคืนค่า None ถ้าปิดใช้งานหรือเปิดไฟล์ไม่ได้"""
+    if not db_path:
+        return None
+    try:
+        return CommentResultStore(db_path)
+    except sqlite3.Error as e:
+        logger.warning("เปิดที่เก็บผลวิเคราะห์รายคอมเมนต์ไม่สำเร็จ (%s): %s", db_path, e)
+        return None
+
+
+comment_store = open_comment_store()
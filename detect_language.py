@@ -0,0 +1,152 @@
+import logging
+import re # นำเข้า regex สำหรับการตรวจสอบตัวอักษร
+from typing import List
+import numpy as np # ใช้คำนวณสัดส่วนตัวอักษรแต่ละชุดของทั้ง batch พร้อมกัน
+
+logger = logging.getLogger(__name__)
+
+MIN_CHARS_FOR_TRANSLATION = 5 # กำหนดจำนวนอักขระขั้นต่ำที่จะพิจารณาแปล
+# Regex สำหรับตรวจสอบว่าข้อความมีตัวอักษรที่เป็นคำ (ตัวอักษรภาษาอังกฤษหรือไทย) หรือไม่
+ALPHANUMERIC_PATTERN = re.compile(r'[a-zA-Z0-9ก-ฮ]')
+# Regex สำหรับตรวจจับตัวอักษรไทย
+THAI_CHAR_PATTERN = re.compile(r'[ก-ฮ]')
+
+# สัดส่วนตัวอักษรไทยขั้นต่ำ (เทียบกับตัวอักษรทั้งหมด) ที่ถือว่าเป็นข้อความภาษาไทยแน่นอน
+THAI_RATIO_KEEP = 0.6
+
+# ผลการจำแนกด้วยสัดส่วนตัวอักษร
+SCRIPT_KEEP = 0 # ภาษาไทยแน่นอน ไม่ต้องแปล
+SCRIPT_TRANSLATE = 1 # ไม่มีตัวอักษรไทยเลย ต้องแปล
+SCRIPT_AMBIGUOUS = 2 # ผสมหลายภาษา ต้องใช้ langdetect ตัดสิน
+
+
+def script_ratios(texts: List[str]) -> np.ndarray:
+    """
+    คำนวณสัดส่วนตัวอักษร ไทย / ละติน / ภาษาอื่น ของทุกข้อความใน batch พร้อมกัน
+    โดยแปลงทุกข้อความเป็น array ของ code point ชุดเดียวแล้วนับด้วย np.bincount
+    คืนค่า array ขนาด (len(texts), 3) ที่แต่ละแถวคือ [thai, latin, other]
+    (ข้อความที่ไม่มีตัวอักษรเลยจะได้ [0, 0, 0])
+    """
+    count = len(texts)
+    if count == 0:
+        return np.zeros((0, 3))
+
+    # surrogatepass: ข้อความจาก YouTube อาจมี surrogate ที่ไม่มีคู่ ซึ่งจะถูกนับเป็นสัญลักษณ์ (ไม่ใช่ตัวอักษร)
+    codepoints = np.frombuffer("".join(texts).encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32)
+    owners = np.repeat(np.arange(count), [len(text) for text in texts])
+
+    thai = (codepoints >= 0x0E01) & (codepoints <= 0x0E5B)
+    latin = (
+        ((codepoints >= 0x41) & (codepoints <= 0x5A))
+        | ((codepoints >= 0x61) & (codepoints <= 0x7A))
+        | ((codepoints >= 0xC0) & (codepoints <= 0x24F) & (codepoints != 0xD7) & (codepoints != 0xF7))
+    )
+    # ตัวอักษรของภาษาอื่น (กรีก, ซีริลลิก, CJK, ฯลฯ) โดยไม่นับเครื่องหมาย สัญลักษณ์ และอิโมจิ
+    symbols = (
+        ((codepoints >= 0x2000) & (codepoints <= 0x2BFF))
+        | ((codepoints >= 0x3000) & (codepoints <= 0x303F))
+        | ((codepoints >= 0xD800) & (codepoints <= 0xDFFF))
+        | ((codepoints >= 0xFE00) & (codepoints <= 0xFE0F))
+        | (codepoints >= 0x1F000)
+    )
+    other = (codepoints >= 0x0370) & ~thai & ~symbols
+
+    counts = np.stack([
+        np.bincount(owners, weights=thai, minlength=count),
+        np.bincount(owners, weights=latin, minlength=count),
+        np.bincount(owners, weights=other, minlength=count),
+    ], axis=1)
+    totals = counts.sum(axis=1, keepdims=True)
+    return np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
+
+
+def classify_scripts(texts: List[str]) -> np.ndarray:
+    """
+    จำแนกข้อความทั้ง batch จากสัดส่วนตัวอักษร
+    - ตัวอักษรไทยเป็นส่วนใหญ่ → SCRIPT_KEEP
+    - ไม่มีตัวอักษรไทยเลย (เช่น ละตินล้วน) → SCRIPT_TRANSLATE
+    - กรณีอื่นๆ (ผสมกัน) → SCRIPT_AMBIGUOUS
+    """
+    ratios = script_ratios(texts)
+    codes = np.full(len(texts), SCRIPT_AMBIGUOUS, dtype=np.int8)
+    codes[ratios[:, 0] == 0] = SCRIPT_TRANSLATE
+    codes[ratios[:, 0] >= THAI_RATIO_KEEP] = SCRIPT_KEEP
+    return codes
+
+
+def _is_translatable(text: str) -> bool:
+    """ตรวจสอบข้อความที่สั้นเกินไป หรือไม่มีตัวอักษรที่เป็นคำเลย (เช่น อิโมจิล้วน, ตัวเลขล้วน)"""
+    return len(text.strip()) >= MIN_CHARS_FOR_TRANSLATION and bool(ALPHANUMERIC_PATTERN.search(text))
+
+
+_langdetect = None # (detect, LangDetectException) หลัง import ครั้งแรก
+
+
+def _load_langdetect():
+    """
+    import langdetect ตอนใช้ครั้งแรก (ข้อความส่วนใหญ่ตัดสินได้จากสัดส่วนตัวอักษรโดยไม่ต้องใช้)
+    และตั้ง seed ให้ langdetect คืนค่าเหมือนเดิมทุกครั้งสำหรับข้อความเดียวกัน
+    """
+    global _langdetect
+    if _langdetect is None:
+        from langdetect import detect, DetectorFactory, LangDetectException
+
+        DetectorFactory.seed = 0
+        _langdetect = (detect, LangDetectException)
+    return _langdetect
+
+
+def warm_up_language_profiles() -> None:
+    """โหลด language profile ของ langdetect ล่วงหน้า (ปกติจะโหลดตอนตรวจจับภาษาครั้งแรกของ process)"""
+    _load_langdetect()
+    from langdetect.detector_factory import init_factory
+
+    init_factory()
+
+
+def _detect_needs_translation(text: str) -> bool:
+    """ตรวจจับภาษาด้วย langdetect (ใช้กับข้อความที่ผ่านการกรองเบื้องต้นแล้ว)"""
+    detect, LangDetectException = _load_langdetect()
+    try:
+        detected_lang = detect(text)
+        return detected_lang != 'th' # ถ้าไม่ใช่ภาษาไทย ให้แปล
+    except LangDetectException:
+        # หากตรวจจับภาษาไม่ได้ (เช่น ข้อความสั้นเกินไป)
+        # ตรวจสอบว่ามีตัวอักษรไทยหรือไม่ ถ้ามี ให้ถือว่าเป็นภาษาไทย ไม่ต้องแปล
+        if THAI_CHAR_PATTERN.search(text):
+            logger.debug("ตรวจจับภาษาไม่ได้แต่มีตัวอักษรไทย ไม่แปล: %r", text[:50])
+            return False
+        # ไม่มีตัวอักษรไทย และตรวจจับภาษาไม่ได้ ให้ทำการแปล (อาจเป็นภาษาอังกฤษสั้นๆ หรือภาษาอื่น)
+        logger.debug("ตรวจจับภาษาไม่ได้ จะทำการแปล: %r", text[:50])
+        return True
+    except Exception as e:
+        logger.warning("เกิดข้อผิดพลาดในการตรวจจับภาษา: %s จะทำการแปลข้อความ", e)
+        return True
+
+
+def needs_translation(text: str) -> bool:
+    """
+    ตรวจสอบว่าข้อความเดียวควรถูกแปลเป็นภาษาไทยหรือไม่ (เรียก langdetect ทุกครั้ง)
+    """
+    if not _is_translatable(text):
+        return False # ไม่แปลข้อความประเภทนี้
+    return _detect_needs_translation(text)
+
+
+def needs_translation_batch(texts: List[str]) -> List[bool]:
+    """
+    ตรวจสอบทั้ง batch ว่าข้อความใดควรถูกแปล โดยใช้สัดส่วนตัวอักษรตัดสินกรณีที่ชัดเจนก่อน
+    และส่งเฉพาะข้อความที่ผสมหลายภาษาไปให้ langdetect
+    """
+    results = [False] * len(texts)
+    candidate_indexes = [index for index, text in enumerate(texts) if _is_translatable(text)]
+    if not candidate_indexes:
+        return results
+
+    codes = classify_scripts([texts[index] for index in candidate_indexes])
+    for index, code in zip(candidate_indexes, codes):
+        if code == SCRIPT_TRANSLATE:
+            results[index] = True
+        elif code == SCRIPT_AMBIGUOUS:
+            results[index] = _detect_needs_translation(texts[index])
+    return results
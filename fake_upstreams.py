@@ -0,0 +1,370 @@
+"""
+Server จำลองของ YouTube Data API, OpenAI chat completions และ Hugging Face Inference API
+สำหรับวัดประสิทธิภาพแบบ offline (ไม่ใช้ quota จริง) ข้อมูลทุกอย่างสร้างจาก ID แบบกำหนดได้ (deterministic)
+ตัวอย่างการใช้งาน:
+    python fake_upstreams.py --port 8900 --comments-per-video 300 --youtube-latency lognormal:80:0.4
+แล้วรันแอปโดยชี้ไปที่ server นี้:
+    YOUTUBE_API_BASE_URL=http://127.0.0.1:8900/youtube/v3 OPENAI_BASE_URL=http://127.0.0.1:8900/v1 \\
+    HF_API_BASE_URL=http://127.0.0.1:8900/hf uvicorn main:app
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# คอมเมนต์ตัวอย่างของแต่ละภาษา (ใช้สร้างคอมเมนต์จำลองตามสัดส่วนที่กำหนด)
+COMMENT_POOLS = {
+    "th": ["คลิปนี้ดีมากเลยครับ", "ชอบมากค่ะ รอติดตามตอนต่อไป", "เสียงเบาไปหน่อย แต่เนื้อหาดีมาก",
+           "ไม่ค่อยชอบเท่าไหร่", "สุดยอดไปเลย", "555555 ขำมาก", "ตัดต่อดีมากครับ", "น่าเบื่อ"],
+    "en": ["This is the best video I have seen all week", "nice video", "first",
+           "The editing is great but the audio is a bit quiet", "Not my favorite, too long",
+           "Thanks for sharing this!", "I learned a lot from this"],
+    "mixed": ["ดีมาก very good 555", "สุดยอด!!! love this so much", "I don't get the hate, คลิปนี้ดีออก",
+              "最高の動画でした", "Отличное видео, спасибо", "😂😂😂 ขำ"],
+}
+DEFAULT_LANGUAGE_MIX = {"th": 0.6, "en": 0.3, "mixed": 0.1}
+NUMBERED_LINE_PATTERN = re.compile(r"^\[(\d+)\]\s?(.*)$", re.MULTILINE)
+
+
+class LatencyModel:
+    """
+    การกระจายของเวลาตอบสนอง กำหนดด้วยข้อความ (หน่วยมิลลิวินาที):
+    "fixed:20", "uniform:10:50" (ต่ำสุด:สูงสุด) หรือ "lognormal:80:0.5" (median:sigma)
+    """
+
+    def __init__(self, spec: str = "fixed:0", seed: int = 0):
+        kind, *params = spec.split(":")
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        self.kind = kind
+        self.params = [float(param) for param in params] or [0.0]
+        self._rng = random.Random(seed)
+
+    def sample(self) -> float:
+        """คืนค่าเวลาตอบสนองหนึ่งครั้ง (วินาที)"""
+        if self.kind == "fixed":
+            milliseconds = self.params[0]
+        elif self.kind == "uniform":
+            milliseconds = self._rng.uniform(self.params[0], self.params[1])
+        else:
+            sigma = self.params[1] if len(self.params) > 1 else 0.5
+            milliseconds = self.params[0] * math.exp(self._rng.gauss(0.0, sigma))
+        return max(0.0, milliseconds) / 1000
+
+
+def parse_language_mix(spec: str) -> Dict[str, float]:
+    """แปลงข้อความ "th:0.6,en:0.3,mixed:0.1" เป็น dict ของสัดส่วนแต่ละภาษา"""
+    mix = {}
+    for part in spec.split(","):
+        language, weight = part.split(":")
+        if language not in COMMENT_POOLS:
+            raise ValueError(f"Unknown language: {language} (expected one of {sorted(COMMENT_POOLS)})")
+        mix[language] = float(weight)
+    return mix
+
+
+def _seed(*parts) -> int:
+    return int.from_bytes(hashlib.sha256("\x1f".join(map(str, parts)).encode("utf-8")).digest()[:8], "big")
+
+
+def _short_id(prefix: str, *parts, length: int = 11) -> str:
+    """สร้าง ID ที่อยู่ในรูปแบบเดียวกับของ YouTube (ตัวอักษร/ตัวเลข ความยาวคงที่) จาก parts"""
+    digest = hashlib.sha256("\x1f".join(map(str, parts)).encode("utf-8")).hexdigest()
+    return (prefix + digest)[:length]
+
+
+class FakeUpstreams:
+    """
+    สร้าง FastAPI app ที่จำลอง upstream ทั้งสามราย:
+    - /youtube/v3/{commentThreads,videos,search,channels,playlistItems}
+    - /v1/chat/completions (OpenAI)
+    - /hf/models/{model_id} (Hugging Face Inference API)
+    """
+
+    def __init__(self, comments_per_video: int = 300, videos_per_channel: int = 200,
+                 language_mix: Optional[Dict[str, float]] = None,
+                 youtube_latency: str = "fixed:0", openai_latency: str = "fixed:0", hf_latency: str = "fixed:0",
+                 error_rate: float = 0.0, seed: int = 0):
+        self.comments_per_video = comments_per_video
+        self.videos_per_channel = videos_per_channel
+        self.language_mix = language_mix or DEFAULT_LANGUAGE_MIX
+        self.latency = {
+            "youtube": LatencyModel(youtube_latency, seed),
+            "openai": LatencyModel(openai_latency, seed + 1),
+            "hf": LatencyModel(hf_latency, seed + 2),
+        }
+        self.error_rate = error_rate # สัดส่วนของ request ที่ตอบ 429/503 (ทดสอบการลองใหม่และ AIMD)
+        self.seed = seed
+        self._error_rng = random.Random(seed + 3)
+        self.requests: Dict[str, int] = {} # จำนวน request แยกตาม endpoint
+        # คำตอบที่กำหนดไว้ล่วงหน้าแยกตาม endpoint: (status, headers, body) ตอบก่อนคำตอบปกติตามลำดับ (ใช้ในเทสต์)
+        self.scripted_responses: Dict[str, List[Tuple[int, Dict[str, str], Any]]] = {}
+        self.rejected_texts: Set[str] = set() # Hugging Face ตอบ 400 ถ้า inputs มีข้อความเหล่านี้
+        self.app = self._build_app()
+
+    # --- ข้อมูลจำลอง ---
+
+    def comments(self, video_id: str) -> List[dict]:
+        rng = random.Random(_seed(self.seed, "comments", video_id))
+        languages, weights = zip(*self.language_mix.items())
+        newest = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        comments = []
+        for index in range(self.comments_per_video):
+            text = rng.choice(COMMENT_POOLS[rng.choices(languages, weights)[0]])
+            if rng.random() < 0.5:
+                text += f" {index}"
+            published_at = (newest - timedelta(minutes=index)).strftime("%Y-%m-%dT%H:%M:%SZ")
+            comments.append({"id": f"{video_id}.c{index}", "text": text, "published_at": published_at})
+        return comments
+
+    def channel_id(self, handle: str) -> Optional[str]:
+        if handle.lower().startswith("missing"):
+            return None
+        return "UC" + _short_id("", "channel", handle.lower(), length=22)
+
+    def channel_video_ids(self, channel_id: str) -> List[str]:
+        return [_short_id("v", channel_id, index) for index in range(self.videos_per_channel)]
+
+    def sentiment_prediction(self, text: str) -> List[dict]:
+        """ผลทำนายของหนึ่งข้อความในรูปแบบของ Inference API (คะแนนสุ่มแบบกำหนดได้จากข้อความ)"""
+        rng = random.Random(_seed("sentiment", text))
+        scores = [rng.random() for _ in range(3)]
+        total = sum(scores)
+        return [{"label": f"LABEL_{index}", "score": score / total} for index, score in enumerate(scores)]
+
+    def video_resource(self, video_id: str) -> dict:
+        rng = random.Random(_seed(self.seed, "video", video_id))
+        kind = rng.random()
+        resource = {
+            "kind": "youtube#video",
+            "id": video_id,
+            "snippet": {
+                "title": f"Fake video {video_id}",
+                "publishedAt": "2024-12-31T12:00:00Z",
+                "thumbnails": {"medium": {"url": f"https://i.ytimg.com/vi/{video_id}/mqdefault.jpg"}},
+            },
+            "contentDetails": {"duration": "PT45S" if kind < 0.2 else "PT10M30S"},
+        }
+        if kind > 0.9:
+            resource["liveStreamingDetails"] = {"actualStartTime": "2024-12-31T12:00:00Z"}
+        return resource
+
+    # --- HTTP ---
+
+    async def _delay(self, upstream: str, endpoint: str) -> Optional[Response]:
+        """หน่วงเวลาตาม LatencyModel แล้วคืนค่า response ข้อผิดพลาดจำลอง (หรือ None)"""
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        await asyncio.sleep(self.latency[upstream].sample())
+        if self.scripted_responses.get(endpoint):
+            status_code, headers, body = self.scripted_responses[endpoint].pop(0)
+            return JSONResponse(body, status_code=status_code, headers=headers)
+        if self.error_rate and self._error_rng.random() < self.error_rate:
+            status_code = self._error_rng.choice((429, 503))
+            return JSONResponse({"error": {"code": status_code, "message": "simulated"}}, status_code=status_code)
+        return None
+
+    def _page(self, items: list, params, default_size: int) -> dict:
+        offset = int(params.get("pageToken") or 0)
+        size = min(int(params.get("maxResults") or default_size), 100)
+        body = {"items": items[offset:offset + size]}
+        if offset + size < len(items):
+            body["nextPageToken"] = str(offset + size)
+        return body
+
+    def _with_etag(self, request: Request, body: dict) -> Response:
+        """ตอบพร้อม ETag และตอบ 304 ถ้า If-None-Match ตรงกัน (เหมือน YouTube)"""
+        etag = '"' + hashlib.sha256(repr(body).encode("utf-8")).hexdigest()[:16] + '"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return JSONResponse({**body, "etag": etag}, headers={"ETag": etag})
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/youtube/v3/commentThreads")
+        async def comment_threads(request: Request):
+            if (error := await self._delay("youtube", "commentThreads")) is not None:
+                return error
+            comments = self.comments(request.query_params["videoId"])
+            items = [{
+                "id": comment["id"],
+                "snippet": {"topLevelComment": {"id": comment["id"], "snippet": {
+                    "textDisplay": comment["text"], "textOriginal": comment["text"],
+                    "publishedAt": comment["published_at"],
+                }}},
+            } for comment in comments]
+            return JSONResponse(self._page(items, request.query_params, 20))
+
+        @app.get("/youtube/v3/videos")
+        async def videos(request: Request):
+            if (error := await self._delay("youtube", "videos")) is not None:
+                return error
+            ids = [video_id for video_id in request.query_params.get("id", "").split(",") if video_id]
+            return self._with_etag(request, {"items": [self.video_resource(video_id) for video_id in ids]})
+
+        @app.get("/youtube/v3/channels")
+        async def channels(request: Request):
+            if (error := await self._delay("youtube", "channels")) is not None:
+                return error
+            params = request.query_params
+            handle = params.get("forHandle") or params.get("forUsername")
+            channel_id = self.channel_id(handle) if handle else params.get("id")
+            if not channel_id:
+                return JSONResponse({"items": []})
+            return self._with_etag(request, {"items": [{
+                "id": channel_id,
+                "snippet": {"title": f"Fake channel {channel_id}",
+                            "thumbnails": {"default": {"url": "https://yt3.ggpht.com/fake=s88"}}},
+                "statistics": {"subscriberCount": str(_seed(channel_id) % 1_000_000)},
+                "contentDetails": {"relatedPlaylists": {"uploads": "UU" + channel_id[2:]}},
+            }]})
+
+        @app.get("/youtube/v3/playlistItems")
+        async def playlist_items(request: Request):
+            if (error := await self._delay("youtube", "playlistItems")) is not None:
+                return error
+            channel_id = "UC" + request.query_params["playlistId"][2:]
+            items = [{"contentDetails": {"videoId": video_id}} for video_id in self.channel_video_ids(channel_id)]
+            return JSONResponse(self._page(items, request.query_params, 5))
+
+        @app.get("/youtube/v3/search")
+        async def search(request: Request):
+            if (error := await self._delay("youtube", "search")) is not None:
+                return error
+            items = [
+                {"id": {"kind": "youtube#video", "videoId": video_id}, "snippet": self.video_resource(video_id)["snippet"]}
+                for video_id in self.channel_video_ids(request.query_params["channelId"])
+            ]
+            return JSONResponse(self._page(items, request.query_params, 5))
+
+        @app.post("/v1/chat/completions")
+        async def chat_completions(request: Request):
+            if (error := await self._delay("openai", "chat.completions")) is not None:
+                return error
+            body = await request.json()
+            prompt = body["messages"][-1]["content"]
+            numbered = NUMBERED_LINE_PATTERN.findall(prompt)
+            if numbered:
+                content = "\n".join(f"[{number}] (แปล) {text}" for number, text in numbered)
+            elif "สรุป" in prompt:
+                content = "ผู้ชมส่วนใหญ่ชื่นชอบวิดีโอนี้ มีบางส่วนวิจารณ์เรื่องเสียง"
+            else:
+                content = "(แปล) " + prompt.rsplit("\n\n", 1)[-1]
+            prompt_tokens = len(prompt) // 2
+            completion_tokens = len(content) // 2
+            return JSONResponse({
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+        @app.post("/hf/models/{model_id:path}")
+        async def hf_inference(model_id: str, request: Request):
+            if (error := await self._delay("hf", "inference")) is not None:
+                return error
+            inputs = (await request.json())["inputs"]
+            texts = inputs if isinstance(inputs, list) else [inputs]
+            if self.rejected_texts.intersection(texts):
+                return JSONResponse({"error": "bad input"}, status_code=400)
+            return JSONResponse([self.sentiment_prediction(text) for text in texts])
+
+        @app.get("/stats")
+        async def stats():
+            return JSONResponse(self.requests)
+
+        return app
+
+
+# ต้องนานกว่า keepalive_expiry ของ connection pool ฝั่งแอป (30 วินาที) มิฉะนั้น server จะปิด connection
+# ที่ client กำลังจะนำกลับมาใช้ และ request นั้นล้มเหลวด้วย RemoteProtocolError ซึ่ง upstream จริงไม่ทำ
+KEEP_ALIVE_SECONDS = 75
+
+
+class FakeUpstreamServer:
+    """รัน FakeUpstreams ด้วย uvicorn ใน thread แยก (มี event loop ของตัวเอง) สำหรับใช้ใน benchmark"""
+
+    def __init__(self, upstreams: FakeUpstreams, host: str = "127.0.0.1", port: int = 0):
+        self.upstreams = upstreams
+        self._server = uvicorn.Server(uvicorn.Config(upstreams.app, host=host, port=port, log_level="warning",
+                                                   timeout_keep_alive=KEEP_ALIVE_SECONDS))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def start(self, timeout: float = 10.0) -> str:
+        """เริ่ม server แล้วคืนค่า base URL (เช่น http://127.0.0.1:54321)"""
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("fake upstream server did not start")
+            time.sleep(0.01)
+        host, port = self._server.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+def upstream_environment(base_url: str) -> Dict[str, str]:
+    """ตัวแปร environment ที่ชี้ YouTube, OpenAI และ Hugging Face ไปยัง server จำลอง"""
+    return {
+        "YOUTUBE_API_BASE_URL": f"{base_url}/youtube/v3",
+        "YOUTUBE_API_KEY": "fake-youtube-key",
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "OPENAI_API_KEY": "fake-openai-key",
+        "HF_API_BASE_URL": f"{base_url}/hf",
+        "HF_TOKEN": "fake-hf-token",
+        "SENTIMENT_BACKEND": "remote",
+    }
+
+
+def add_upstream_arguments(parser: argparse.ArgumentParser) -> None:
+    """เพิ่ม option สำหรับตั้งค่า server จำลอง (ใช้ร่วมกับ benchmark.py)"""
+    parser.add_argument("--comments-per-video", type=int, default=300)
+    parser.add_argument("--videos-per-channel", type=int, default=200)
+    parser.add_argument("--languages", default="th:0.6,en:0.3,mixed:0.1", help="language mix, e.g. th:0.5,en:0.5")
+    parser.add_argument("--youtube-latency", default="lognormal:80:0.4", help="fixed:MS | uniform:MIN:MAX | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--openai-latency", default="lognormal:600:0.5")
+    parser.add_argument("--hf-latency", default="lognormal:150:0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream requests answered 429/503")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def upstreams_from_args(args) -> FakeUpstreams:
+    return FakeUpstreams(
+        comments_per_video=args.comments_per_video,
+        videos_per_channel=args.videos_per_channel,
+        language_mix=parse_language_mix(args.languages),
+        youtube_latency=args.youtube_latency,
+        openai_latency=args.openai_latency,
+        hf_latency=args.hf_latency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-ins for YouTube, OpenAI and Hugging Face")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_upstream_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(upstreams_from_args(args).app, host=args.host, port=args.port, log_level="warning",
+                timeout_keep_alive=KEEP_ALIVE_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
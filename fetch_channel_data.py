@@ -1,9 +1,13 @@
-from googleapiclient.discovery import build
-import random
+import logging
 import re
 import os
 from dotenv import load_dotenv
 from datetime import timedelta # For parsing ISO 8601 duration
+from youtube_client import get_youtube_client # Shared, connection-pooled async client
+from metadata_cache import (CHANNEL_DETAILS_TTL_SECONDS, list_with_revalidation,
+                            resolve_handle, resolve_uploads_playlist) # Metadata cache with ETag revalidation
+
+logger = logging.getLogger(__name__)
 
 # โหลดค่า environment จากไฟล์ .env
 load_dotenv()
@@ -20,68 +24,8 @@ def extract_video_id(url: str) -> str:
     match = re.search(pattern, url)
     return match.group(1) if match else None
 
-# --- ฟังก์ชัน fetch_video_details_by_id ---
-def fetch_video_details_by_id(video_id: str) -> dict:
-    """
-    ดึงชื่อและปกคลิปสำหรับ Video ID ที่ระบุ
-    """
-    if not YOUTUBE_API_KEY:
-        raise ValueError("YouTube API Key is not set.")
-
-    youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-    request = youtube.videos().list(
-        part='snippet',
-        id=video_id
-    )
-    response = request.execute()
-
-    if response and response['items']:
-        snippet = response['items'][0]['snippet']
-        return {
-            "title": snippet['title'],
-            "thumbnail": snippet['thumbnails'].get('medium', {}).get('url', '') or \
-                         snippet['thumbnails'].get('high', {}).get('url', '') or \
-                         snippet['thumbnails'].get('default', {}).get('url', 'https://placehold.co/480x360/E0E0E0/6C757D?text=No+Thumbnail')
-        }
-    return {}
-
-# --- ฟังก์ชัน fetch_comments_from_youtube ---
-def fetch_comments_from_youtube(video_url: str, max_comments: int = 200) -> list:
-    """
-    ดึงคอมเมนต์จากวิดีโอ YouTube โดยใช้ API และสุ่มเลือกตามจำนวนที่กำหนด
-    """
-    video_id = extract_video_id(video_url)
-    if not video_id:
-        raise ValueError("ไม่พบ video ID จาก URL ที่ให้มา")
-
-    youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-    comments = []
-    next_page_token = None
-
-    while len(comments) < max_comments:
-        request = youtube.commentThreads().list(
-            part='snippet',
-            videoId=video_id,
-            maxResults=100, # API limit per request
-            pageToken=next_page_token,
-            textFormat='plainText'
-        )
-        response = request.execute()
-
-        for item in response['items']:
-            comment = item['snippet']['topLevelComment']['snippet']['textDisplay']
-            comments.append(comment)
-            if len(comments) >= max_comments:
-                break
-
-        next_page_token = response.get('nextPageToken')
-        if not next_page_token:
-            break
-
-    return random.sample(comments, min(len(comments), max_comments))
-
 # --- ฟังก์ชัน extract_channel_id ---
-def extract_channel_id(url: str) -> str:
+async def extract_channel_id(url: str) -> str:
     """
     ดึง Channel ID จาก URL โดยรองรับหลายรูปแบบ
     """
@@ -92,45 +36,48 @@ def extract_channel_id(url: str) -> str:
     match_user_or_custom = re.search(r"youtube\.com/(?:user/|c/|@)([^/]+)", url)
     if match_user_or_custom:
         identifier = match_user_or_custom.group(1)
-        return get_channel_id_from_identifier(identifier)
+        return await get_channel_id_from_identifier(identifier)
 
     return None
 
 # --- ฟังก์ชัน get_channel_id_from_identifier ---
-def get_channel_id_from_identifier(identifier: str) -> str:
+async def get_channel_id_from_identifier(identifier: str) -> str:
     """
-    ดึง Channel ID จากชื่อผู้ใช้หรือ custom URL ด้วย YouTube API
+    ดึง Channel ID จากชื่อผู้ใช้หรือ custom URL ด้วย YouTube API (ผลถูกเก็บไว้ใน metadata cache)
     """
     if not YOUTUBE_API_KEY:
         raise ValueError("YouTube API Key is not set.")
 
-    youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
+    return await resolve_handle(identifier, _lookup_channel_id)
 
-    request = youtube.channels().list(part='id', forHandle=identifier)
-    response = request.execute()
-    if response and response['items']:
+async def _lookup_channel_id(identifier: str) -> str:
+    """ค้นหา Channel ID ด้วย forHandle แล้วจึง forUsername"""
+    youtube = get_youtube_client()
+
+    response = await youtube.list("channels", part='id', forHandle=identifier)
+    if response and response.get('items'):
         return response['items'][0]['id']
 
-    request = youtube.channels().list(part='id', forUsername=identifier)
-    response = request.execute()
-    if response and response['items']:
+    response = await youtube.list("channels", part='id', forUsername=identifier)
+    if response and response.get('items'):
         return response['items'][0]['id']
 
     return None
 
 # --- ฟังก์ชัน fetch_channel_details ---
-def fetch_channel_details(channel_id: str) -> dict:
+async def fetch_channel_details(channel_id: str) -> dict:
     """
     ดึงข้อมูลโปรไฟล์ของ channel เช่น ชื่อ รูป และจำนวนผู้ติดตาม
     """
     if not YOUTUBE_API_KEY:
         raise ValueError("YouTube API Key is not set.")
 
-    youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-    request = youtube.channels().list(part='snippet,statistics', id=channel_id)
-    response = request.execute()
+    response = await list_with_revalidation(
+        "channel", channel_id, CHANNEL_DETAILS_TTL_SECONDS,
+        "channels", part='snippet,statistics', id=channel_id
+    )
 
-    if response and response['items']:
+    if response and response.get('items'):
         snippet = response['items'][0]['snippet']
         statistics = response['items'][0]['statistics']
 
@@ -165,17 +112,122 @@ def parse_duration(iso_duration: str) -> timedelta:
 
 
 # --- ฟังก์ชัน fetch_channel_videos ---
-def fetch_channel_videos(channel_id: str, max_results_per_page: int = 50, page_token: str = None) -> tuple[list, str]:
+
+# ID ของ playlist "uploads" ของแต่ละช่อง (ไม่เปลี่ยน จึงค้นหาครั้งเดียวต่อช่อง)
+async def _lookup_uploads_playlist_id(channel_id: str) -> str:
+    youtube = get_youtube_client()
+    response = await youtube.list("channels", part='contentDetails', id=channel_id)
+    items = response.get('items') or []
+    return items[0].get('contentDetails', {}).get('relatedPlaylists', {}).get('uploads') if items else None
+
+async def get_uploads_playlist_id(channel_id: str) -> str:
+    """
+    คืนค่า ID ของ playlist ที่รวมวิดีโอทั้งหมดที่ช่องอัปโหลด (channels.list 1 หน่วย แล้วเก็บใน cache ของ metadata)
+    คืนค่า None ถ้าไม่พบ
+    """
+    return await resolve_uploads_playlist(channel_id, _lookup_uploads_playlist_id)
+
+def _classify_video(video_id: str, detailed_video: dict) -> str:
+    """ระบุประเภทของวิดีโอ (ปกติ, ไลฟ์สด, Shorts) จากข้อมูลของ videos.list"""
+    video_type = "ปกติ" # Default type
+
+    # Use detailed video info if available
+    if detailed_video:
+        # Check for Live Stream
+        live_details = detailed_video.get('liveStreamingDetails')
+        if live_details:
+            # If it has liveStreamingDetails, it's a live video (past or current)
+            video_type = "ไลฟ์สด"
+        else:
+            # Check for Shorts based on duration (less than 60 seconds)
+            content_details = detailed_video.get('contentDetails')
+            if content_details and 'duration' in content_details:
+                try:
+                    # Parse ISO 8601 duration (e.g., PT1M30S)
+                    duration_td = parse_duration(content_details['duration'])
+                    if duration_td.total_seconds() < 60: # Shorts are typically under 60 seconds
+                        video_type = "Shorts"
+                except Exception as e:
+                    logger.debug("แปลงความยาวของวิดีโอ %s ไม่สำเร็จ: %s", video_id, e)
+                    # Fallback to normal if duration parsing fails
+    return video_type
+
+def _build_video_info(video_id: str, snippet: dict, detailed_video: dict) -> dict:
+    """สร้าง dict ของวิดีโอสำหรับหน้าแสดงวิดีโอของช่อง"""
+    # Get thumbnail, prioritize medium, then high, then default, then placeholder
+    thumbnails = snippet.get('thumbnails', {})
+    thumbnail = thumbnails.get('medium', {}).get('url') or \
+                thumbnails.get('high', {}).get('url') or \
+                thumbnails.get('default', {}).get('url') or \
+                'https://placehold.co/480x360/E0E0E0/6C757D?text=No+Thumbnail'
+
+    return {
+        "video_id": video_id,
+        "title": snippet.get('title', ''),
+        "thumbnail": thumbnail,
+        "video_url": f"https://www.youtube.com/watch?v={video_id}",
+        "video_type": _classify_video(video_id, detailed_video), # Add the determined type
+        "published_at": snippet.get('publishedAt') # ISO 8601 เช่น 2024-01-31T12:00:00Z
+    }
+
+async def _fetch_video_details(video_ids: list) -> dict:
+    """ดึงรายละเอียดของวิดีโอหลายรายการด้วย videos.list ครั้งเดียว (ไม่เกิน 50 รายการ) คืนค่า dict ตาม video ID"""
+    if not video_ids:
+        return {}
+    youtube = get_youtube_client()
+    videos_response = await youtube.list(
+        "videos",
+        part='snippet,liveStreamingDetails,contentDetails',
+        id=','.join(video_ids) # Join all video IDs for a single request
+    )
+    return {item['id']: item for item in videos_response.get('items', [])}
+
+async def fetch_channel_videos(channel_id: str, max_results_per_page: int = 50, page_token: str = None) -> tuple[list, str]:
     """
-    ดึงวิดีโอจาก channel และระบุประเภท (ปกติ, ไลฟ์สด, Shorts) อย่างแม่นยำขึ้น
+    ดึงวิดีโอจาก channel (ใหม่ไปเก่า) และระบุประเภท (ปกติ, ไลฟ์สด, Shorts)
+    ไล่อ่าน playlist "uploads" ของช่องด้วย playlistItems.list (1 หน่วยต่อหน้า)
+    แล้วดึงรายละเอียดของทั้งหน้าด้วย videos.list ครั้งเดียว (1 หน่วย)
+    ถ้าหา playlist ไม่พบ จะใช้ search.list แทน (100 หน่วยต่อหน้า)
     """
     if not YOUTUBE_API_KEY:
         raise ValueError("YouTube API Key is not set.")
 
-    youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
+    playlist_id = await get_uploads_playlist_id(channel_id)
+    if not playlist_id:
+        logger.warning("ไม่พบ uploads playlist ของช่อง %s ใช้ search.list แทน", channel_id)
+        return await fetch_channel_videos_via_search(channel_id, max_results_per_page, page_token)
+
+    youtube = get_youtube_client()
+    playlist_response = await youtube.list(
+        "playlistItems",
+        part='contentDetails',
+        playlistId=playlist_id,
+        maxResults=min(max_results_per_page, 50),
+        pageToken=page_token
+    )
+    video_ids = [item['contentDetails']['videoId'] for item in playlist_response.get('items', [])]
+    video_details_map = await _fetch_video_details(video_ids)
+
+    # วิดีโอที่เป็นส่วนตัวหรือถูกลบจะไม่มีใน videos.list จึงข้ามไป
+    all_videos_with_type = [
+        _build_video_info(video_id, video_details_map[video_id]['snippet'], video_details_map[video_id])
+        for video_id in video_ids if video_id in video_details_map
+    ]
+    return all_videos_with_type, playlist_response.get('nextPageToken')
+
+async def fetch_channel_videos_via_search(channel_id: str, max_results_per_page: int = 50, page_token: str = None) -> tuple[list, str]:
+    """
+    ดึงวิดีโอจาก channel ด้วย search.list (100 หน่วยต่อหน้า และผลอาจไม่ครบ)
+    ใช้เมื่อหา uploads playlist ไม่พบ และใช้เปรียบเทียบใน benchmark.py
+    """
+    if not YOUTUBE_API_KEY:
+        raise ValueError("YouTube API Key is not set.")
+
+    youtube = get_youtube_client()
     
     # Step 1: Use search().list to get a list of video IDs and basic snippets
-    search_request = youtube.search().list(
+    search_response = await youtube.list(
+        "search",
         part='snippet',
         channelId=channel_id,
         type='video',
@@ -183,67 +235,18 @@ def fetch_channel_videos(channel_id: str, max_results_per_page: int = 50, page_t
         maxResults=max_results_per_page,
         pageToken=page_token
     )
-    search_response = search_request.execute()
 
-    video_ids = [item['id']['videoId'] for item in search_response['items'] if item['id']['kind'] == 'youtube#video']
-    
-    all_videos_with_type = []
-
-    if video_ids:
-        # Step 2: Use videos().list to get detailed info (liveStreamingDetails, contentDetails) for accurate typing
-        videos_request = youtube.videos().list(
-            part='snippet,liveStreamingDetails,contentDetails',
-            id=','.join(video_ids) # Join all video IDs for a single request
-        )
-        videos_response = videos_request.execute()
+    search_items = [item for item in search_response['items'] if item['id']['kind'] == 'youtube#video']
 
-        video_details_map = {item['id']: item for item in videos_response['items']}
+    # Step 2: Use videos().list to get detailed info (liveStreamingDetails, contentDetails) for accurate typing
+    video_details_map = await _fetch_video_details([item['id']['videoId'] for item in search_items])
 
-        for item in search_response['items']: # Iterate through search results to maintain order
-            if item['id']['kind'] != 'youtube#video':
-                continue
+    # Iterate through search results to maintain order
+    all_videos_with_type = [
+        _build_video_info(item['id']['videoId'], item['snippet'], video_details_map.get(item['id']['videoId']))
+        for item in search_items
+    ]
 
-            video_id = item['id']['videoId']
-            title = item['snippet']['title']
-            
-            # Get thumbnail, prioritize medium, then high, then default, then placeholder
-            thumbnail = item['snippet']['thumbnails'].get('medium', {}).get('url') or \
-                        item['snippet']['thumbnails'].get('high', {}).get('url') or \
-                        item['snippet']['thumbnails'].get('default', {}).get('url') or \
-                        'https://placehold.co/480x360/E0E0E0/6C757D?text=No+Thumbnail'
-
-            video_type = "ปกติ" # Default type
-
-            # Use detailed video info if available
-            detailed_video = video_details_map.get(video_id)
-            if detailed_video:
-                # Check for Live Stream
-                live_details = detailed_video.get('liveStreamingDetails')
-                if live_details:
-                    # If it has liveStreamingDetails, it's a live video (past or current)
-                    video_type = "ไลฟ์สด"
-                else:
-                    # Check for Shorts based on duration (less than 60 seconds)
-                    content_details = detailed_video.get('contentDetails')
-                    if content_details and 'duration' in content_details:
-                        try:
-                            # Parse ISO 8601 duration (e.g., PT1M30S)
-                            duration_td = parse_duration(content_details['duration'])
-                            if duration_td.total_seconds() < 60: # Shorts are typically under 60 seconds
-                                video_type = "Shorts"
-                        except Exception as e:
-                            print(f"Warning: Could not parse duration for video {video_id}: {e}")
-                            # Fallback to normal if duration parsing fails
-
-            video_info = {
-                "video_id": video_id,
-                "title": title,
-                "thumbnail": thumbnail,
-                "video_url": f"https://www.youtube.com/watch?v={video_id}",
-                "video_type": video_type # Add the determined type
-            }
-            all_videos_with_type.append(video_info)
-    
     next_page_token = search_response.get('nextPageToken')
             
     # Return a single list of all videos with their determined type
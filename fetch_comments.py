@@ -1,8 +1,13 @@
-from googleapiclient.discovery import build  # ใช้สำหรับเรียกใช้ YouTube Data API
-import random  # ใช้สำหรับสุ่มคอมเมนต์จากลิสต์
+import logging
+import math  # ใช้คำนวณระยะกระโดดของ Algorithm L
+import random  # ใช้สำหรับ reservoir sampling
 import re  # ใช้สำหรับทำ regex หา video ID
 import os  # ใช้สำหรับเข้าถึง environment variables
 from dotenv import load_dotenv  # ใช้สำหรับโหลดค่าจากไฟล์ .env
+from youtube_client import get_youtube_client  # client แบบ async ที่ใช้ connection pool ร่วมกัน
+from metadata_cache import VIDEO_DETAILS_TTL_SECONDS, list_with_revalidation  # cache ข้อมูลวิดีโอ (ตรวจซ้ำด้วย ETag)
+
+logger = logging.getLogger(__name__)
 
 # โหลด environment variables จากไฟล์ .env เช่น API key
 load_dotenv()
@@ -21,22 +26,20 @@ def extract_video_id(url: str) -> str:
     match = re.search(pattern, url)
     return match.group(1) if match else None  # คืนค่า video ID ถ้าพบ มิฉะนั้นคืน None
 
-def fetch_video_details_by_id(video_id: str) -> dict:
+async def fetch_video_details_by_id(video_id: str) -> dict:
     """
     รับ video_id แล้วไปดึงข้อมูลของวิดีโอนั้น เช่น ชื่อเรื่อง และ thumbnail
     """
     if not YOUTUBE_API_KEY:
         raise ValueError("YouTube API Key is not set.")  # แจ้ง error หากไม่มี API key
 
-    # สร้าง YouTube API client object
-    youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-
-    # เรียก API เพื่อดึงข้อมูลวิดีโอ (title และ thumbnails)
-    request = youtube.videos().list(
+    # เรียก API เพื่อดึงข้อมูลวิดีโอ (title และ thumbnails) ผ่าน cache ที่ตรวจซ้ำด้วย ETag
+    response = await list_with_revalidation(
+        "video", video_id, VIDEO_DETAILS_TTL_SECONDS,
+        "videos",
         part='snippet',  # ขอข้อมูลเฉพาะ snippet
         id=video_id
     )
-    response = request.execute()
 
     if response and response['items']:
         snippet = response['items'][0]['snippet']
@@ -46,44 +49,115 @@ def fetch_video_details_by_id(video_id: str) -> dict:
         }
     return {}  # ถ้าไม่เจอวิดีโอ คืน dict ว่าง
 
-def fetch_comments_from_youtube(video_url: str, max_comments: int = 200) -> list:
+async def iter_comment_pages(video_id: str, max_comments: int = 200, page_size: int = 100,
+                             order: str = None, stop_at_ids: set = None):
     """
-    ดึงคอมเมนต์จากวิดีโอ YouTube ที่ให้มา
-    โดยใช้ YouTube API เพื่อดึงคอมเมนต์แบบ plain text
-    และสุ่มเลือกไม่เกินจำนวนที่กำหนด
+    ดึงคอมเมนต์ของวิดีโอทีละหน้า (ไม่เกิน 100 รายการต่อหน้า) แบบ async generator
+    เพื่อให้ขั้นตอนถัดไป (แปล, ทำความสะอาด, วิเคราะห์) เริ่มทำงานได้ทันทีโดยไม่ต้องรอครบทุกหน้า
+    แต่ละหน้าเป็น list ของ dict: {"comment_id", "text", "published_at"}
+    - order: "time" (ใหม่ไปเก่า) หรือ "relevance" (ค่าเริ่มต้นของ API)
+    - stop_at_ids: หยุดทันทีเมื่อเจอคอมเมนต์ที่มี ID อยู่ในชุดนี้ (ใช้กับ order="time" เพื่อดึงเฉพาะคอมเมนต์ใหม่)
     """
-    video_id = extract_video_id(video_url)
-    if not video_id:
-        raise ValueError("ไม่พบ video ID จาก URL ที่ให้มา")  # ตรวจสอบว่าแยก video ID ได้ไหม
-
-    # สร้าง YouTube API client object
-    youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-    comments = []
+    # ใช้ YouTube client ตัวเดียวกันทั้ง process
+    youtube = get_youtube_client()
+    fetched = 0
     next_page_token = None  # ใช้สำหรับดึงหน้าถัดไปของคอมเมนต์
 
     # วนลูปเพื่อดึงคอมเมนต์จนกว่าจะครบหรือไม่มีหน้าถัดไป
-    while len(comments) < max_comments:
+    while fetched < max_comments:
         # เรียก API เพื่อดึงคอมเมนต์
-        request = youtube.commentThreads().list(
+        response = await youtube.list(
+            "commentThreads",
             part='snippet',  # ขอข้อมูลเฉพาะ snippet
             videoId=video_id,  # ID ของวิดีโอ
-            maxResults=100,  # YouTube API จำกัดไม่เกิน 100 ต่อ request
+            maxResults=min(page_size, 100),  # YouTube API จำกัดไม่เกิน 100 ต่อ request
             pageToken=next_page_token,  # สำหรับไปยังหน้าถัดไป
+            order=order,  # ลำดับของคอมเมนต์ (None = ค่าเริ่มต้นของ API)
             textFormat='plainText'  # ขอคอมเมนต์ในรูปแบบ plain text
         )
-        response = request.execute()
 
-        # วนลูปดึงคอมเมนต์จาก response
-        for item in response['items']:
-            comment = item['snippet']['topLevelComment']['snippet']['textDisplay']
-            comments.append(comment)
-            if len(comments) >= max_comments:
-                break  # ถ้าครบจำนวนที่ต้องการแล้วให้หยุด
+        # แปลง response เป็นหน้าของคอมเมนต์ โดยไม่เกินจำนวนที่เหลือ
+        page = []
+        reached_known = False
+        for item in response.get('items', [])[:max_comments - fetched]:
+            top_level = item['snippet']['topLevelComment']
+            if stop_at_ids and top_level.get('id') in stop_at_ids:
+                reached_known = True  # คอมเมนต์ที่เหลือเคยถูกวิเคราะห์แล้ว
+                break
+            page.append({
+                "comment_id": top_level.get('id'),
+                "text": top_level['snippet']['textDisplay'],
+                "published_at": top_level['snippet'].get('publishedAt'),
+            })
+        fetched += len(page)
+        if page:
+            yield page
+        if reached_known:
+            break
 
         # ดูว่า API ให้ token สำหรับหน้าถัดไปมาหรือไม่
         next_page_token = response.get('nextPageToken')
         if not next_page_token:
             break  # ถ้าไม่มีหน้าถัดไปแล้วก็หยุด
 
-    # สุ่มเลือกคอมเมนต์จากทั้งหมดที่ได้ โดยไม่เกินจำนวนที่กำหนด
-    return random.sample(comments, min(len(comments), max_comments))
+class ReservoirSampler:
+    """
+    สุ่มตัวอย่างแบบ uniform ขนาด k จากข้อมูลที่ไหลเข้ามาทีละรายการ โดยใช้หน่วยความจำคงที่
+    (Algorithm L: คำนวณระยะกระโดดไปยังรายการถัดไปที่จะถูกเลือก แทนการสุ่มทุกรายการ)
+    """
+
+    def __init__(self, k: int, rng: random.Random = None):
+        self.k = k
+        self.rng = rng or random.Random()
+        self.items = []
+        self.seen = 0  # จำนวนรายการที่ผ่านเข้ามาทั้งหมด
+        self._weight = 1.0
+        self._next_pick = k - 1  # index ของรายการถัดไปที่จะถูกสุ่มเข้า reservoir
+        if k > 0:
+            self._advance()
+
+    def _random(self) -> float:
+        # random() อาจคืนค่า 0.0 ซึ่ง log ไม่ได้
+        return self.rng.random() or 1e-300
+
+    def _advance(self) -> None:
+        self._weight *= math.exp(math.log(self._random()) / self.k)
+        self._weight = min(self._weight, 1.0 - 1e-16)  # ป้องกัน log(0) จากการปัดเศษ
+        self._next_pick += math.floor(math.log(self._random()) / math.log(1 - self._weight)) + 1
+
+    def add(self, item) -> None:
+        """ส่งรายการเข้ามาหนึ่งรายการ"""
+        index = self.seen
+        self.seen += 1
+        if self.k <= 0:
+            return
+        if index < self.k:
+            self.items.append(item)
+        elif index == self._next_pick:
+            self.items[self.rng.randrange(self.k)] = item
+            self._advance()
+
+async def sample_comment_pages(video_id: str, max_comments: int = 200, max_pages: int = 50,
+                               page_size: int = 100, stats: dict = None, rng: random.Random = None):
+    """
+    ไล่อ่านคอมเมนต์ของวิดีโอไม่เกิน max_pages หน้า (1 หน้า = 1 quota unit ของ commentThreads.list)
+    แล้วเก็บตัวอย่างแบบสุ่ม uniform ไว้ max_comments รายการด้วย reservoir sampling
+    จากนั้นคืนค่าตัวอย่างทีละหน้า (รูปแบบเดียวกับ iter_comment_pages)
+    ถ้าส่ง dict มาใน stats จะได้ค่า "seen", "kept" และ "pages" กลับไป
+    """
+    sampler = ReservoirSampler(max_comments, rng)
+    pages = 0
+    async for page in iter_comment_pages(video_id, max_comments=max_pages * 100, page_size=100):
+        pages += 1
+        for comment in page:
+            sampler.add(comment)
+        if pages >= max_pages:
+            break
+
+    if stats is not None:
+        stats.update({"seen": sampler.seen, "kept": len(sampler.items), "pages": pages})
+    logger.debug("reservoir sampling: อ่าน %d ความคิดเห็นจาก %d หน้า เก็บไว้ %d รายการ",
+                 sampler.seen, pages, len(sampler.items))
+
+    for start in range(0, len(sampler.items), page_size):
+        yield sampler.items[start:start + page_size]
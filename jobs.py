@@ -0,0 +1,183 @@
+import logging
+import os
+import time
+import uuid
+import asyncio
+import contextvars
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from cache_store import TieredCache
+
+logger = logging.getLogger(__name__)
+
+# สถานะของงาน
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+FINISHED_STATES = (JOB_DONE, JOB_FAILED)
+
+# --- การตั้งค่าคิวงาน ---
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2")) # จำนวนงานที่รันพร้อมกันได้
+MAX_TRACKED_JOBS = int(os.getenv("MAX_TRACKED_JOBS", "1000")) # จำนวนงานที่เก็บสถานะไว้ในหน่วยความจำ
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", str(24 * 3600)))
+JOB_RESULTS_PATH = os.getenv(
+    "JOB_RESULTS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "job_results.sqlite3")
+) # ตั้งเป็นค่าว่างเพื่อเก็บผลในหน่วยความจำอย่างเดียว
+
+
+class Job:
+    """งานวิเคราะห์หนึ่งรายการ พร้อมสถานะ ความคืบหน้าของแต่ละขั้นตอน และผลลัพธ์"""
+
+    def __init__(self, kind: str, run: Callable[["Job"], Awaitable[Dict]]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.run = run
+        self.status = JOB_QUEUED
+        self.progress: Dict[str, int] = {}
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.version = 0 # เพิ่มขึ้นทุกครั้งที่สถานะหรือความคืบหน้าเปลี่ยน
+        self._changed = asyncio.Event()
+
+    def report_progress(self, stage: str, count: int) -> None:
+        """เพิ่มจำนวนรายการที่ขั้นตอน stage ประมวลผลเสร็จแล้ว"""
+        self.progress[stage] = self.progress.get(stage, 0) + count
+        self._notify()
+
+    def _notify(self) -> None:
+        self.version += 1
+        self._changed.set()
+
+    async def wait_for_change(self, version: int, timeout: float) -> None:
+        """รอจนกว่า version จะเปลี่ยนจากค่าที่ระบุ (หรือหมดเวลา)"""
+        if self.version != version:
+            return
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def snapshot(self) -> Dict:
+        """คืนค่าสถานะของงานในรูปแบบที่แปลงเป็น JSON ได้"""
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    คิวงานภายใน process: submit คืนค่างานทันที แล้ว worker จำนวนจำกัดจะรันงานตามลำดับที่ส่งเข้ามา
+    ผลของงานที่เสร็จแล้วจะถูกเก็บไว้ (ในหน่วยความจำและ SQLite) เพื่อเรียกดูภายหลัง
+    """
+
+    def __init__(self, num_workers: int = ANALYSIS_JOB_WORKERS, max_tracked_jobs: int = MAX_TRACKED_JOBS,
+                 results: Optional[TieredCache] = None):
+        self.num_workers = num_workers
+        self.max_tracked_jobs = max_tracked_jobs
+        self.results = results or TieredCache("job_results", max_entries=200)
+
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+
+    def _ensure_started(self) -> None:
+        """
+        เริ่ม worker ใน event loop ปัจจุบัน (เริ่มใหม่ถ้า loop เปลี่ยน)
+        worker ใช้ context ว่างของตัวเอง ไม่สืบทอด context ของ request ที่บังเอิญ submit งานแรก
+        (มิฉะนั้นเวลาของทุกขั้นตอนในงานถัดๆ ไปจะถูกบันทึกลงใน Server-Timing ของ request นั้น)
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or not self._workers:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._workers = [loop.create_task(self._worker(), context=contextvars.Context())
+                             for _ in range(self.num_workers)]
+
+    def submit(self, kind: str, run: Callable[[Job], Awaitable[Dict]]) -> Job:
+        """ส่งงานเข้าคิว run จะถูกเรียกด้วย Job (ใช้ job.report_progress รายงานความคืบหน้า) และต้องคืนค่า dict"""
+        self._ensure_started()
+        job = Job(kind, run)
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.max_tracked_jobs:
+            # ลืมงานเก่าที่สุดที่เสร็จแล้ว (ผลยังเรียกดูได้จาก self.results)
+            oldest = next((job_id for job_id, tracked in self._jobs.items() if tracked.status in FINISHED_STATES), None)
+            if oldest is None:
+                break
+            del self._jobs[oldest]
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def aget_snapshot(self, job_id: str) -> Optional[Dict]:
+        """
+        คืนค่าสถานะของงาน (รวมงานที่เสร็จแล้วและถูกลืมจากหน่วยความจำ) หรือ None ถ้าไม่พบ
+        งานที่ถูกลืมแล้วอ่านจาก results บนดิสก์ใน thread แยก
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        stored = await self.results.aget(job_id)
+        return stored["job"] if stored else None
+
+    async def aget_result(self, job_id: str) -> Optional[Dict]:
+        """คืนค่าผลของงานที่เสร็จแล้ว หรือ None ถ้ายังไม่เสร็จหรือไม่พบ"""
+        stored = await self.results.aget(job_id)
+        return stored["result"] if stored else None
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+            job._notify()
+            result = None
+            try:
+                result = await job.run(job)
+                job.status = JOB_DONE
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("งาน %s %s ล้มเหลว: %s", job.kind, job.id, e)
+                job.status = JOB_FAILED
+                job.error = str(e)
+            job.finished_at = time.time()
+            # แปลงเป็น JSON และเขียนลงดิสก์ใน thread แยก (ค่าอ่านได้จากหน่วยความจำทันที)
+            await self.results.aset(job.id, {"job": job.snapshot(), "result": result})
+            job._notify()
+
+    def stats(self) -> Dict:
+        """คืนค่าจำนวนงานในแต่ละสถานะ"""
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {**counts, "workers": self.num_workers}
+
+    async def aclose(self) -> None:
+        """หยุด worker ทั้งหมด (งานที่ค้างอยู่จะถูกยกเลิก)"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+job_queue = JobQueue(results=TieredCache(
+    "job_results",
+    max_entries=200,
+    ttl_seconds=JOB_RESULT_TTL_SECONDS,
+    db_path=JOB_RESULTS_PATH or None,
+))
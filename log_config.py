@@ -0,0 +1,38 @@
+import os
+import json
+import logging
+
+# ระดับ log ("DEBUG", "INFO", "WARNING", ...) — ข้อความระดับที่ต่ำกว่านี้จะถูกข้ามก่อนจัดรูปแบบข้อความ
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower() # "text" หรือ "json" (หนึ่งบรรทัดต่อหนึ่ง event)
+
+# attribute มาตรฐานของ LogRecord (ที่เหลือคือฟิลด์ที่ส่งมาทาง extra=)
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """จัดรูปแบบ log เป็น JSON หนึ่งบรรทัด รวมฟิลด์ที่ส่งมาทาง extra= เพื่อให้ค้นหา/รวมผลได้ง่าย"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        event.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            event["exception"] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT) -> None:
+    """ตั้งค่า root logger ของแอป (เรียกครั้งเดียวตอน import main)"""
+    handler = logging.StreamHandler()
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
@@ -1,25 +1,44 @@
 from fastapi import FastAPI, Request, Form, Query # เพิ่ม Query สำหรับ load_more_channel_videos
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import uvicorn
 import os
+import json
+import time
+import asyncio
+import logging
 from dotenv import load_dotenv
 import httpx
 # Import specific exceptions from httpx.exceptions
 from httpx import _exceptions as httpx_exceptions # แก้ไขตรงนี้: เปลี่ยน exceptions เป็น _exceptions
-import openai # นำเข้าไลบรารี OpenAI
-import tiktoken # นำเข้าไลบรารี tiktoken สำหรับการนับโทเค็น
+from contextlib import asynccontextmanager
 
 # Load environment variables
 load_dotenv()
 
 # Ensure these imports are correct based on your file structure
-from fetch_comments import fetch_comments_from_youtube, extract_video_id, fetch_video_details_by_id
-from translate_text import translate_to_thai
-from clean_text import clean_comments
-from predict_sentiment import predict_sentiment
+from fetch_comments import iter_comment_pages, sample_comment_pages, extract_video_id, fetch_video_details_by_id
+from pipeline import (run_comment_pipeline, stream_comment_pipeline, new_tally, tally_batch, with_pending_counts,
+                      SummarySample, MAX_DISPLAY_COMMENTS, MAX_SUMMARY_SOURCE_COMMENTS)
+from comment_store import comment_store
+from channel_analysis import stream_channel_analysis, CHANNEL_DEFAULT_MAX_VIDEOS
+from jobs import job_queue, FINISHED_STATES, JOB_FAILED
 from fetch_channel_data import extract_channel_id, fetch_channel_details, fetch_channel_videos, get_channel_id_from_identifier # เพิ่ม get_channel_id_from_identifier
+from youtube_client import close_youtube_client
+from predict_sentiment import close_sentiment_backend, sentiment_cache
+from translate_text import translation_cache
+from summarizer import cancel_background_refreshes, summarize_comments, summary_cache
+from clean_text import shutdown_process_pool
+from metadata_cache import metadata_stats
+from rate_limiter import limiter_stats
+from metrics import MetricsMiddleware, PROMETHEUS_CONTENT_TYPE, render_metrics, timed_stage
+from log_config import configure_logging
+from startup import WARM_UP_ENABLED, is_ready, mark_ready, startup_status, warm_up
+from singleflight import SingleFlight
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # --- API Key Configuration Check ---
 # For local testing, ensure these are set in your .env file
@@ -27,15 +46,62 @@ YOUTUBE_API_KEY_CHECK = os.getenv("YOUTUBE_API_KEY")
 OPENAI_API_KEY_CHECK = os.getenv("OPENAI_API_KEY") # Read OpenAI API key from .env
 
 # OpenAI client initialization
-openai_client = None
 if not OPENAI_API_KEY_CHECK:
-    print("WARNING: ไม่พบ OPENAI_API_KEY ในไฟล์ .env โปรดตั้งค่า API Key ของคุณ")
-    print("ตัวอย่าง: OPENAI_API_KEY=YOUR_OPENAI_API_KEY_HERE")
-else:
-    openai_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY_CHECK)
+    logger.warning("ไม่พบ OPENAI_API_KEY ในไฟล์ .env โปรดตั้งค่า API Key ของคุณ (ตัวอย่าง: OPENAI_API_KEY=YOUR_OPENAI_API_KEY_HERE)")
+_openai_client = None
 
 
-app = FastAPI()
+def get_openai_client():
+    """
+    คืนค่า OpenAI client ตัวเดียวที่ใช้ร่วมกัน หรือ None ถ้าไม่ได้ตั้งค่า OPENAI_API_KEY
+    สร้างในขั้น warm-up (หรือตอนใช้ครั้งแรก) เพราะการ import openai ใช้เวลาเกือบหนึ่งวินาที
+    """
+    global _openai_client
+    if _openai_client is None and OPENAI_API_KEY_CHECK:
+        import openai
+
+        _openai_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY_CHECK)
+    return _openai_client
+
+# จำนวนคอมเมนต์สูงสุดที่จะดึงมาวิเคราะห์ต่อวิดีโอ (pipeline ประมวลผลทีละหน้า จึงตั้งค่าให้สูงได้)
+MAX_COMMENTS_TO_ANALYZE = int(os.getenv("MAX_COMMENTS_TO_ANALYZE", "200"))
+
+# วิธีเลือกคอมเมนต์: "head" = ดึงตามลำดับจนครบ MAX_COMMENTS_TO_ANALYZE,
+# "reservoir" = ไล่อ่านไม่เกิน SAMPLE_MAX_PAGES หน้า (1 quota unit ต่อหน้า) แล้วสุ่มตัวอย่างแบบ uniform
+COMMENT_SAMPLING_MODE = os.getenv("COMMENT_SAMPLING_MODE", "head")
+SAMPLE_MAX_PAGES = int(os.getenv("SAMPLE_MAX_PAGES", "50"))
+
+# คำขอวิเคราะห์วิดีโอเดียวกัน (พารามิเตอร์เดียวกัน) ที่มาพร้อมกันจะรอผลจากการวิเคราะห์ครั้งเดียว
+# และผู้ที่มาภายในเวลานี้หลังการวิเคราะห์เสร็จจะได้ผลเดียวกันโดยไม่ใช้ quota ซ้ำ (0 = รวมเฉพาะที่มาพร้อมกัน)
+ANALYSIS_COALESCE_WINDOW_SECONDS = float(os.getenv("ANALYSIS_COALESCE_WINDOW_SECONDS", "10"))
+analysis_flights = SingleFlight(result_ttl=ANALYSIS_COALESCE_WINDOW_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    จัดการ resource ที่ใช้ร่วมกันตลอดอายุของแอป เช่น connection pool ของ YouTube และ Hugging Face
+    warm-up encoder, language profile, ตาราง normalize และ client ต่างๆ พร้อมกันเป็นงานเบื้องหลัง
+    ระหว่างนั้นแอปรับ request ได้แล้ว แต่ /healthz จะตอบ 503 จนกว่า warm-up จะเสร็จ
+    """
+    warm_up_task = None
+    if WARM_UP_ENABLED:
+        warm_up_task = asyncio.create_task(warm_up({"openai_client": get_openai_client}))
+    else:
+        mark_ready()
+    yield
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+        await asyncio.gather(warm_up_task, return_exceptions=True)
+    await job_queue.aclose()
+    await cancel_background_refreshes()
+    await close_youtube_client()
+    await close_sentiment_backend()
+    shutdown_process_pool()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware) # จับเวลาทุก request และเพิ่ม header Server-Timing
 
 # Templates and static files
 # แก้ไขพาธของ Templates กลับไปที่ "frontend"
@@ -44,58 +110,159 @@ static_path = os.path.join(BASE_DIR, "static")
 app.mount("/static", StaticFiles(directory=static_path), name="static")
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "frontend")) 
 
-# --- ฟังก์ชันสำหรับตัดข้อความตามจำนวนโทเค็น ---
-def truncate_text_by_tokens(text: str, max_tokens: int, model_name: str = "gpt-3.5-turbo") -> str:
+async def select_comment_pages(video_id: str, sampling_mode: str = None, sampling_stats: dict = None):
     """
-    ตัดข้อความที่กำหนดให้มีจำนวนโทเค็นไม่เกินที่ระบุ โดยใช้ tiktoken
+    เลือกแหล่งคอมเมนต์ตามโหมดการสุ่มตัวอย่าง คืนค่า (async generator ของหน้าคอมเมนต์, ฟังก์ชัน async บันทึกผลแต่ละหน้า)
+    ฟังก์ชันบันทึกผลเป็น None ถ้าไม่ได้ใช้ที่เก็บผลรายคอมเมนต์
     """
-    try:
-        encoding = tiktoken.encoding_for_model(model_name)
-    except KeyError:
-        # Fallback ไปยัง encoding พื้นฐานหากไม่พบ model_name
-        encoding = tiktoken.get_encoding("cl100k_base")
+    if (sampling_mode or COMMENT_SAMPLING_MODE) == "reservoir":
+        return sample_comment_pages(
+            video_id, max_comments=MAX_COMMENTS_TO_ANALYZE, max_pages=SAMPLE_MAX_PAGES, stats=sampling_stats
+        ), None
+    if comment_store is not None:
+        # ดึงคอมเมนต์ใหม่ไปเก่า แล้วหยุดเมื่อเจอคอมเมนต์ที่เคยวิเคราะห์แล้ว (วิเคราะห์เฉพาะส่วนที่เพิ่มขึ้น)
+        return iter_comment_pages(
+            video_id, max_comments=MAX_COMMENTS_TO_ANALYZE, order="time",
+            stop_at_ids=await comment_store.aknown_comment_ids(video_id)
+        ), lambda page: comment_store.asave_page(video_id, page)
+    return iter_comment_pages(video_id, max_comments=MAX_COMMENTS_TO_ANALYZE), None
+
+async def build_overall_summary(summary_source: list, total_comments: int, video_id: str = None) -> str:
+    """
+    สร้างสรุปแนวโน้มโดยรวมจากข้อความต้นฉบับของคอมเมนต์ที่ผ่านการกรองความยาว
+    video_id ใช้ให้การวิเคราะห์ซ้ำที่ชุดคอมเมนต์เปลี่ยนไปเล็กน้อยได้สรุปเดิมทันที
+    """
+    if not OPENAI_API_KEY_CHECK:
+        return "ไม่สามารถสร้างสรุปความคิดเห็นได้ (ไม่พบ OpenAI API Key)"
+    if not summary_source:
+        return f"ไม่มีความคิดเห็นที่สั้นพอสำหรับการวิเคราะห์จากทั้งหมด {total_comments} รายการ"
+    # เรียกใช้ OpenAI API เพื่อสรุปความคิดเห็น (ทุกคอมเมนต์ จัดเข้างบโทเค็น และใช้ map-reduce เมื่อมีจำนวนมาก)
+    with timed_stage("summarization"):
+        return await summarize_comments(summary_source, get_openai_client(), scope=video_id)
+
+async def analyze_video(video_id: str, input_url: str, channel_id: str = None, channel_url: str = None,
+                        sampling_mode: str = None, on_progress=None) -> dict:
+    """
+    วิเคราะห์ความคิดเห็นของวิดีโอหนึ่งรายการ (ดึงคอมเมนต์ → แปล → วิเคราะห์ Sentiment → สรุป)
+    แล้วคืนค่า context สำหรับ result.html (ไม่รวม request) ซึ่งแปลงเป็น JSON ได้ จึงเก็บเป็นผลของงานเบื้องหลังได้
+    on_progress(stage, count) ใช้รายงานความคืบหน้าของแต่ละขั้นตอน
+    """
+    with timed_stage("video_details"):
+        video_details = await fetch_video_details_by_id(video_id)
+    target_title = video_details.get("title", "ไม่พบชื่อวิดีโอ") if video_details else "ไม่พบชื่อวิดีโอ"
+    target_thumbnail = video_details.get("thumbnail", "https://placehold.co/480x360/E0E0E0/6C757D?text=No+Thumbnail") if video_details else "https://placehold.co/480x360/E0E0E0/6C757D?text=No+Thumbnail"
+    analysis_source_link = input_url
+    logger.debug("รายละเอียดวิดีโอ: ชื่อ=%r, Thumbnail=%r", target_title, target_thumbnail)
+
+    sampling_stats = {}
+    comment_pages, save_page = await select_comment_pages(video_id, sampling_mode, sampling_stats)
+    run_started_at = time.time()
+    pipeline_result = await run_comment_pipeline(comment_pages, get_openai_client(), on_page=save_page,
+                                           on_progress=on_progress)
+
+    new_comments_count = None
+    if save_page is not None:
+        # รวมผลของรอบนี้ (ทุกแถว รวมแถวที่ล้มเหลวซึ่งจะถูกวิเคราะห์ใหม่ครั้งถัดไป) กับผลเดิมที่เก็บไว้
+        new_comments_count = pipeline_result["total_comments"]
+        stored_rows = await comment_store.arecent_comments(video_id, limit=MAX_SUMMARY_SOURCE_COMMENTS,
+                                                           analyzed_before=run_started_at)
+        stored_totals = await comment_store.aget_video_totals(video_id)
+        pipeline_result.update(with_pending_counts(stored_totals, pipeline_result))
+        pipeline_result["comments"] = (pipeline_result["comments"] + [
+            {"text": row["text"], "sentiment": row["sentiment"]} for row in stored_rows
+        ])[:MAX_DISPLAY_COMMENTS]
+        pipeline_result["summary_source"] = (pipeline_result["summary_source"] + [
+            row["text"] for row in stored_rows if not row["skipped"]
+        ])[:MAX_SUMMARY_SOURCE_COMMENTS]
+        logger.debug("วิเคราะห์คอมเมนต์ใหม่ %d รายการ รวมที่เก็บไว้ %d รายการ",
+                     new_comments_count, pipeline_result["total_comments"])
+    comments_for_template = pipeline_result["comments"]
+    positive_count = pipeline_result["positive_count"]
+    negative_count = pipeline_result["negative_count"]
+    neutral_count = pipeline_result["neutral_count"]
+    total_comments = pipeline_result["total_comments"]
+    total_comments_analyzed = pipeline_result["total_comments_analyzed"]
+    total_comments_skipped_by_length = pipeline_result["total_comments_skipped_by_length"]
+    original_comments_to_display = pipeline_result["summary_source"]
+
+    if total_comments:
+        overall_summary = await build_overall_summary(original_comments_to_display, total_comments, video_id)
+
+        logger.debug("สรุปผลการวิเคราะห์ %s", video_id, extra={
+            "total_comments": total_comments, "positive_count": positive_count, "negative_count": negative_count,
+            "neutral_count": neutral_count, "analyzed": total_comments_analyzed,
+            "skipped_by_length": total_comments_skipped_by_length,
+        })
 
-    encoded_text = encoding.encode(text)
-    
-    if len(encoded_text) > max_tokens:
-        truncated_encoded_text = encoded_text[:max_tokens]
-        truncated_text = encoding.decode(truncated_encoded_text)
-        # เพิ่ม ... เพื่อบ่งชี้ว่าข้อความถูกตัด
-        return truncated_text + "..."
-    return text
-
-# --- ฟังก์ชันสำหรับสรุปข้อความด้วย OpenAI API ---
-async def summarize_with_openai(text_to_summarize: str, openai_client: openai.AsyncOpenAI) -> str:
-    try:
-        response = await openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "คุณคือผู้ช่วยวิเคราะห์ความคิดเห็นของผู้ชมจาก YouTube "
-                        "โดยจะต้องสรุปแนวโน้มความรู้สึกหลัก (เชิงบวก/ลบ/เป็นกลาง) "
-                        "และประเด็นสำคัญที่ถูกพูดถึงในคอมเมนต์ โดยเขียนให้อ่านง่ายและเป็นทางการ"
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": (
-                        f"ต่อไปนี้คือความคิดเห็นของผู้ชมจากวิดีโอ YouTube :\n\n{text_to_summarize}\n\n"
-                        "โปรดสรุปภาพรวมของความคิดเห็นเหล่านี้ว่าโดยรวมมีแนวโน้มไปทางใด "
-                        "(เช่น ส่วนใหญ่ชื่นชอบ, เศร้า, มีการวิจารณ์ ฯลฯ) "
-                        "และมีประเด็นใดบ้างที่ถูกกล่าวถึงบ่อย โดยเขียนให้กระชับ ภายใน 100 คำ"
-                    )
-                }
-            ],
-            max_tokens=512,
-            temperature=0.5,  
-        )
-        result = response.choices[0].message.content.strip()
-        return result
-    except Exception as e:
-        print(f"เกิดข้อผิดพลาดระหว่างสรุปความคิดเห็น: {e}")
-        return "ไม่สามารถสรุปความคิดเห็นได้ในขณะนี้"
+    else:
+        overall_summary = "ไม่พบความคิดเห็นสำหรับวิดีโอนี้ หรือ API มีข้อจำกัด"
+        logger.debug("ไม่พบความคิดเห็นจาก YouTube สำหรับวิดีโอ %s", video_id)
+
+    return {
+        "analysis_mode": "video",
+        "input_url": input_url,
+        "video_title": target_title,
+        "video_thumbnail": target_thumbnail,
+        "analysis_source_link": analysis_source_link,
+        "comments": comments_for_template,
+        "positive_count": positive_count,
+        "negative_count": negative_count,
+        "neutral_count": neutral_count,
+        "total_comments": total_comments,
+        "overall_summary": overall_summary,
+        "comments_seen": sampling_stats.get("seen"),
+        "new_comments_count": new_comments_count,
+        "channel_id": channel_id,
+        "channel_url": channel_url 
+    }
+
+async def analyze_video_coalesced(video_id: str, input_url: str, channel_id: str = None, channel_url: str = None,
+                                  sampling_mode: str = None, on_progress=None) -> dict:
+    """
+    เหมือน analyze_video แต่คำขอที่มี video ID และพารามิเตอร์การวิเคราะห์เดียวกันจะใช้ผลร่วมกัน:
+    คำขอแรกวิเคราะห์จริง คำขอที่มาระหว่างนั้นรอผลเดียวกัน (และได้รับความคืบหน้าผ่าน on_progress)
+    """
+    key = (video_id, sampling_mode or COMMENT_SAMPLING_MODE, MAX_COMMENTS_TO_ANALYZE)
+    context = await analysis_flights.do(key, lambda notify: analyze_video(
+        video_id, input_url, channel_id, channel_url, sampling_mode, on_progress=notify
+    ), listener=on_progress)
+    # ลิงก์และช่องที่ผู้ใช้ส่งมาเป็นของแต่ละคำขอ ไม่ใช่ของคำขอที่วิเคราะห์จริง
+    return {**context, "input_url": input_url, "analysis_source_link": input_url,
+            "channel_id": channel_id, "channel_url": channel_url}
+
+@app.get("/healthz", response_class=JSONResponse)
+async def healthz():
+    """
+    readiness probe: ตอบ 200 เมื่อ warm-up เสร็จแล้ว (503 ระหว่าง warm-up) พร้อมเวลาที่ใช้ของแต่ละงาน
+    """
+    return JSONResponse(content=startup_status(), status_code=200 if is_ready() else 503)
+
+@app.get("/cache_stats", response_class=JSONResponse)
+async def cache_stats():
+    """
+    คืนค่าสถิติ hit/miss ของ cache คำแปล, cache ผลทำนาย, cache สรุป cache metadata และการรวมคำขอวิเคราะห์ซ้ำ สำหรับใช้ปรับขนาด cache
+    """
+    return JSONResponse(content={
+        "translation": translation_cache.stats(),
+        "sentiment": sentiment_cache.stats(),
+        "summary": summary_cache.stats(),
+        "metadata": metadata_stats(),
+        "coalescing": analysis_flights.stats(),
+    })
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    คืนค่า metric ในรูปแบบ Prometheus (เวลาของแต่ละขั้นตอน, เวลาของ request ออกไปยัง upstream, เวลาของ HTTP request)
+    """
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/rate_limits", response_class=JSONResponse)
+async def rate_limits():
+    """
+    คืนค่าสถานะของตัวจำกัดอัตราของแต่ละ upstream (ขีดจำกัด concurrency ปัจจุบัน, เวลาที่รอ, quota ที่ใช้ไป)
+    """
+    return JSONResponse(content=limiter_stats())
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
@@ -110,228 +277,92 @@ async def analyze(
     input_url: str = Form(...),
     analysis_mode: str = Form(...),
     channel_id: str = Form(None), # รับ channel_id เพิ่มเติม
-    channel_url: str = Form(None) # รับ channel_url เพิ่มเติม
+    channel_url: str = Form(None), # รับ channel_url เพิ่มเติม
+    sampling_mode: str = Form(None) # "head" หรือ "reservoir" (ค่าเริ่มต้นจาก COMMENT_SAMPLING_MODE)
 ):
-    print(f"DEBUG: รับคำขอวิเคราะห์แล้วสำหรับ URL: {input_url}, โหมด: {analysis_mode}")
-    # เพิ่มการ Debugging สำหรับ channel_id และ channel_url
-    print(f"DEBUG: channel_id ที่ได้รับ: {channel_id}")
-    print(f"DEBUG: channel_url ที่ได้รับ: {channel_url}")
+    logger.debug("รับคำขอวิเคราะห์ URL: %s, โหมด: %s, channel_id: %s, channel_url: %s",
+                 input_url, analysis_mode, channel_id, channel_url)
 
     if not YOUTUBE_API_KEY_CHECK:
-        print("ERROR: ไม่พบ YouTube API Key.")
+        logger.error("ไม่พบ YouTube API Key")
         return templates.TemplateResponse("error.html", {
             "request": request,
             "message": "ข้อผิดพลาด: ไม่พบ YouTube API Key โปรดตรวจสอบไฟล์ .env ของคุณ"
         }, status_code=500)
 
-    original_comments = []
-    sentiment_results = []
-    
-    positive_count = 0
-    negative_count = 0
-    neutral_count = 0
-    overall_summary = "" # จะถูกสร้างโดย OpenAI
-    video_title = "ไม่พบชื่อวิดีโอ"
-    video_thumbnail = ""
-
     try:
         if analysis_mode == "video":
             # ตรวจสอบว่าฟังก์ชันที่จำเป็นสำหรับการวิเคราะห์ Sentiment พร้อมใช้งานหรือไม่
-            if not all([fetch_comments_from_youtube, extract_video_id, fetch_video_details_by_id, translate_to_thai, clean_comments, predict_sentiment]):
+            if not all([iter_comment_pages, extract_video_id, fetch_video_details_by_id, run_comment_pipeline]):
                 return templates.TemplateResponse("error.html", {
                     "request": request,
                     "message": "ฟังก์ชันสำหรับการวิเคราะห์ Sentiment ยังไม่พร้อมใช้งาน โปรดตรวจสอบการนำเข้า"
                 }, status_code=500)
 
-            video_id = extract_video_id(input_url)
+            with timed_stage("url_parse"):
+                video_id = extract_video_id(input_url)
             if not video_id:
-                print(f"ERROR:ไม่พบ Video ID จาก URL: {input_url}")
+                logger.error("ไม่พบ Video ID จาก URL: %s", input_url)
                 return templates.TemplateResponse("error.html", {
                     "request": request,
                     "message": "ไม่พบ Video ID จาก URL ที่ให้มา กรุณาตรวจสอบลิงก์วิดีโอ YouTube"
                 }, status_code=400)
-            print(f"DEBUG: Video ID ที่ดึงได้: {video_id}")
-
-            video_details = fetch_video_details_by_id(video_id)
-            target_title = video_details.get("title", "ไม่พบชื่อวิดีโอ") if video_details else "ไม่พบชื่อวิดีโอ"
-            target_thumbnail = video_details.get("thumbnail", "https://placehold.co/480x360/E0E0E0/6C757D?text=No+Thumbnail") if video_details else "https://placehold.co/480x360/E0E0E0/6C757D?text=No+Thumbnail"
-            analysis_source_link = input_url
-            print(f"DEBUG:รายละเอียดวิดีโอ: ชื่อ='{target_title}', Thumbnail='{target_thumbnail}'")
-
-            original_comments_raw = fetch_comments_from_youtube(input_url, max_comments=200)
-            print(f"DEBUG:จำนวนความคิดเห็นที่ดึงมาจากYouTube (ดิบ): {len(original_comments_raw) if original_comments_raw else 0} รายการ")
-            
-            comments_for_template = []
-            positive_count = 0
-            negative_count = 0
-            neutral_count = 0
-            total_comments_analyzed = 0
-            total_comments_skipped_by_length = 0
-
-            if original_comments_raw:
-                # แก้ไข: เพิ่ม await และส่ง openai_client
-                translated_comments_raw = await translate_to_thai(original_comments_raw, openai_client)
-                print(f"DEBUG:จำนวนความคิดเห็นหลังการแปล: {len(translated_comments_raw)} รายการ")
-                
-                MAX_CHAR_LENGTH_FOR_SENTIMENT = 700 
-                
-                comments_to_process_translated = []
-                original_comments_to_display = []
-                
-                for i, translated_comment_text in enumerate(translated_comments_raw):
-                    current_original_comment = original_comments_raw[i] 
-                    
-                    if len(translated_comment_text) <= MAX_CHAR_LENGTH_FOR_SENTIMENT:
-                        comments_to_process_translated.append(translated_comment_text)
-                        original_comments_to_display.append(current_original_comment)
-                    else:
-                        total_comments_skipped_by_length += 1
-                        comments_for_template.append({
-                            "text": current_original_comment,
-                            "sentiment": "เกินขีดจำกัดความยาว (ข้าม)",
-                        })
-                
-                print(f"DEBUG:จำนวนความคิดเห็นที่ผ่านการกรองความยาวตัวอักษร (ที่จะนำไปวิเคราะห์): {len(comments_to_process_translated)}รายการ")
-                print(f"DEBUG:จำนวนความคิดเห็นที่ถูกข้ามเนื่องจากความยาว (ตัวอักษร): {total_comments_skipped_by_length} รายการ")
-
-                if comments_to_process_translated:
-                    cleaned_comments = clean_comments(comments_to_process_translated)
-                    print(f"DEBUG: จำนวนความคิดเห็นหลังการทำความสะอาด (ที่ผ่านการกรองแล้ว): {len(cleaned_comments)} รายการ")
-                    
-                    try:
-                        sentiment_results = predict_sentiment(cleaned_comments)
-                        print(f"DEBUG: จำนวนผลลัพธ์ Sentiment ที่ได้จาก predict_sentiment: {len(sentiment_results)}รายการ")
-                    except Exception as sentiment_err:
-                        print(f"ERROR: เกิดข้อผิดพลาดใน predict_sentiment: {sentiment_err}")
-                        sentiment_results = []
-                        print(f"DEBUG: sentiment_results ถูกตั้งเป็นค่าว่างเปล่าเนื่องจากข้อผิดพลาดใน predict_sentiment")
-
-                    for original_comment_text, sentiment_info in zip(original_comments_to_display, sentiment_results):
-                        if sentiment_info and 'label' in sentiment_info:
-                            sentiment_label = sentiment_info.get('label', 'unknown')
-                            comments_for_template.append({
-                                "text": original_comment_text,
-                                "sentiment": sentiment_label,
-                            })
-                            if sentiment_label == 'positive':
-                                positive_count += 1
-                            elif sentiment_label == 'negative':
-                                negative_count += 1
-                            elif sentiment_label == 'neutral':
-                                neutral_count += 1
-                            total_comments_analyzed += 1
-                        else:
-                            comments_for_template.append({
-                                "text": original_comment_text,
-                                "sentiment": "ไม่สามารถวิเคราะห์ได้",
-                            })
-                else:
-                    overall_summary = f"ไม่มีความคิดเห็นที่สั้นพอสำหรับการวิเคราะห์จากทั้งหมด {len(original_comments_raw)} รายการ"
-                    print("DEBUG: ไม่มีความคิดเห็นที่ผ่านการกรองความยาวตัวอักษร")
-                
-                # Combine comments for summarization
-                MAX_COMMENTS_FOR_SUMMARY = 100 
-                MAX_CHAR_LENGTH_FOR_SUMMARY_COMMENT = 120 
-
-                comments_for_openai_summary = []
-                for comment in original_comments_to_display[:MAX_COMMENTS_FOR_SUMMARY]:
-                    if len(comment) > MAX_CHAR_LENGTH_FOR_SUMMARY_COMMENT:
-                        comments_for_openai_summary.append(comment[:MAX_CHAR_LENGTH_FOR_SUMMARY_COMMENT] + "...")
-                    else:
-                        comments_for_openai_summary.append(comment)
-
-                comments_text_for_summary_raw = "\n".join(comments_for_openai_summary)
-                
-                MAX_INPUT_TOKENS_FOR_SUMMARY = 15000 
-                comments_text_for_summary = truncate_text_by_tokens(
-                    comments_text_for_summary_raw, MAX_INPUT_TOKENS_FOR_SUMMARY, "gpt-3.5-turbo"
-                )
-                print(f"DEBUG: ความยาวของข้อความสำหรับสรุปหลังการตัด (อักขระ): {len(comments_text_for_summary)}")
-
-                # เรียกใช้ OpenAI API เพื่อสรุปความคิดเห็น
-                if comments_text_for_summary and OPENAI_API_KEY_CHECK:
-                    overall_summary = await summarize_with_openai(
-                     comments_text_for_summary,
-                     openai_client
-                )
-
-                elif not OPENAI_API_KEY_CHECK:
-                    overall_summary = "ไม่สามารถสร้างสรุปความคิดเห็นได้ (ไม่พบ OpenAI API Key)"
-                else:
-                    overall_summary = "ไม่พบความคิดเห็นที่เพียงพอสำหรับสรุป"
-
-                print(f"DEBUG:สรุปผลการวิเคราะห์: Positive={positive_count}, Negative={negative_count}, Neutral={neutral_count}, Analyzed={total_comments_analyzed}, Skipped={total_comments_skipped_by_length}")
-                print(f"DEBUG:จำนวน comments_for_template ที่เตรียมไว้สำหรับ HTML (รวมที่ข้าม): {len(comments_for_template)}")
+            logger.debug("Video ID ที่ดึงได้: %s", video_id)
 
-            else:
-                overall_summary = "ไม่พบความคิดเห็นสำหรับวิดีโอนี้ หรือ API มีข้อจำกัด"
-                print("DEBUG:ไม่พบความคิดเห็นจาก YouTube ตั้งแต่แรก")
-
-            return templates.TemplateResponse("result.html", {
-                "request": request,
-                "analysis_mode": analysis_mode,
-                "input_url": input_url,
-                "video_title": target_title,
-                "video_thumbnail": target_thumbnail,
-                "analysis_source_link": analysis_source_link,
-                "comments": comments_for_template,
-                "positive_count": positive_count,
-                "negative_count": negative_count,
-                "neutral_count": neutral_count,
-                "total_comments": len(original_comments_raw) if original_comments_raw else 0,
-                "overall_summary": overall_summary,
-                "channel_id": channel_id,
-                "channel_url": channel_url 
-            })
+            context = await analyze_video_coalesced(video_id, input_url, channel_id, channel_url, sampling_mode)
+            with timed_stage("template_render"):
+                return templates.TemplateResponse("result.html", {"request": request, **context})
 
         elif analysis_mode == "channel":
-            print(f"DEBUG:เข้าสู่โหมดวิเคราะห์ Channel สำหรับ URL: {input_url}")
-            channel_id = extract_channel_id(input_url)
+            with timed_stage("url_parse"):
+                channel_id = await extract_channel_id(input_url)
             if not channel_id:
-                print(f"ERROR:ไม่พบ Channel ID จาก URL: {input_url}")
+                logger.error("ไม่พบ Channel ID จาก URL: %s", input_url)
                 return templates.TemplateResponse("error.html", {
                     "request": request,
                     "message": "ไม่พบ Channel ID จาก URL ที่ให้มา กรุณาตรวจสอบลิงก์ช่อง YouTube"
                 }, status_code=400)
-            print(f"DEBUG: Channel ID ที่ดึงได้: {channel_id}")
-            
-            channel_details = fetch_channel_details(channel_id)
+            logger.debug("Channel ID ที่ดึงได้: %s", channel_id)
+
+            with timed_stage("channel_details"):
+                channel_details = await fetch_channel_details(channel_id)
             if not channel_details:
-                print(f"ERROR:ไม่พบข้อมูลช่อง YouTube สำหรับ Channel ID: {channel_id}")
+                logger.error("ไม่พบข้อมูลช่อง YouTube สำหรับ Channel ID: %s", channel_id)
                 return templates.TemplateResponse("error.html", {
                     "request": request,
                     "message": "ไม่พบข้อมูลช่อง YouTube นี้ กรุณาตรวจสอบ Channel ID หรือ URL"
                 }, status_code=404)
-            print(f"DEBUG:ดึงข้อมูลช่อง: {channel_details.get('channel_name', 'ไม่ระบุ')}") 
 
             # ดึงวิดีโอชุดแรก (50 คลิป) - fetch_channel_videos ตอนนี้คืนค่าเป็น list ของวิดีโอทั้งหมด
-            all_videos, next_page_token = fetch_channel_videos(channel_id, max_results_per_page=50) # ใช้ 50 เป็นค่าเริ่มต้น
-            print(f"DEBUG: ดึงวิดีโอช่องได้: {len(all_videos)} รายการ")
-            
-            return templates.TemplateResponse("channel_videos.html", {
-                "request": request,
-                "channel_details": channel_details,
-                "all_videos": all_videos, # ส่งลิสต์วิดีโอทั้งหมด
-                "next_page_token": next_page_token,
-                "channel_id": channel_id,
-                "channel_url": input_url
-            })
+            with timed_stage("channel_videos"):
+                all_videos, next_page_token = await fetch_channel_videos(channel_id, max_results_per_page=50) # ใช้ 50 เป็นค่าเริ่มต้น
+            logger.debug("ดึงวิดีโอช่อง %s ได้ %d รายการ", channel_details.get("channel_name"), len(all_videos))
+
+            with timed_stage("template_render"):
+                return templates.TemplateResponse("channel_videos.html", {
+                    "request": request,
+                    "channel_details": channel_details,
+                    "all_videos": all_videos, # ส่งลิสต์วิดีโอทั้งหมด
+                    "next_page_token": next_page_token,
+                    "channel_id": channel_id,
+                    "channel_url": input_url
+                })
 
         else:
-            print(f"ERROR:โหมดการวิเคราะห์ไม่ถูกต้อง: {analysis_mode}")
+            logger.error("โหมดการวิเคราะห์ไม่ถูกต้อง: %s", analysis_mode)
             return templates.TemplateResponse("error.html", {
                 "request": request,
                 "message": "โหมดการวิเคราะห์ไม่ถูกต้อง กรุณาเลือก 'video' หรือ 'channel'"
             }, status_code=400)
 
     except ValueError as e:
-        print(f"ERROR: ข้อผิดพลาด ValueError ขณะประมวลผล: {e}")
+        logger.error("ข้อผิดพลาด ValueError ขณะประมวลผล: %s", e)
         return templates.TemplateResponse("error.html", {
             "request": request,
             "message": f"ข้อผิดพลาดในการดึงข้อมูลหรือประมวลผล: {e}"
         }, status_code=400)
     except Exception as e:
-        print(f"CRITICAL ERROR: เกิดข้อผิดพลาดที่ไม่คาดคิดขณะประมวลผลใน /analyze: {e}") 
+        logger.exception("เกิดข้อผิดพลาดที่ไม่คาดคิดขณะประมวลผลใน /analyze: %s", e)
         return templates.TemplateResponse("error.html", {
             "request": request,
             "message": f"เกิดข้อผิดพลาดขณะประมวลผล: {e}"
@@ -344,46 +375,50 @@ async def get_channel_videos(request: Request, channel_url: str = Form(...)):
     """
     API endpoint สำหรับแสดงวิดีโอเริ่มต้นของช่อง YouTube
     """
-    print(f"DEBUG: รับคำขอแสดงวิดีโอช่องสำหรับ URL: {channel_url}") 
+    logger.debug("รับคำขอแสดงวิดีโอช่องสำหรับ URL: %s", channel_url)
     
     if not YOUTUBE_API_KEY_CHECK:
-        print("ERROR: ไม่พบ YouTube API Key ใน /get_channel_videos.")
+        logger.error("ไม่พบ YouTube API Key ใน /get_channel_videos")
         return templates.TemplateResponse("error.html", { 
             "request": request,
             "message": "ข้อผิดพลาด: ไม่พบ YouTube API Key โปรดตรวจสอบไฟล์ .env ของคุณ"
         }, status_code=500)
 
     try:
-        channel_id = extract_channel_id(channel_url)
+        with timed_stage("url_parse"):
+            channel_id = await extract_channel_id(channel_url)
         if not channel_id:
             return templates.TemplateResponse("error.html", {
                 "request": request,
                 "message": "ไม่พบ Channel ID จาก URL ที่ให้มา กรุณาตรวจสอบลิงก์ช่อง YouTube"
             }, status_code=400)
-        print(f"DEBUG: Channel ID ที่ดึงได้: {channel_id}") 
+        logger.debug("Channel ID ที่ดึงได้: %s", channel_id)
 
-        channel_details = fetch_channel_details(channel_id)
+        with timed_stage("channel_details"):
+            channel_details = await fetch_channel_details(channel_id)
         if not channel_details:
-            print(f"ERROR:ไม่พบข้อมูลช่อง YouTube สำหรับ Channel ID: {channel_id}")
+            logger.error("ไม่พบข้อมูลช่อง YouTube สำหรับ Channel ID: %s", channel_id)
             return templates.TemplateResponse("error.html", {
                 "request": request,
                 "message": "ไม่พบข้อมูลช่อง YouTube นี้ กรุณาตรวจสอบ Channel ID หรือ URL"
             }, status_code=404)
 
-        all_videos, next_page_token = fetch_channel_videos(channel_id, max_results_per_page=50) 
-        print(f"DEBUG: ดึงวิดีโอช่องได้: {len(all_videos)} รายการ, Next Page Token: {next_page_token}") 
-        
-        return templates.TemplateResponse("channel_videos.html", {
-            "request": request,
-            "channel_details": channel_details,
-            "all_videos": all_videos, 
-            "next_page_token": next_page_token,
-            "channel_id": channel_id,
-            "channel_url": channel_url
-        })
+        with timed_stage("channel_videos"):
+            all_videos, next_page_token = await fetch_channel_videos(channel_id, max_results_per_page=50)
+        logger.debug("ดึงวิดีโอช่องได้ %d รายการ, Next Page Token: %s", len(all_videos), next_page_token)
+
+        with timed_stage("template_render"):
+            return templates.TemplateResponse("channel_videos.html", {
+                "request": request,
+                "channel_details": channel_details,
+                "all_videos": all_videos,
+                "next_page_token": next_page_token,
+                "channel_id": channel_id,
+                "channel_url": channel_url
+            })
 
     except Exception as e:
-        print(f"CRITICAL ERROR: เกิดข้อผิดพลาดที่ไม่คาดคิดขณะแสดงวิดีโอช่องใน /get_channel_videos: {e}") 
+        logger.exception("เกิดข้อผิดพลาดที่ไม่คาดคิดขณะแสดงวิดีโอช่องใน /get_channel_videos: %s", e)
         return templates.TemplateResponse("error.html", { 
             "request": request,
             "message": f"เกิดข้อผิดพลาดในการแสดงวิดีโอช่อง: {e}"
@@ -396,7 +431,7 @@ async def load_more_channel_videos(channel_id: str, page_token: str = Query(None
         page_token = None
 
     try:
-        all_videos, new_next_token = fetch_channel_videos(channel_id, max_results_per_page=50, page_token=page_token)
+        all_videos, new_next_token = await fetch_channel_videos(channel_id, max_results_per_page=50, page_token=page_token)
         return JSONResponse(content={
             "all_videos": all_videos,
             "next_page_token": new_next_token or ""
@@ -405,14 +440,192 @@ async def load_more_channel_videos(channel_id: str, page_token: str = Query(None
         return JSONResponse(content={"error": f"เกิดข้อผิดพลาดในการโหลดวิดีโอเพิ่มเติม: {e}"}, status_code=500)
 
 
+@app.post("/analyze_stream")
+async def analyze_stream(
+    input_url: str = Form(...),
+    sampling_mode: str = Form(None) # "head" หรือ "reservoir" (ค่าเริ่มต้นจาก COMMENT_SAMPLING_MODE)
+):
+    """
+    วิเคราะห์ความคิดเห็นของวิดีโอแล้วส่งผลกลับแบบ NDJSON (หนึ่ง event ต่อบรรทัด) ทันทีที่แต่ละหน้าวิเคราะห์เสร็จ:
+    - {"type": "metadata", ...} ข้อมูลวิดีโอ
+    - {"type": "comments", "rows": [{"text", "sentiment"}], "counts": {...}} คอมเมนต์ชุดหนึ่ง + ยอดรวมถึงตอนนี้
+      (ถ้ามีผลที่เก็บไว้จากการวิเคราะห์ครั้งก่อน จะถูกส่งเป็นชุดแรก โดยมี "stored": true)
+    - {"type": "summary", "summary": ..., "counts": {...}} สรุปภาพรวมและยอดรวมสุดท้าย
+    - {"type": "error", "message": ...} เมื่อเกิดข้อผิดพลาด
+    """
+    if not YOUTUBE_API_KEY_CHECK:
+        return JSONResponse(content={"error": "ไม่พบ YouTube API Key โปรดตรวจสอบไฟล์ .env ของคุณ"}, status_code=500)
+    video_id = extract_video_id(input_url)
+    if not video_id:
+        return JSONResponse(content={"error": "ไม่พบ Video ID จาก URL ที่ให้มา กรุณาตรวจสอบลิงก์วิดีโอ YouTube"}, status_code=400)
+
+    def ndjson(event: dict) -> str:
+        return json.dumps(event, ensure_ascii=False) + "\n"
+
+    async def events():
+        try:
+            video_details = await fetch_video_details_by_id(video_id)
+            yield ndjson({"type": "metadata", "video_id": video_id, "input_url": input_url,
+                          "video_title": video_details.get("title", "ไม่พบชื่อวิดีโอ"),
+                          "video_thumbnail": video_details.get("thumbnail", "")})
+
+            sampling_stats = {}
+            comment_pages, save_page = await select_comment_pages(video_id, sampling_mode, sampling_stats)
+            tally = new_tally()
+            summary_sample = SummarySample() # คอมเมนต์ของรอบนี้ (ใหม่กว่า) ก่อนคอมเมนต์ที่เก็บไว้
+            stored_summary_source = []
+            if save_page is not None:
+                stored_rows = await comment_store.arecent_comments(video_id, limit=MAX_DISPLAY_COMMENTS)
+                if stored_rows:
+                    stored_totals = await comment_store.aget_video_totals(video_id) or {}
+                    tally.update({key: value for key, value in stored_totals.items() if key in tally})
+                    stored_summary_source = [row["text"] for row in stored_rows if not row["skipped"]]
+                    yield ndjson({"type": "comments", "stored": True,
+                                  "rows": [{"text": row["text"], "sentiment": row["sentiment"]} for row in stored_rows],
+                                  "counts": dict(tally)})
+
+            async for batch in stream_comment_pipeline(comment_pages, get_openai_client()):
+                if save_page is not None:
+                    await save_page(batch)
+                tally_batch(batch, tally)
+                summary_sample.extend(batch.summary_texts())
+                yield ndjson({"type": "comments", "rows": batch.display_rows(), "counts": dict(tally)})
+
+            if tally["total_comments"]:
+                summary_source = (summary_sample.texts + stored_summary_source)[:MAX_SUMMARY_SOURCE_COMMENTS]
+                overall_summary = await build_overall_summary(summary_source, tally["total_comments"], video_id)
+            else:
+                overall_summary = "ไม่พบความคิดเห็นสำหรับวิดีโอนี้ หรือ API มีข้อจำกัด"
+            yield ndjson({"type": "summary", "summary": overall_summary, "counts": dict(tally),
+                          "comments_seen": sampling_stats.get("seen")})
+        except Exception as e:
+            logger.exception("เกิดข้อผิดพลาดระหว่างส่งผลแบบ stream ใน /analyze_stream: %s", e)
+            yield ndjson({"type": "error", "message": f"เกิดข้อผิดพลาดขณะประมวลผล: {e}"})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.post("/analyze_channel")
+async def analyze_channel(
+    channel_id: str = Form(...),
+    max_videos: int = Form(CHANNEL_DEFAULT_MAX_VIDEOS),
+    published_after: str = Form(None), # YYYY-MM-DD
+    published_before: str = Form(None) # YYYY-MM-DD
+):
+    """
+    วิเคราะห์ Sentiment ของวิดีโอล่าสุดหลายรายการของช่อง แล้วส่งผลกลับแบบ NDJSON (หนึ่ง event ต่อบรรทัด)
+    ทันทีที่แต่ละวิดีโอวิเคราะห์เสร็จ
+    """
+    logger.debug("รับคำขอวิเคราะห์ทั้งช่อง: %s, วิดีโอ=%s, ช่วงวันที่=%s..%s",
+                 channel_id, max_videos, published_after, published_before)
+
+    async def events():
+        try:
+            async for event in stream_channel_analysis(
+                channel_id, get_openai_client(), max_videos=max_videos,
+                published_after=published_after or None, published_before=published_before or None
+            ):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.exception("เกิดข้อผิดพลาดระหว่างวิเคราะห์ทั้งช่อง: %s", e)
+            yield json.dumps({"type": "error", "message": f"เกิดข้อผิดพลาดในการวิเคราะห์ทั้งช่อง: {e}"}, ensure_ascii=False) + "\n"
+
+    if not YOUTUBE_API_KEY_CHECK:
+        return JSONResponse(content={"error": "ไม่พบ YouTube API Key โปรดตรวจสอบไฟล์ .env ของคุณ"}, status_code=500)
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+# --- Background jobs: ส่งงานวิเคราะห์แล้วติดตามความคืบหน้า แทนการรอ /analyze จนเสร็จใน request เดียว ---
+
+@app.post("/jobs", response_class=JSONResponse)
+async def submit_analysis_job(
+    input_url: str = Form(...),
+    channel_id: str = Form(None),
+    channel_url: str = Form(None),
+    sampling_mode: str = Form(None)
+):
+    """
+    ส่งงานวิเคราะห์วิดีโอเข้าคิวแล้วคืนค่า job ID ทันที
+    ติดตามความคืบหน้าได้จาก status_url (polling) หรือ events_url (server-sent events)
+    และเปิดหน้าผลลัพธ์ได้จาก result_url เมื่องานเสร็จ
+    """
+    if not YOUTUBE_API_KEY_CHECK:
+        return JSONResponse(content={"error": "ไม่พบ YouTube API Key โปรดตรวจสอบไฟล์ .env ของคุณ"}, status_code=500)
+    video_id = extract_video_id(input_url)
+    if not video_id:
+        return JSONResponse(content={"error": "ไม่พบ Video ID จาก URL ที่ให้มา กรุณาตรวจสอบลิงก์วิดีโอ YouTube"}, status_code=400)
+
+    job = job_queue.submit("video", lambda job: analyze_video_coalesced(
+        video_id, input_url, channel_id, channel_url, sampling_mode, on_progress=job.report_progress
+    ))
+    logger.debug("ส่งงานวิเคราะห์วิดีโอ %s เข้าคิวแล้ว (job %s)", video_id, job.id)
+    return JSONResponse(content={
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+        "result_url": f"/jobs/{job.id}/result",
+    }, status_code=202)
+
+@app.get("/jobs/{job_id}", response_class=JSONResponse)
+async def get_analysis_job(job_id: str):
+    """คืนค่าสถานะและความคืบหน้าของงาน (จำนวนคอมเมนต์ที่ผ่านแต่ละขั้นตอน)"""
+    snapshot = await job_queue.aget_snapshot(job_id)
+    if snapshot is None:
+        return JSONResponse(content={"error": "ไม่พบงานนี้"}, status_code=404)
+    return JSONResponse(content=snapshot)
+
+@app.get("/jobs/{job_id}/events")
+async def analysis_job_events(job_id: str):
+    """ส่งความคืบหน้าของงานแบบ server-sent events ทุกครั้งที่มีการเปลี่ยนแปลง จนกว่างานจะเสร็จ"""
+    if await job_queue.aget_snapshot(job_id) is None:
+        return JSONResponse(content={"error": "ไม่พบงานนี้"}, status_code=404)
+
+    async def events():
+        version = None
+        while True:
+            job = job_queue.get(job_id)
+            if job is None: # งานเสร็จไปนานแล้วและถูกลืมจากหน่วยความจำ
+                yield f"event: progress\ndata: {json.dumps(await job_queue.aget_snapshot(job_id))}\n\n"
+                return
+            if job.version != version:
+                version = job.version
+                yield f"event: progress\ndata: {json.dumps(job.snapshot())}\n\n"
+                if job.status in FINISHED_STATES:
+                    return
+            else:
+                yield ": keep-alive\n\n" # กันไม่ให้ proxy ตัดการเชื่อมต่อที่เงียบนานเกินไป
+            await job.wait_for_change(version, timeout=15)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/jobs/{job_id}/result", response_class=HTMLResponse)
+async def analysis_job_result(request: Request, job_id: str):
+    """แสดงผลของงานที่เสร็จแล้วด้วย result.html"""
+    snapshot = await job_queue.aget_snapshot(job_id)
+    if snapshot is None:
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "message": "ไม่พบผลการวิเคราะห์นี้ อาจหมดอายุแล้ว กรุณาวิเคราะห์ใหม่อีกครั้ง"
+        }, status_code=404)
+    if snapshot["status"] == JOB_FAILED:
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "message": f"เกิดข้อผิดพลาดขณะประมวลผล: {snapshot['error']}"
+        }, status_code=500)
+    context = await job_queue.aget_result(job_id)
+    if context is None:
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "message": "การวิเคราะห์ยังไม่เสร็จ กรุณารอสักครู่แล้วลองใหม่"
+        }, status_code=202)
+    return templates.TemplateResponse("result.html", {"request": request, **context})
+
+
 # Main entry point for running the Uvicorn server
 if __name__ == "__main__":
     # Add a startup check for API keys
     if not YOUTUBE_API_KEY_CHECK:
-        print("*****************************************************************")
-        print("WARNING: YouTube API Key is not set in your .env file.")
-        print("         Please get one from Google Cloud Console and add it:")
-        print("         YOUTUBE_API_KEY=YOUR_API_KEY_HERE")
-        print("*****************************************************************")
+        logger.warning("YouTube API Key is not set in your .env file. "
+                       "Please get one from Google Cloud Console and add it: YOUTUBE_API_KEY=YOUR_API_KEY_HERE")
     
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,98 @@
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from cache_store import TieredCache
+from youtube_client import get_youtube_client
+
+# --- ระยะเวลาที่ถือว่าข้อมูลยังใหม่อยู่ (ไม่ต้องถาม YouTube) แยกตามชนิดข้อมูล ---
+HANDLE_TTL_SECONDS = float(os.getenv("HANDLE_TTL_SECONDS", str(30 * 24 * 3600))) # handle → channel ID แทบไม่เปลี่ยน
+UNKNOWN_HANDLE_TTL_SECONDS = float(os.getenv("UNKNOWN_HANDLE_TTL_SECONDS", "3600")) # handle ที่หาไม่พบ
+UPLOADS_PLAYLIST_TTL_SECONDS = float(os.getenv("UPLOADS_PLAYLIST_TTL_SECONDS", str(30 * 24 * 3600))) # ไม่เปลี่ยนตลอดอายุช่อง
+CHANNEL_DETAILS_TTL_SECONDS = float(os.getenv("CHANNEL_DETAILS_TTL_SECONDS", "3600")) # ชื่อ รูป จำนวนผู้ติดตาม
+VIDEO_DETAILS_TTL_SECONDS = float(os.getenv("VIDEO_DETAILS_TTL_SECONDS", str(6 * 3600))) # ชื่อและปกคลิป
+# ข้อมูลที่เกินอายุข้างต้นแล้วยังเก็บไว้ได้นานเท่านี้ เพื่อตรวจซ้ำด้วย ETag (If-None-Match) แทนการดึงใหม่ทั้งหมด
+METADATA_MAX_AGE_SECONDS = float(os.getenv("METADATA_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+
+METADATA_CACHE_PATH = os.getenv(
+    "METADATA_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "metadata.sqlite3")
+) # ตั้งเป็นค่าว่างเพื่อใช้ cache ในหน่วยความจำอย่างเดียว
+metadata_cache = TieredCache(
+    "metadata",
+    max_entries=int(os.getenv("METADATA_CACHE_MAX_ENTRIES", "5000")),
+    ttl_seconds=METADATA_MAX_AGE_SECONDS,
+    db_path=METADATA_CACHE_PATH or None,
+)
+
+# จำนวนครั้งที่ตอบจาก cache โดยไม่ถาม YouTube, ตรวจซ้ำแล้วได้ 304, และดึงข้อมูลใหม่ทั้งหมด
+_counters = {"fresh_hits": 0, "revalidated": 0, "fetched": 0, "handle_hits": 0, "handle_misses": 0,
+             "uploads_playlist_hits": 0, "uploads_playlist_misses": 0}
+
+
+async def list_with_revalidation(entity: str, key: str, fresh_ttl: float, resource: str, **params) -> dict:
+    """
+    เรียก `<resource>.list` ผ่าน cache ของ metadata:
+    - ถ้าข้อมูลที่เก็บไว้อายุไม่เกิน fresh_ttl คืนค่าจาก cache เลย
+    - ถ้าเกินแล้ว ถาม YouTube พร้อม ETag เดิม ถ้าได้ 304 ใช้ข้อมูลเดิมต่อ ไม่เช่นนั้นเก็บข้อมูลใหม่
+    """
+    cache_key = f"{entity}:{key}"
+    entry = await metadata_cache.aget(cache_key)
+    now = time.time()
+    if entry is not None and now - entry["fetched_at"] < fresh_ttl:
+        _counters["fresh_hits"] += 1
+        return entry["response"]
+
+    youtube = get_youtube_client()
+    response, etag = await youtube.list_if_changed(resource, etag=entry["etag"] if entry else None, **params)
+    if response is None:
+        _counters["revalidated"] += 1
+        response = entry["response"]
+    else:
+        _counters["fetched"] += 1
+    await metadata_cache.aset(cache_key, {"etag": etag, "response": response, "fetched_at": now})
+    return response
+
+
+async def resolve_handle(identifier: str, resolve: Callable[[str], Awaitable[Optional[str]]]) -> Optional[str]:
+    """
+    คืนค่า Channel ID ของ handle/ชื่อผู้ใช้ จาก cache หรือเรียก resolve (แล้วเก็บผลไว้)
+    handle ที่หาไม่พบจะถูกจำไว้ UNKNOWN_HANDLE_TTL_SECONDS เพื่อไม่ให้ถาม YouTube ซ้ำ
+    """
+    cache_key = f"handle:{identifier.lower()}" # handle ของ YouTube ไม่แยกตัวพิมพ์เล็ก/ใหญ่
+    entry = await metadata_cache.aget(cache_key)
+    if entry is not None:
+        _counters["handle_hits"] += 1
+        return entry["channel_id"]
+
+    _counters["handle_misses"] += 1
+    channel_id = await resolve(identifier)
+    await metadata_cache.aset(cache_key, {"channel_id": channel_id},
+                             ttl_seconds=HANDLE_TTL_SECONDS if channel_id else UNKNOWN_HANDLE_TTL_SECONDS)
+    return channel_id
+
+
+def uploads_playlist_cache_key(channel_id: str) -> str:
+    return f"uploads:{channel_id}"
+
+
+async def resolve_uploads_playlist(channel_id: str, resolve: Callable[[str], Awaitable[Optional[str]]]) -> Optional[str]:
+    """
+    คืนค่า ID ของ uploads playlist ของช่อง จาก cache หรือเรียก resolve (แล้วเก็บผลไว้)
+    ช่องที่หา playlist ไม่พบจะถูกจำไว้ UNKNOWN_HANDLE_TTL_SECONDS เหมือน handle ที่หาไม่พบ
+    """
+    cache_key = uploads_playlist_cache_key(channel_id)
+    entry = await metadata_cache.aget(cache_key)
+    if entry is not None:
+        _counters["uploads_playlist_hits"] += 1
+        return entry["playlist_id"]
+
+    _counters["uploads_playlist_misses"] += 1
+    playlist_id = await resolve(channel_id)
+    await metadata_cache.aset(cache_key, {"playlist_id": playlist_id},
+                              ttl_seconds=UPLOADS_PLAYLIST_TTL_SECONDS if playlist_id else UNKNOWN_HANDLE_TTL_SECONDS)
+    return playlist_id
+
+
+def metadata_stats() -> Dict:
+    """คืนค่าสถิติของ cache metadata รวมจำนวนครั้งที่ตรวจซ้ำด้วย ETag"""
+    return {**metadata_cache.stats(), **_counters}
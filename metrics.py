@@ -0,0 +1,183 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# ขอบของ bucket (วินาที) ครอบคลุมตั้งแต่งานใน process (มิลลิวินาที) ถึง request ไปยัง LLM (หลายสิบวินาที)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Content-Type ของ Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """ตัวนับที่เพิ่มขึ้นอย่างเดียว แยกตามค่าของ label"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Histogram แบบสะสม (cumulative bucket) แยกตามค่าของ label เหมือน Prometheus client"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {} # labelvalues -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1 # เก็บแบบไม่สะสม แล้วค่อยรวมตอน collect
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labelvalues: list(series) for labelvalues, series in self._series.items()}
+        for labelvalues, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+REGISTRY: List = []
+
+
+def render_metrics() -> str:
+    """คืนค่า metric ทั้งหมดในรูปแบบ Prometheus text exposition format"""
+    return "\n".join(line for metric in REGISTRY for line in metric.collect()) + "\n"
+
+
+# --- Metric ของแอป ---
+STAGE_SECONDS = Histogram(
+    "analysis_stage_duration_seconds", "Time spent in each stage of a comment analysis.", ("stage",)
+)
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_duration_seconds", "Latency of outbound calls by upstream and method.",
+    ("upstream", "method", "status"),
+)
+UPSTREAM_REQUESTS = Counter(
+    "upstream_requests_total", "Outbound calls by upstream, method and result status.",
+    ("upstream", "method", "status"),
+)
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests served by the app.", ("method", "route", "status")
+)
+
+# เวลาของแต่ละขั้นตอนใน request ปัจจุบัน (None เมื่อไม่ได้อยู่ใน request เช่น งานเบื้องหลัง)
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """บันทึกเวลาของขั้นตอนลง histogram และลงเวลาของ request ปัจจุบัน (สำหรับ Server-Timing)"""
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        # ขั้นตอนที่ทำหลายรอบ (เช่น แปลทีละหน้า) จะถูกรวมเวลาเป็นรายการเดียว
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed_stage(stage: str) -> Iterator[None]:
+    """จับเวลาโค้ดภายใน with แล้วบันทึกเป็นขั้นตอน stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_upstream_call(upstream: str, method: str, status: str, seconds: float) -> None:
+    """บันทึกเวลาและผลของ request ออกไปยัง upstream หนึ่งครั้ง"""
+    UPSTREAM_SECONDS.observe(seconds, upstream, method, status)
+    UPSTREAM_REQUESTS.inc(upstream, method, status)
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """แปลงเวลาของแต่ละขั้นตอนเป็นค่าของ header Server-Timing (หน่วยมิลลิวินาที)"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware ที่จับเวลาทุก request (http_request_duration_seconds) และเพิ่ม header Server-Timing
+    ที่มีเวลาของขั้นตอนที่เสร็จก่อนเริ่มส่ง response (สำหรับ response แบบ stream จะมีเฉพาะขั้นตอนก่อนหน้าแรก)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                header = server_timing_header({**timings, "total": time.perf_counter() - start})
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            route = scope.get("route")
+            HTTP_SECONDS.observe(time.perf_counter() - start, scope["method"],
+                                 getattr(route, "path", "unmatched"), str(status_code))
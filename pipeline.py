@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+import random
+import asyncio
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, List, Dict, Optional
+
+import numpy as np
+
+from comment_batch import (CommentBatch, LABEL_NEGATIVE, LABEL_NEUTRAL, LABEL_POSITIVE, LABEL_SKIPPED,
+                           SENTIMENT_LABEL_CODES, STATUS_CLEANED, STATUS_TRANSLATED)
+from comment_batch import SKIPPED_BY_LENGTH_LABEL, UNANALYZABLE_LABEL # ให้ import จาก pipeline ได้เหมือนเดิม
+from translate_text import translate_to_thai
+from clean_text import clean_comments
+from predict_sentiment import predict_sentiment
+from fetch_comments import ReservoirSampler
+from metrics import record_stage, timed_stage
+
+if TYPE_CHECKING:
+    import openai  # ใช้เฉพาะใน type hint (openai ถูก import ตอนสร้าง client ดู main.get_openai_client)
+
+logger = logging.getLogger(__name__)
+
+# ความยาวสูงสุด (ตัวอักษร) ของข้อความที่แปลแล้วที่จะส่งไปวิเคราะห์ Sentiment
+MAX_CHAR_LENGTH_FOR_SENTIMENT = 700
+
+# หน่วยความจำของผลรวมไม่เพิ่มตามจำนวนคอมเมนต์: เก็บคอมเมนต์สำหรับแสดงผลเฉพาะ MAX_DISPLAY_COMMENTS รายการแรก
+# และสุ่มข้อความสำหรับสรุปไว้ไม่เกิน MAX_SUMMARY_SOURCE_COMMENTS รายการ (ส่วนที่เหลือนับรวมใน tally เท่านั้น)
+MAX_DISPLAY_COMMENTS = int(os.getenv("MAX_DISPLAY_COMMENTS", "500"))
+MAX_SUMMARY_SOURCE_COMMENTS = int(os.getenv("MAX_SUMMARY_SOURCE_COMMENTS", "2000"))
+
+# จำนวนหน้าที่รอได้ในแต่ละคิวระหว่าง stage (backpressure: ถ้าคิวเต็ม stage ก่อนหน้าจะรอ)
+DEFAULT_QUEUE_SIZE = 2
+
+# สัญญาณบอกว่า stage ก่อนหน้าทำงานเสร็จแล้ว
+_DONE = object()
+
+
+class _StageFailure:
+    """ห่อ exception จาก stage ใดๆ เพื่อส่งต่อไปจนถึงผู้อ่านผลลัพธ์ปลายทาง"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+# --- Stage functions: แต่ละฟังก์ชันรับคอมเมนต์หนึ่งหน้า (CommentBatch) แล้วเขียนคอลัมน์ของตัวเองลงไป ---
+
+async def _translate_page(batch: CommentBatch, openai_client: openai.AsyncOpenAI) -> CommentBatch:
+    """ตรวจจับภาษาและแปลคอมเมนต์ในหน้านั้นเป็นภาษาไทย"""
+    failed_indexes = []
+    batch.translations = await translate_to_thai(batch.texts, openai_client, failed_indexes=failed_indexes)
+    batch.status |= STATUS_TRANSLATED
+    batch.mark_translation_failed(failed_indexes)
+    return batch
+
+
+async def _clean_page(batch: CommentBatch) -> CommentBatch:
+    """กรองคอมเมนต์ที่ยาวเกินกำหนด แล้วทำความสะอาดข้อความที่เหลือ"""
+    lengths = np.fromiter(map(len, batch.translations), dtype=np.int64, count=len(batch))
+    too_long = lengths > MAX_CHAR_LENGTH_FOR_SENTIMENT
+    batch.mark_skipped(np.flatnonzero(too_long))
+    to_clean = np.flatnonzero(~too_long)
+
+    with timed_stage("cleaning"):
+        # งาน CPU (regex + normalize) รันใน thread แยก event loop จึงยังรับ request และดึงหน้าถัดไปได้
+        cleaned = await asyncio.to_thread(clean_comments, [batch.translations[index] for index in to_clean.tolist()])
+    batch.set_cleaned(to_clean, cleaned)
+    return batch
+
+
+async def _predict_page(batch: CommentBatch) -> CommentBatch:
+    """วิเคราะห์ Sentiment ของคอมเมนต์ที่ผ่านการทำความสะอาดแล้ว"""
+    to_predict = batch.indexes_with_status(STATUS_CLEANED)
+    if len(to_predict):
+        try:
+            with timed_stage("inference"):
+                results = await predict_sentiment([batch.cleaned[index] for index in to_predict.tolist()])
+        except Exception as sentiment_err:
+            logger.warning("เกิดข้อผิดพลาดใน predict_sentiment: %s", sentiment_err)
+            results = []
+        # แถวที่ไม่มีผล (results สั้นกว่า หรือเป็น None) ยังคงเป็น UNANALYZABLE_LABEL
+        batch.set_predictions(to_predict, results)
+    return batch
+
+
+# --- Pipeline runner ---
+
+# ชื่อขั้นตอนที่ใช้รายงานความคืบหน้า (on_progress)
+PROGRESS_STAGES = ("fetched", "translated", "cleaned", "analyzed")
+
+ProgressCallback = Callable[[str, int], None]
+
+
+async def _feed_pages(pages: AsyncIterator[List[dict]], outbox: asyncio.Queue,
+                      on_progress: Optional[ProgressCallback] = None) -> None:
+    """อ่านหน้าคอมเมนต์จาก YouTube แปลงเป็น CommentBatch แล้วส่งเข้าคิวแรกของ pipeline"""
+    try:
+        waiting_since = time.perf_counter()
+        async for page in pages:
+            # นับเฉพาะเวลาที่รอหน้าถัดไป (ไม่รวมเวลาที่รอคิวว่างจาก backpressure)
+            record_stage("comment_paging", time.perf_counter() - waiting_since)
+            if on_progress is not None:
+                on_progress("fetched", len(page))
+            await outbox.put(CommentBatch.from_rows(page))
+            waiting_since = time.perf_counter()
+    except Exception as e:
+        await outbox.put(_StageFailure(e))
+        return
+    await outbox.put(_DONE)
+
+
+async def _run_stage(stage, inbox: asyncio.Queue, outbox: asyncio.Queue,
+                     on_done: Optional[Callable[[int], None]] = None) -> None:
+    """วนอ่านหน้าจากคิวขาเข้า ประมวลผลด้วย stage แล้วส่งต่อไปยังคิวขาออก"""
+    while True:
+        page = await inbox.get()
+        if page is _DONE or isinstance(page, _StageFailure):
+            await outbox.put(page)
+            return
+        try:
+            page = await stage(page)
+        except Exception as e:
+            await outbox.put(_StageFailure(e))
+            return
+        if on_done is not None:
+            on_done(len(page))
+        await outbox.put(page)
+
+
+async def stream_comment_pipeline(
+    pages: AsyncIterator[List[dict]],
+    openai_client: openai.AsyncOpenAI,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    on_progress: Optional[ProgressCallback] = None,
+) -> AsyncIterator[CommentBatch]:
+    """
+    รันขั้นตอน ดึงคอมเมนต์ → ตรวจจับภาษา/แปล → ทำความสะอาด → วิเคราะห์ Sentiment
+    แบบ pipeline ที่เชื่อมกันด้วยคิวขนาดจำกัด (bounded asyncio.Queue)
+    หน้าถัดไปจาก YouTube จะถูกดึงระหว่างที่หน้าก่อนหน้ากำลังถูกแปลหรือวิเคราะห์อยู่
+    และคืนค่าผลลัพธ์ทีละหน้า (CommentBatch) ตามลำดับที่ดึงมา
+    on_progress(stage, count) จะถูกเรียกเมื่อแต่ละขั้นตอนประมวลผลหน้าหนึ่งเสร็จ (stage อยู่ใน PROGRESS_STAGES)
+    """
+    stages = [
+        lambda page: _translate_page(page, openai_client),
+        _clean_page,
+        _predict_page,
+    ]
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+
+    tasks = [asyncio.create_task(_feed_pages(pages, queues[0], on_progress))]
+    for index, stage in enumerate(stages):
+        on_done = None
+        if on_progress is not None:
+            on_done = lambda count, name=PROGRESS_STAGES[index + 1]: on_progress(name, count)
+        tasks.append(asyncio.create_task(_run_stage(stage, queues[index], queues[index + 1], on_done)))
+
+    try:
+        while True:
+            page = await queues[-1].get()
+            if page is _DONE:
+                break
+            if isinstance(page, _StageFailure):
+                raise page.error
+            yield page
+    finally:
+        # ยกเลิก stage ที่ยังค้างอยู่ (เช่น เมื่อเกิดข้อผิดพลาดหรือผู้เรียกหยุดอ่านกลางทาง)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def new_tally() -> Dict[str, int]:
+    """ตัวนับเริ่มต้นสำหรับ tally_batch"""
+    return {"positive_count": 0, "negative_count": 0, "neutral_count": 0,
+            "total_comments": 0, "total_comments_analyzed": 0, "total_comments_skipped_by_length": 0}
+
+
+def tally_batch(batch: CommentBatch, tally: Dict[str, int], rows: Optional[np.ndarray] = None) -> None:
+    """
+    นับจำนวนคอมเมนต์ของแต่ละ sentiment ในหน้าที่ผ่าน pipeline แล้ว (np.bincount ของรหัส label) เพิ่มลงใน tally
+    rows: นับเฉพาะแถวเหล่านี้ (mask หรือ index) ถ้าระบุ
+    """
+    counts = batch.label_counts(rows)
+    tally["total_comments"] += int(counts.sum())
+    tally["positive_count"] += int(counts[LABEL_POSITIVE])
+    tally["negative_count"] += int(counts[LABEL_NEGATIVE])
+    tally["neutral_count"] += int(counts[LABEL_NEUTRAL])
+    tally["total_comments_analyzed"] += int(counts[list(SENTIMENT_LABEL_CODES)].sum())
+    tally["total_comments_skipped_by_length"] += int(counts[LABEL_SKIPPED])
+
+
+class SummarySample:
+    """
+    ข้อความต้นฉบับสำหรับสรุป ไม่เกิน limit รายการ: เก็บทุกรายการจนครบ limit แล้วสุ่มแบบ uniform ด้วย reservoir sampling
+    ใช้ seed คงที่ ชุดคอมเมนต์เดิมจึงได้ตัวอย่างเดิม (fingerprint ของ cache สรุปไม่เปลี่ยน)
+    """
+
+    def __init__(self, limit: int = MAX_SUMMARY_SOURCE_COMMENTS):
+        self._sampler = ReservoirSampler(limit, random.Random(0))
+
+    def extend(self, texts: List[str]) -> None:
+        for text in texts:
+            self._sampler.add(text)
+
+    @property
+    def texts(self) -> List[str]:
+        return self._sampler.items
+
+
+async def run_comment_pipeline(pages: AsyncIterator[List[dict]], openai_client: openai.AsyncOpenAI,
+                               on_page: Optional[Callable[[CommentBatch], Awaitable[None]]] = None,
+                               on_progress: Optional[ProgressCallback] = None) -> Dict:
+    """
+    รัน stream_comment_pipeline จนจบแล้วรวมผลลัพธ์สำหรับแสดงใน result.html
+    คืนค่า dict ที่มีคอมเมนต์สำหรับ template (ไม่เกิน MAX_DISPLAY_COMMENTS รายการแรก), จำนวนแต่ละ sentiment
+    และตัวอย่างข้อความต้นฉบับของคอมเมนต์ที่ผ่านการกรองความยาว (ไม่เกิน MAX_SUMMARY_SOURCE_COMMENTS รายการ ใช้สำหรับสรุป)
+    on_page จะถูก await กับแต่ละหน้าที่วิเคราะห์เสร็จ (เช่น เพื่อบันทึกผลรายคอมเมนต์)
+    pending_counts คือยอดของแถวที่ยังไม่ได้ผลสุดท้าย (ดู CommentBatch.final_rows) ซึ่งที่เก็บผลไม่นับในยอดรวม
+    """
+    comments_for_template = []
+    summary_sample = SummarySample()
+    tally = new_tally()
+    pending_counts = new_tally()
+
+    async for batch in stream_comment_pipeline(pages, openai_client, on_progress=on_progress):
+        if on_page is not None:
+            await on_page(batch)
+        tally_batch(batch, tally)
+        tally_batch(batch, pending_counts, ~batch.final_rows())
+        if len(comments_for_template) < MAX_DISPLAY_COMMENTS:
+            comments_for_template.extend(batch.display_rows()[:MAX_DISPLAY_COMMENTS - len(comments_for_template)])
+        summary_sample.extend(batch.summary_texts())
+
+    return {
+        "comments": comments_for_template,
+        "summary_source": summary_sample.texts,
+        "pending_counts": pending_counts,
+        **tally,
+    }
+
+
+def with_pending_counts(stored_totals: Optional[Dict], pipeline_result: Dict) -> Dict:
+    """
+    ยอดรวมที่เก็บไว้ (เฉพาะผลสุดท้าย) บวกแถวของรอบนี้ที่ยังไม่ได้ผลสุดท้าย
+    ผลของรอบนี้จึงถูกนับครบทุกแถวแม้บางแถวจะถูกเก็บเป็น failed เพื่อวิเคราะห์ใหม่ครั้งถัดไป
+    """
+    if stored_totals is None:
+        return {key: pipeline_result[key] for key in pipeline_result["pending_counts"]}
+    totals = dict(stored_totals)
+    for key, value in pipeline_result["pending_counts"].items():
+        totals[key] = totals.get(key, 0) + value
+    return totals
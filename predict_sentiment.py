@@ -1,69 +1,298 @@
+import logging
 import os
-import requests # เราจะใช้ไลบรารี requests ในการคุยกับ API
-from typing import List, Dict
+import random
+import asyncio
+import httpx # ใช้ AsyncClient ที่มี connection pool ร่วมกันในการคุยกับ API
+from typing import List, Dict, Optional
 from dotenv import load_dotenv
+from cache_store import TieredCache, make_cache_key # cache ผลทำนายแบบ LRU (+ SQLite ถ้าตั้งค่า)
+from sentiment_backends import SentimentBackend, LocalTransformersBackend, id2label, scores_to_result
+from batch_scheduler import MicroBatcher # รวมข้อความจากหลาย request เป็น batch เดียวก่อนส่งไปทำนาย
+from rate_limiter import hf_limiter # จำกัดอัตราและ concurrency ของ Hugging Face Inference API
+
+logger = logging.getLogger(__name__)
 
 # --- 1. ตั้งค่าการเชื่อมต่อ API ---
 load_dotenv()
 
 # URL ของ "โรงงาน" (โมเดลของคุณบน Hugging Face)
-API_URL = "https://api-inference.huggingface.co/models/patipathdev/wangchanberta-thai-sentiment"
+MODEL_ID = "patipathdev/wangchanberta-thai-sentiment"
+HF_API_BASE_URL = os.getenv("HF_API_BASE_URL", "https://api-inference.huggingface.co") # เปลี่ยนได้เพื่อชี้ไปยัง server จำลอง
+API_URL = f"{HF_API_BASE_URL}/models/{MODEL_ID}"
 
 # "กุญแจ" สำหรับยืนยันตัวตน ดึงมาจาก Environment Variable
 HF_TOKEN = os.getenv("HF_TOKEN")
 headers = {"Authorization": f"Bearer {HF_TOKEN}"}
 
-# กำหนด Mapping ของ Label (เหมือนเดิม)
-id2label = {0: "negative", 1: "neutral", 2: "positive"}
+# เลือก backend สำหรับทำนาย: "remote" (Hugging Face Inference API) หรือ "local" (โมเดลบน CPU ในเครื่อง)
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "remote").lower()
+SENTIMENT_MODEL_PATH = os.getenv("SENTIMENT_MODEL_PATH", "")
+SENTIMENT_NUM_THREADS = int(os.getenv("SENTIMENT_NUM_THREADS", "0")) or None
+
+# --- การตั้งค่าการแบ่งส่ง (chunk) และการลองใหม่ (retry) ---
+MAX_TEXTS_PER_CHUNK = 32 # จำนวนข้อความสูงสุดต่อ request
+MAX_CHARS_PER_CHUNK = 8000 # จำนวนตัวอักษรรวมสูงสุดต่อ request (กัน payload ใหญ่เกิน)
+MAX_CONCURRENT_CHUNKS = 4 # จำนวน request ที่ส่งพร้อมกันได้สูงสุด
+MAX_RETRIES = 4 # จำนวนครั้งที่ลองใหม่เมื่อเจอข้อผิดพลาดชั่วคราว
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 10.0
+# สถานะที่ถือว่าเป็นข้อผิดพลาดชั่วคราว (เช่น 503 = โมเดลกำลังโหลด, 429 = ส่งถี่เกินไป)
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# --- การรวม batch ข้าม request (micro-batching) ---
+SENTIMENT_BATCH_MAX_ITEMS = int(os.getenv("SENTIMENT_BATCH_MAX_ITEMS", str(MAX_TEXTS_PER_CHUNK)))
+SENTIMENT_BATCH_MAX_WAIT_MS = float(os.getenv("SENTIMENT_BATCH_MAX_WAIT_MS", "15"))
+
+# --- Cache ผลทำนาย (key = ข้อความที่ทำความสะอาดแล้ว + model ID) ---
+sentiment_cache = TieredCache(
+    "sentiment",
+    max_entries=int(os.getenv("SENTIMENT_CACHE_MAX_ENTRIES", "50000")),
+    ttl_seconds=float(os.getenv("SENTIMENT_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    db_path=os.getenv("SENTIMENT_CACHE_PATH") or None, # ตั้ง path เพื่อเก็บ cache ลงดิสก์ด้วย
+)
+
+
+def sentiment_cache_key(cleaned_text: str, model_id: str = MODEL_ID) -> str:
+    """สร้าง key ของ cache ผลทำนายสำหรับข้อความที่ทำความสะอาดแล้ว"""
+    return make_cache_key(cleaned_text, model_id)
+
+
+_hf_client: Optional[httpx.AsyncClient] = None
 
 
-def query_hf_api(payload: dict) -> list:
+def get_hf_client() -> httpx.AsyncClient:
+    """คืนค่า httpx.AsyncClient ตัวเดียวที่ใช้ร่วมกันทั้ง process (keep-alive connection pool)"""
+    global _hf_client
+    if _hf_client is None or _hf_client.is_closed:
+        _hf_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(max_connections=MAX_CONCURRENT_CHUNKS * 2, max_keepalive_connections=MAX_CONCURRENT_CHUNKS),
+        )
+    return _hf_client
+
+
+async def close_hf_client() -> None:
+    """ปิด client ที่ใช้ร่วมกัน (เรียกจาก lifespan ของ FastAPI)"""
+    global _hf_client
+    if _hf_client is not None:
+        await _hf_client.aclose()
+        _hf_client = None
+
+
+def _backoff_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """คำนวณเวลารอก่อนลองใหม่แบบ exponential backoff + full jitter"""
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+    if response is None:
+        return delay
+    try:
+        # 429/503 อาจบอกเวลาที่ควรรอมาใน header Retry-After (หน่วยวินาที)
+        delay = max(delay, min(float(response.headers["Retry-After"]), BACKOFF_MAX_SECONDS))
+    except (KeyError, ValueError):
+        pass
+    if response.status_code == 503:
+        # ขณะโมเดลกำลังโหลด API จะบอกเวลาที่คาดว่าจะพร้อม (estimated_time)
+        try:
+            estimated_time = float(response.json().get("estimated_time", 0))
+            delay = max(delay, min(estimated_time, BACKOFF_MAX_SECONDS))
+        except (ValueError, AttributeError):
+            pass
+    return delay
+
+
+async def query_hf_api(payload: dict) -> list:
     """
     ฟังก์ชันสำหรับ "โทรศัพท์" ไปสั่งงานที่ Hugging Face Inference API
+    ลองใหม่อัตโนมัติเมื่อเจอข้อผิดพลาดชั่วคราว และคืนค่า [] เมื่อไม่สำเร็จ
     """
-    response = requests.post(API_URL, headers=headers, json=payload)
-    if response.status_code != 200:
-        print(f"ERROR: Hugging Face API request failed with status {response.status_code}")
-        print(f"Response: {response.json()}")
-        return []
-    return response.json()
+    client = get_hf_client()
+    for attempt in range(MAX_RETRIES + 1):
+        response = None
+        try:
+            response = await hf_limiter.call(lambda: client.post(API_URL, headers=headers, json=payload),
+                                             method="inference")
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                logger.warning("Hugging Face API ตอบกลับ %d: %s", response.status_code, response.text[:500])
+                return []
+            logger.debug("Hugging Face API ตอบกลับ %d (ครั้งที่ %d) จะลองใหม่", response.status_code, attempt + 1)
+        except httpx.TransportError as e:
+            logger.debug("เชื่อมต่อ Hugging Face API ไม่สำเร็จ (ครั้งที่ %d): %s", attempt + 1, e)
 
-# --- 2. ฟังก์ชันทำนายผล (เวอร์ชันใหม่) ---
-def predict_sentiment(texts: List[str]) -> List[Dict[str, str]]:
+        if attempt < MAX_RETRIES:
+            await asyncio.sleep(_backoff_delay(attempt, response))
+
+    logger.warning("Hugging Face API ล้มเหลวหลังจากลองใหม่ %d ครั้ง", MAX_RETRIES)
+    return []
+
+
+def split_into_chunks(texts: List[str], max_texts: int = MAX_TEXTS_PER_CHUNK,
+                      max_chars: int = MAX_CHARS_PER_CHUNK) -> List[List[int]]:
     """
-    ฟังก์ชันนี้จะเปลี่ยนจากการคำนวณเอง เป็นการส่งข้อความทั้งหมด
-    ไปให้ Hugging Face API ทำนายผล แล้วนำคำตอบกลับมาจัดรูปแบบ
+    แบ่งข้อความเป็นกลุ่มที่มีจำนวนข้อความและจำนวนตัวอักษรรวมไม่เกินที่กำหนด
+    คืนค่า list ของกลุ่ม โดยแต่ละกลุ่มเป็น list ของ index ใน texts
     """
-    if not texts:
-        return []
-        
-    if not HF_TOKEN:
-        print("ERROR: ไม่พบ Hugging Face Token (HF_TOKEN) ใน Environment Variables")
-        return []
+    chunks = []
+    current, current_chars = [], 0
+    for index, text in enumerate(texts):
+        if current and (len(current) >= max_texts or current_chars + len(text) > max_chars):
+            chunks.append(current)
+            current, current_chars = [], 0
+        current.append(index)
+        current_chars += len(text)
+    if current:
+        chunks.append(current)
+    return chunks
 
-    try:
-        # ส่งข้อความทั้งหมดไปให้ API ประมวลผลในครั้งเดียว
-        api_output = query_hf_api({
+
+def _to_result(prediction_list: list) -> Optional[Dict[str, str]]:
+    """
+    แปลงผลของหนึ่งข้อความ [{'label': 'LABEL_2', 'score': 0.9}, ...]
+    เป็น {"label": ..., "score": ..., "scores": {"negative": ..., "neutral": ..., "positive": ...}}
+    """
+    if not prediction_list:
+        return None
+    # แปลง LABEL_0, LABEL_1, LABEL_2 กลับเป็น negative, neutral, positive
+    return scores_to_result({
+        id2label.get(int(prediction['label'].split('_')[-1]), 'unknown'): prediction['score']
+        for prediction in prediction_list
+    })
+
+
+async def _predict_chunk(texts: List[str], semaphore: asyncio.Semaphore) -> List[Optional[Dict[str, str]]]:
+    """ส่งข้อความหนึ่งกลุ่มไปทำนาย คืนค่า list ที่ยาวเท่ากับ texts (None สำหรับแถวที่ไม่สำเร็จ)"""
+    async with semaphore:
+        api_output = await query_hf_api({
             "inputs": texts,
             "options": {"wait_for_model": True} # บอกให้ API รอถ้าโมเดลกำลัง "วอร์มเครื่อง"
         })
 
-        if not api_output:
-            return []
-
-        # api_output จะมีหน้าตาแบบนี้: [[{'label': 'LABEL_2', 'score': 0.9}, ...], [{'label': 'LABEL_0', 'score': 0.8}, ...]]
-        
-        results = []
-        for prediction_list in api_output:
-            # หา label ที่มีคะแนนสูงสุด
-            best_prediction = max(prediction_list, key=lambda x: x['score'])
-            # แปลง LABEL_0, LABEL_1, LABEL_2 กลับเป็น negative, neutral, positive
-            label_index = int(best_prediction['label'].split('_')[-1])
-            final_label = id2label.get(label_index, 'unknown')
-            results.append({"label": final_label})
-            
-        return results
-        
-    except Exception as e:
-        print(f"ERROR: เกิดข้อผิดพลาดระหว่างเรียกใช้ Hugging Face API: {e}")
-        return []
\ No newline at end of file
+    # api_output จะมีหน้าตาแบบนี้: [[{'label': 'LABEL_2', 'score': 0.9}, ...], [{'label': 'LABEL_0', 'score': 0.8}, ...]]
+    if not isinstance(api_output, list) or len(api_output) != len(texts):
+        if api_output:
+            logger.warning("จำนวนผลลัพธ์จาก Hugging Face API (%d) ไม่ตรงกับจำนวนข้อความ (%d)",
+                           len(api_output), len(texts))
+        return [None] * len(texts)
+
+    results = []
+    for prediction_list in api_output:
+        try:
+            results.append(_to_result(prediction_list))
+        except (KeyError, ValueError, TypeError) as e:
+            logger.warning("รูปแบบผลลัพธ์จาก Hugging Face API ไม่ถูกต้อง: %s", e)
+            results.append(None)
+    return results
+
+
+async def _predict_uncached(texts: List[str]) -> List[Optional[Dict[str, str]]]:
+    """
+    ส่งข้อความไปให้ Hugging Face API ทำนายผล โดยแบ่งเป็นกลุ่มขนาดจำกัด
+    และส่งหลายกลุ่มพร้อมกัน แล้วเรียงผลลัพธ์กลับตามลำดับของ texts
+    ถ้ากลุ่มใดล้มเหลว จะเสียเฉพาะแถวของกลุ่มนั้น (มีค่าเป็น None)
+    """
+    chunks = split_into_chunks(texts)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHUNKS)
+    chunk_results = await asyncio.gather(
+        *(_predict_chunk([texts[i] for i in chunk], semaphore) for chunk in chunks),
+        return_exceptions=True
+    )
+
+    results: List[Optional[Dict[str, str]]] = [None] * len(texts)
+    for chunk, chunk_result in zip(chunks, chunk_results):
+        if isinstance(chunk_result, BaseException):
+            logger.warning("เกิดข้อผิดพลาดระหว่างเรียกใช้ Hugging Face API: %s", chunk_result)
+            continue
+        for i, result in zip(chunk, chunk_result):
+            results[i] = result
+    return results
+
+
+class RemoteHFBackend(SentimentBackend):
+    """Backend ที่ส่งข้อความไปทำนายบน Hugging Face Inference API"""
+
+    model_id = MODEL_ID
+
+    _warned_missing_token = False
+
+    def is_available(self) -> bool:
+        if not HF_TOKEN:
+            if not self._warned_missing_token: # เตือนครั้งเดียว ไม่ใช่ทุกหน้าที่วิเคราะห์
+                RemoteHFBackend._warned_missing_token = True
+                logger.warning("ไม่พบ Hugging Face Token (HF_TOKEN) ใน Environment Variables")
+            return False
+        return True
+
+    async def predict(self, texts: List[str]) -> List[Optional[Dict[str, str]]]:
+        return await _predict_uncached(texts)
+
+    async def aclose(self) -> None:
+        await close_hf_client()
+
+
+_backend: Optional[SentimentBackend] = None
+
+
+def get_sentiment_backend() -> SentimentBackend:
+    """คืนค่า backend ที่เลือกไว้ด้วย SENTIMENT_BACKEND (สร้างครั้งเดียวต่อ process)"""
+    global _backend
+    if _backend is None:
+        if SENTIMENT_BACKEND == "local":
+            _backend = LocalTransformersBackend(SENTIMENT_MODEL_PATH, num_threads=SENTIMENT_NUM_THREADS)
+        else:
+            _backend = RemoteHFBackend()
+    return _backend
+
+
+_batcher: Optional[MicroBatcher] = None
+
+
+def get_sentiment_batcher() -> MicroBatcher:
+    """คืนค่า scheduler ที่รวมข้อความจากทุก request ก่อนส่งไปยัง backend (ใช้ร่วมกันทั้ง process)"""
+    global _batcher
+    if _batcher is None:
+        _batcher = MicroBatcher(
+            get_sentiment_backend().predict,
+            max_batch_size=SENTIMENT_BATCH_MAX_ITEMS,
+            max_wait_ms=SENTIMENT_BATCH_MAX_WAIT_MS,
+            max_concurrent_batches=MAX_CONCURRENT_CHUNKS,
+        )
+    return _batcher
+
+
+async def close_sentiment_backend() -> None:
+    """ปิด scheduler และ backend ที่ใช้อยู่ (เรียกจาก lifespan ของ FastAPI)"""
+    if _batcher is not None:
+        await _batcher.aclose()
+    if _backend is not None:
+        await _backend.aclose()
+
+
+# --- 2. ฟังก์ชันทำนายผล (เวอร์ชันใหม่) ---
+async def predict_sentiment(texts: List[str]) -> List[Optional[Dict[str, str]]]:
+    """
+    ทำนาย Sentiment ของข้อความที่ทำความสะอาดแล้ว คืนค่า list ที่ยาวเท่ากับ texts
+    - ข้อความที่เคยทำนายแล้วจะดึงจาก cache
+    - ข้อความที่ซ้ำกันใน batch จะถูกส่งไปทำนายเพียงครั้งเดียว
+    - ข้อความที่เหลือจะถูกรวมกับข้อความจาก request อื่นที่เรียกพร้อมกันก่อนส่งไปยัง backend
+    แต่ละแถวเป็น {"label", "score", "scores"} หรือ None ถ้าทำนายไม่สำเร็จ
+    """
+    if not texts:
+        return []
+
+    backend = get_sentiment_backend()
+    keys = [sentiment_cache_key(text, backend.model_id) for text in texts]
+    known = await sentiment_cache.aget_many(keys)
+    missing_keys = [key for key in dict.fromkeys(keys) if key not in known]
+
+    if missing_keys:
+        if not backend.is_available():
+            if not known:
+                return []
+        else:
+            text_by_key = dict(zip(keys, texts))
+            predictions = await get_sentiment_batcher().submit([text_by_key[key] for key in missing_keys])
+            new_results = {key: result for key, result in zip(missing_keys, predictions) if result is not None}
+            await sentiment_cache.aset_many(new_results)
+            known.update(new_results)
+
+    return [known.get(key) for key in keys]
@@ -0,0 +1,269 @@
+import os
+import sys
+import time
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+from zoneinfo import ZoneInfo
+
+import httpx
+
+from metrics import record_upstream_call
+
+# สถานะที่แสดงว่า upstream รับภาระไม่ไหว (ลด concurrency ลง)
+OVERLOAD_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# ค่า quota ต่อ request ของ YouTube Data API (หน่วย) ที่ไม่ใช่ 1 หน่วย
+YOUTUBE_QUOTA_COSTS = {"search": 100}
+# quota ของ YouTube รีเซ็ตทุกเที่ยงคืนตามเวลาแปซิฟิก
+YOUTUBE_QUOTA_TIMEZONE = "America/Los_Angeles"
+
+
+class QuotaExceededError(RuntimeError):
+    """quota รายวันของ upstream ไม่พอสำหรับ request นี้"""
+
+
+class TokenBucket:
+    """
+    Token bucket สำหรับจำกัดอัตรา (เช่น request/วินาที หรือ token/วินาที)
+    ผู้เรียกจองโทเค็นทันทีแม้ยอดจะติดลบ แล้วรอตามยอดที่ติดค้าง จึงได้คิวแบบมาก่อนได้ก่อนโดยไม่ต้องใช้ lock
+    """
+
+    def __init__(self, rate_per_second: float, capacity: Optional[float] = None):
+        self.rate = rate_per_second
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_second)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self.waited_seconds = 0.0
+
+    def _reserve(self, amount: float) -> float:
+        """จองโทเค็นแล้วคืนค่าเวลาที่ต้องรอ (วินาที)"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= min(amount, self.capacity) # คำขอที่ใหญ่กว่าความจุไม่ต้องรอตลอดไป
+        return max(0.0, -self._tokens / self.rate)
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        delay = self._reserve(amount)
+        if delay > 0:
+            self.waited_seconds += delay
+            await asyncio.sleep(delay)
+
+
+class QuotaLedger:
+    """นับ quota รายวันตามต้นทุนของแต่ละ method และปฏิเสธ request ที่จะทำให้เกิน quota"""
+
+    def __init__(self, daily_units: int, costs: Dict[str, int], default_cost: int = 1,
+                 timezone: str = YOUTUBE_QUOTA_TIMEZONE):
+        self.daily_units = daily_units
+        self.costs = costs
+        self.default_cost = default_cost
+        self._timezone = ZoneInfo(timezone)
+        self.day = self._today()
+        self.spent = 0
+        self.spent_by_method: Dict[str, int] = {}
+
+    def _today(self) -> str:
+        return datetime.now(self._timezone).date().isoformat()
+
+    def _roll_over(self) -> None:
+        today = self._today()
+        if today != self.day:
+            self.day, self.spent, self.spent_by_method = today, 0, {}
+
+    def charge(self, method: str) -> None:
+        """บันทึกการใช้ quota ของ method หรือ raise QuotaExceededError ถ้าไม่พอ"""
+        self._roll_over()
+        cost = self.costs.get(method, self.default_cost)
+        if self.spent + cost > self.daily_units:
+            raise QuotaExceededError(
+                f"quota รายวันไม่พอสำหรับ {method} (ใช้ไป {self.spent}/{self.daily_units} หน่วย)"
+            )
+        self.spent += cost
+        self.spent_by_method[method] = self.spent_by_method.get(method, 0) + cost
+
+    def mark_exhausted(self) -> None:
+        """upstream แจ้งว่า quota หมดแล้ว (เช่น ใช้ key เดียวกันจากที่อื่น) ให้ปฏิเสธ request ที่เหลือของวันนี้"""
+        self._roll_over()
+        self.spent = max(self.spent, self.daily_units)
+
+    def stats(self) -> Dict:
+        self._roll_over()
+        return {"day": self.day, "spent": self.spent, "daily_units": self.daily_units,
+                "remaining": max(0, self.daily_units - self.spent), "spent_by_method": dict(self.spent_by_method)}
+
+
+class AIMDConcurrency:
+    """
+    จำกัดจำนวน request ที่ค้างอยู่พร้อมกัน โดยปรับขีดจำกัดแบบ AIMD:
+    - สำเร็จและเร็วกว่า latency_target → เพิ่มขีดจำกัดทีละน้อย (ประมาณ +1 ต่อรอบของ request)
+    - เจอ 429/5xx/timeout หรือช้ากว่า latency_target → ลดขีดจำกัดลงครึ่งหนึ่ง
+      (ลดครั้งเดียวต่อชุดของ request ที่เริ่มก่อนการลดครั้งล่าสุด)
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_target: float,
+                 decrease_factor: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self._counters = {"increases": 0, "decreases": 0, "overloads": 0, "slow": 0}
+
+    async def acquire(self) -> None:
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    self._wake() # ส่งสิทธิ์ที่ได้รับต่อให้ตัวถัดไป
+                raise
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        free_slots = int(self.limit) - self.in_flight
+        while free_slots > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free_slots -= 1
+
+    def record(self, started_at: float, latency: float, overloaded: bool) -> None:
+        """ปรับขีดจำกัดตามผลของ request ที่เริ่มเมื่อ started_at"""
+        slow = latency > self.latency_target
+        if overloaded or slow:
+            self._counters["overloads" if overloaded else "slow"] += 1
+            if started_at >= self._last_decrease:
+                self.limit = max(float(self.minimum), self.limit * self.decrease_factor)
+                self._last_decrease = time.monotonic()
+                self._counters["decreases"] += 1
+            return
+        if self.limit < self.maximum:
+            self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._counters["increases"] += 1
+            self._wake()
+
+    def stats(self) -> Dict:
+        return {"limit": round(self.limit, 2), "in_flight": self.in_flight, "waiting": len(self._waiters),
+                **self._counters}
+
+
+def is_overload(outcome: Any) -> bool:
+    """ผลลัพธ์หรือ exception นี้แสดงว่า upstream รับภาระไม่ไหวหรือไม่ (429, 5xx, timeout)"""
+    if isinstance(outcome, (httpx.TimeoutException, asyncio.TimeoutError)):
+        return True
+    openai = sys.modules.get("openai") # ถ้ายังไม่ถูก import ก็ไม่มี exception ของ OpenAI ให้ตรวจ
+    if openai is not None and isinstance(outcome, openai.APITimeoutError):
+        return True
+    status_code = getattr(outcome, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(outcome, "response", None), "status_code", None)
+    return status_code in OVERLOAD_STATUS_CODES
+
+
+class UpstreamLimiter:
+    """
+    ตัวจำกัดของ upstream หนึ่งราย รวม token bucket ของจำนวน request (และโทเค็นถ้ามี),
+    quota รายวัน (ถ้ามี) และ concurrency แบบ AIMD ทุก request ไปยัง upstream ต้องผ่าน call()
+    """
+
+    def __init__(self, name: str, requests: TokenBucket, concurrency: AIMDConcurrency,
+                 tokens: Optional[TokenBucket] = None, quota: Optional[QuotaLedger] = None):
+        self.name = name
+        self.requests = requests
+        self.concurrency = concurrency
+        self.tokens = tokens
+        self.quota = quota
+        self.calls = 0
+
+    async def call(self, send: Callable[[], Awaitable[Any]], tokens: int = 0, method: str = "request") -> Any:
+        """
+        รอจนกว่าจะส่งได้ตามขีดจำกัดทั้งหมด แล้วเรียก send() พร้อมบันทึกผลเพื่อปรับ concurrency
+        - tokens: จำนวนโทเค็นโดยประมาณของ request (prompt + max_tokens)
+        - method: ชื่อ method ที่เรียก ใช้คิด quota รายวัน (เช่น "search", "videos") และเป็น label ของ metric
+        """
+        if self.quota is not None:
+            self.quota.charge(method)
+        await self.requests.acquire()
+        if self.tokens is not None and tokens:
+            await self.tokens.acquire(tokens)
+        await self.concurrency.acquire()
+        self.calls += 1
+        started_at = time.monotonic()
+        try:
+            outcome = await send()
+        except asyncio.CancelledError:
+            self.concurrency.release()
+            raise
+        except Exception as e:
+            self._finish(method, started_at, e)
+            raise
+        self._finish(method, started_at, outcome)
+        return outcome
+
+    def _finish(self, method: str, started_at: float, outcome: Any) -> None:
+        """คืน slot ของ concurrency แล้วบันทึกผลของ request (ปรับ AIMD และ metric)"""
+        latency = time.monotonic() - started_at
+        self.concurrency.release()
+        self.concurrency.record(started_at, latency, is_overload(outcome))
+        status_code = getattr(outcome, "status_code", None)
+        status = str(status_code) if status_code is not None else (
+            type(outcome).__name__ if isinstance(outcome, Exception) else "ok"
+        )
+        record_upstream_call(self.name, method, status, latency)
+
+    def stats(self) -> Dict:
+        stats = {"calls": self.calls, "request_wait_seconds": round(self.requests.waited_seconds, 3),
+                 "concurrency": self.concurrency.stats()}
+        if self.tokens is not None:
+            stats["token_wait_seconds"] = round(self.tokens.waited_seconds, 3)
+        if self.quota is not None:
+            stats["quota"] = self.quota.stats()
+        return stats
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+# --- ตัวจำกัดที่ใช้ร่วมกันทั้ง process (หนึ่งตัวต่อ upstream) ---
+youtube_limiter = UpstreamLimiter(
+    "youtube",
+    requests=TokenBucket(_env_float("YOUTUBE_REQUESTS_PER_SECOND", 10), _env_float("YOUTUBE_REQUEST_BURST", 20)),
+    concurrency=AIMDConcurrency(initial=8, minimum=1, maximum=int(_env_float("YOUTUBE_MAX_CONCURRENCY", 20)),
+                                latency_target=_env_float("YOUTUBE_LATENCY_TARGET_SECONDS", 3)),
+    quota=QuotaLedger(int(_env_float("YOUTUBE_DAILY_QUOTA", 10000)), YOUTUBE_QUOTA_COSTS),
+)
+openai_limiter = UpstreamLimiter(
+    "openai",
+    requests=TokenBucket(_env_float("OPENAI_REQUESTS_PER_MINUTE", 500) / 60, _env_float("OPENAI_REQUEST_BURST", 20)),
+    tokens=TokenBucket(_env_float("OPENAI_TOKENS_PER_MINUTE", 200000) / 60,
+                       _env_float("OPENAI_TOKENS_PER_MINUTE", 200000) / 6), # สะสมได้ 10 วินาที
+    concurrency=AIMDConcurrency(initial=8, minimum=1, maximum=int(_env_float("OPENAI_MAX_CONCURRENCY", 32)),
+                                latency_target=_env_float("OPENAI_LATENCY_TARGET_SECONDS", 30)),
+)
+hf_limiter = UpstreamLimiter(
+    "huggingface",
+    requests=TokenBucket(_env_float("HF_REQUESTS_PER_SECOND", 5), _env_float("HF_REQUEST_BURST", 10)),
+    concurrency=AIMDConcurrency(initial=4, minimum=1, maximum=int(_env_float("HF_MAX_CONCURRENCY", 16)),
+                                latency_target=_env_float("HF_LATENCY_TARGET_SECONDS", 15)),
+)
+LIMITERS = (youtube_limiter, openai_limiter, hf_limiter)
+
+
+def limiter_stats() -> Dict:
+    """คืนค่าสถิติของตัวจำกัดทุก upstream"""
+    return {limiter.name: limiter.stats() for limiter in LIMITERS}
@@ -0,0 +1,131 @@
+import logging
+import os
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# กำหนด Mapping ของ Label (index ของ class → ชื่อ sentiment)
+id2label = {0: "negative", 1: "neutral", 2: "positive"}
+
+
+def scores_to_result(scores: Dict[str, float]) -> Dict:
+    """แปลงคะแนนของแต่ละ label เป็น {"label": ..., "score": ..., "scores": {...}} โดยเลือก label ที่คะแนนสูงสุด"""
+    best_label = max(scores, key=scores.get)
+    return {"label": best_label, "score": scores[best_label], "scores": scores}
+
+
+class SentimentBackend(ABC):
+    """
+    Interface ของตัวทำนาย Sentiment
+    ทุก backend ต้องคืนค่า list ที่ยาวเท่ากับ texts โดยแต่ละแถวเป็น
+    {"label", "score", "scores"} หรือ None ถ้าทำนายแถวนั้นไม่สำเร็จ
+    """
+
+    # ใช้เป็นส่วนหนึ่งของ key ใน cache ผลทำนาย (ผลของต่างโมเดลจะไม่ปนกัน)
+    model_id: str = ""
+
+    def is_available(self) -> bool:
+        """คืนค่า True ถ้า backend พร้อมใช้งาน (เช่น มี token หรือมีไฟล์โมเดล)"""
+        return True
+
+    @abstractmethod
+    async def predict(self, texts: List[str]) -> List[Optional[Dict]]:
+        """ทำนาย Sentiment ของ texts ตามลำดับ"""
+
+    async def aclose(self) -> None:
+        """คืน resource ที่ backend ถือไว้ (เรียกตอน shutdown)"""
+
+
+class LocalTransformersBackend(SentimentBackend):
+    """
+    ทำนาย Sentiment บน CPU ด้วยโมเดล sequence classification จาก path ในเครื่อง
+    - จัดกลุ่มข้อความตามความยาว (length bucketing) เพื่อลด padding ที่เสียเปล่า
+    - จำกัดจำนวน thread ของ torch ได้
+    ต้องติดตั้ง torch และ transformers เพิ่มเติม (import เมื่อโหลดโมเดลครั้งแรก)
+    """
+
+    def __init__(self, model_path: str, num_threads: Optional[int] = None, max_batch_size: int = 32,
+                 max_batch_tokens: int = 8192, max_length: int = 416):
+        self.model_path = model_path
+        self.model_id = f"local:{os.path.abspath(model_path)}"
+        self.num_threads = num_threads
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_length = max_length
+
+        self._tokenizer = None
+        self._model = None
+        self._torch = None
+        self._load_lock = threading.Lock()
+        # โมเดลเดียวใช้ thread ของ torch ทั้งหมดอยู่แล้ว จึงรันทีละ batch
+        self._run_lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        return os.path.isdir(self.model_path)
+
+    def load(self) -> None:
+        """โหลด tokenizer และโมเดล (ทำครั้งเดียว)"""
+        with self._load_lock:
+            if self._model is not None:
+                return
+            import torch
+            from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+            if self.num_threads:
+                torch.set_num_threads(self.num_threads)
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+            model = AutoModelForSequenceClassification.from_pretrained(self.model_path)
+            model.eval()
+            self._model = model
+            self._torch = torch
+
+    def make_buckets(self, lengths: List[int]) -> List[List[int]]:
+        """
+        เรียง index ตามความยาวโทเค็น แล้วแบ่งเป็นกลุ่มที่ขนาดไม่เกิน max_batch_size
+        และ (ความยาวที่ยาวที่สุดในกลุ่ม x จำนวนข้อความ) ไม่เกิน max_batch_tokens
+        """
+        buckets = []
+        current = []
+        for index in sorted(range(len(lengths)), key=lengths.__getitem__):
+            # ข้อความเรียงจากสั้นไปยาว ความยาวของกลุ่มหลังเพิ่มจึงเท่ากับความยาวของข้อความนี้
+            if current and (len(current) >= self.max_batch_size
+                            or lengths[index] * (len(current) + 1) > self.max_batch_tokens):
+                buckets.append(current)
+                current = []
+            current.append(index)
+        if current:
+            buckets.append(current)
+        return buckets
+
+    def predict_sync(self, texts: List[str]) -> List[Optional[Dict]]:
+        """ทำนายแบบ blocking (ใช้ใน thread แยก)"""
+        self.load()
+        torch = self._torch
+        encoded = self._tokenizer(texts, truncation=True, max_length=self.max_length)
+        lengths = [len(input_ids) for input_ids in encoded["input_ids"]]
+
+        results: List[Optional[Dict]] = [None] * len(texts)
+        with self._run_lock, torch.inference_mode():
+            for bucket in self.make_buckets(lengths):
+                batch = self._tokenizer.pad(
+                    {key: [encoded[key][i] for i in bucket] for key in encoded.keys()},
+                    return_tensors="pt",
+                )
+                probabilities = torch.softmax(self._model(**batch).logits, dim=-1).tolist()
+                for i, row in zip(bucket, probabilities):
+                    results[i] = scores_to_result({
+                        id2label.get(label_index, 'unknown'): score for label_index, score in enumerate(row)
+                    })
+        return results
+
+    async def predict(self, texts: List[str]) -> List[Optional[Dict]]:
+        if not texts:
+            return []
+        try:
+            return await asyncio.to_thread(self.predict_sync, texts)
+        except Exception as e:
+            logger.warning("เกิดข้อผิดพลาดระหว่างทำนายด้วยโมเดลในเครื่อง: %s", e)
+            return [None] * len(texts)
@@ -0,0 +1,106 @@
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+# ฟังก์ชันที่ leader เรียกใช้ส่ง event (เช่น ความคืบหน้า) ไปยังผู้รอทุกราย
+Notify = Callable[..., None]
+
+
+class _Flight:
+    """งานหนึ่งรายการที่กำลังทำงาน พร้อมผู้รอและ listener ของ event"""
+
+    __slots__ = ("task", "waiters", "listeners")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.listeners: List[Notify] = []
+
+
+class SingleFlight:
+    """
+    รวมการเรียกที่ขอผลเดียวกันพร้อมกัน (request coalescing) ด้วย key:
+    - ผู้เรียกรายแรก (leader) เริ่มงานจริงใน task แยก ผู้ที่เรียก key เดียวกันระหว่างนั้น (follower) รอ task เดียวกัน
+    - ผลที่สำเร็จถูกเก็บไว้อีก result_ttl วินาทีหลังงานเสร็จ สำหรับผู้ที่มาช้า (exception ไม่ถูกเก็บ)
+    - exception ของงานถูกส่งให้ผู้รอทุกราย
+    - ผู้รอที่ถูกยกเลิก (เช่น client ตัดการเชื่อมต่อ) ไม่ทำให้งานของผู้รอรายอื่นถูกยกเลิก
+      งานจะถูกยกเลิกก็ต่อเมื่อไม่มีผู้รอเหลืออยู่เลย
+    """
+
+    def __init__(self, result_ttl: float = 10.0, max_results: int = 256):
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict() # key -> (หมดอายุเมื่อ, ผล)
+        self._counters = {"leaders": 0, "followers": 0, "recent_hits": 0, "errors": 0, "abandoned": 0}
+
+    def _recent_result(self, key: Hashable) -> Tuple[bool, Any]:
+        now = time.monotonic()
+        # ผลถูกเพิ่มตามลำดับเวลาและมีอายุเท่ากัน จึงลบรายการที่หมดอายุจากหัวของ OrderedDict ได้เลย
+        while self._results and next(iter(self._results.values()))[0] <= now:
+            self._results.popitem(last=False)
+        entry = self._results.get(key)
+        return (True, entry[1]) if entry is not None else (False, None)
+
+    async def _run(self, key: Hashable, flight: _Flight, func: Callable[[Notify], Awaitable[Any]]) -> Any:
+        def notify(*args) -> None:
+            for listener in list(flight.listeners):
+                listener(*args)
+
+        try:
+            result = await func(notify)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._counters["errors"] += 1
+            raise
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if self.result_ttl > 0:
+            self._results[key] = (time.monotonic() + self.result_ttl, result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        return result
+
+    async def do(self, key: Hashable, func: Callable[[Notify], Awaitable[Any]],
+                 listener: Optional[Notify] = None) -> Any:
+        """
+        คืนค่าผลของ func(notify) สำหรับ key โดยเรียก func เพียงครั้งเดียวต่อกลุ่มผู้เรียกพร้อมกัน
+        listener (ถ้ามี) จะได้รับทุก event ที่ leader ส่งผ่าน notify หลังจากผู้เรียกรายนี้เข้าร่วม
+        """
+        found, result = self._recent_result(key)
+        if found:
+            self._counters["recent_hits"] += 1
+            return result
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(self._run(key, flight, func))
+            self._counters["leaders"] += 1
+        else:
+            self._counters["followers"] += 1
+        flight.waiters += 1
+        if listener is not None:
+            flight.listeners.append(listener)
+
+        try:
+            # shield: การยกเลิกผู้รอรายนี้ไม่ยกเลิกงานที่ใช้ร่วมกัน
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if listener is not None:
+                flight.listeners.remove(listener)
+            if flight.waiters == 0 and not flight.task.done():
+                # ไม่มีใครรอผลแล้ว: ยกเลิกงาน และให้ผู้เรียกรายถัดไปเริ่มงานใหม่แทนการรองานที่กำลังถูกยกเลิก
+                self._counters["abandoned"] += 1
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    def stats(self) -> dict:
+        """คืนค่าสถิติ เช่น จำนวนครั้งที่ได้ผลจากงานของผู้อื่น"""
+        return {**self._counters, "in_flight": len(self._flights), "recent_results": len(self._results)}
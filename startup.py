@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Union
+
+from metrics import record_stage
+
+logger = logging.getLogger(__name__)
+
+# เตรียม resource ที่ใช้เวลานานในครั้งแรกเป็นงานเบื้องหลังจาก lifespan (readiness probe ผ่านเมื่อเสร็จ)
+WARM_UP_ENABLED = os.getenv("WARM_UP_ENABLED", "true").lower() not in ("0", "false", "no")
+WARM_UP_TIMEOUT_SECONDS = float(os.getenv("WARM_UP_TIMEOUT_SECONDS", "60")) # เกินนี้แล้วยกเลิกงานที่เหลือและถือว่าพร้อม
+
+# สถานะของการ warm-up: "starting" → "warming_up" → "ready"
+_status = {"state": "starting", "seconds": None, "tasks": {}}
+
+
+def _warm_token_encoders() -> None:
+    """โหลด tiktoken encoding ของโมเดลที่ใช้สรุปและแปล (ครั้งแรกต้องอ่าน/ดาวน์โหลดไฟล์ BPE)"""
+    from token_utils import get_encoding
+    from summarizer import SUMMARY_MODEL
+    from translate_text import TRANSLATION_MODEL
+
+    for model_name in {SUMMARY_MODEL, TRANSLATION_MODEL}:
+        get_encoding(model_name)
+
+
+def _warm_language_profiles() -> None:
+    from detect_language import warm_up_language_profiles
+
+    warm_up_language_profiles()
+
+
+def _warm_thai_normalize() -> None:
+    """import pythainlp และสร้างตารางที่ normalize ใช้"""
+    from clean_text import normalize
+
+    normalize("เเปลก")
+
+
+async def _warm_http_clients() -> None:
+    """สร้าง client ที่มี connection pool ร่วมกัน (รวม SSL context) ของ YouTube และ Hugging Face ภายใน event loop"""
+    from youtube_client import get_youtube_client
+    from predict_sentiment import get_hf_client
+
+    get_youtube_client()._get_http()
+    get_hf_client()
+
+
+def _warm_sentiment_backend() -> None:
+    """โหลดโมเดลในเครื่องล่วงหน้า (เมื่อ SENTIMENT_BACKEND=local)"""
+    from predict_sentiment import get_sentiment_backend
+    from sentiment_backends import LocalTransformersBackend
+
+    backend = get_sentiment_backend()
+    if isinstance(backend, LocalTransformersBackend):
+        backend.load()
+
+
+# ฟังก์ชันธรรมดารันใน thread แยก (import/อ่านไฟล์แบบ blocking), coroutine function รันใน event loop
+WarmUpTask = Callable[[], Union[None, Awaitable[None]]]
+
+WARM_UP_TASKS: Dict[str, WarmUpTask] = {
+    "token_encoders": _warm_token_encoders,
+    "language_profiles": _warm_language_profiles,
+    "thai_normalize": _warm_thai_normalize,
+    "http_clients": _warm_http_clients,
+    "sentiment_backend": _warm_sentiment_backend,
+}
+
+
+async def _run_task(name: str, func: WarmUpTask) -> None:
+    start = time.perf_counter()
+    error = None
+    try:
+        if asyncio.iscoroutinefunction(func):
+            await func()
+        else:
+            await asyncio.to_thread(func)
+    except Exception as e:
+        # warm-up ไม่สำเร็จไม่ใช่ข้อผิดพลาดร้ายแรง: งานนั้นจะถูกทำอีกครั้งตอนใช้งานจริง
+        error = f"{type(e).__name__}: {e}"
+        logger.warning("warm-up %s ไม่สำเร็จ: %s", name, error)
+    seconds = time.perf_counter() - start
+    record_stage(f"warm_up.{name}", seconds)
+    _status["tasks"][name] = {"seconds": round(seconds, 3), **({"error": error} if error else {})}
+
+
+async def warm_up(extra_tasks: Optional[Dict[str, WarmUpTask]] = None) -> Dict:
+    """
+    รันงาน warm-up ทั้งหมดพร้อมกัน แล้วคืนค่าเวลาที่ใช้ของแต่ละงาน
+    งานที่ยังไม่เสร็จภายใน WARM_UP_TIMEOUT_SECONDS จะถูกยกเลิก (จะถูกทำอีกครั้งตอนใช้งานจริง)
+    """
+    tasks = {**WARM_UP_TASKS, **(extra_tasks or {})}
+    _status["state"] = "warming_up"
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(asyncio.gather(*(_run_task(name, func) for name, func in tasks.items())),
+                               timeout=WARM_UP_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning("warm-up ไม่เสร็จภายใน %.0f วินาที ยกเลิกงานที่เหลือ: %s", WARM_UP_TIMEOUT_SECONDS,
+                       ", ".join(name for name in tasks if name not in _status["tasks"]))
+    _status["seconds"] = round(time.perf_counter() - start, 3)
+    _status["state"] = "ready"
+    logger.info("warm-up เสร็จใน %.2f วินาที", _status["seconds"], extra={"warm_up": _status["tasks"]})
+    return startup_status()
+
+
+def mark_ready() -> None:
+    """ใช้เมื่อปิด warm-up (WARM_UP_ENABLED=false): พร้อมรับ request ทันที"""
+    _status["state"] = "ready"
+
+
+def is_ready() -> bool:
+    return _status["state"] == "ready"
+
+
+def startup_status() -> Dict:
+    return {**_status, "tasks": dict(_status["tasks"])}
@@ -0,0 +1,60 @@
+// ส่งงานวิเคราะห์ไปทำเบื้องหลัง (/jobs) แล้วติดตามความคืบหน้าจนเสร็จ
+// ใช้ server-sent events ถ้าเบราว์เซอร์รองรับ ไม่เช่นนั้น (หรือเมื่อการเชื่อมต่อหลุด) จะ polling แทน
+
+const JOB_STAGE_LABELS = {
+  fetched: 'ดึงแล้ว',
+  translated: 'แปลแล้ว',
+  cleaned: 'ทำความสะอาดแล้ว',
+  analyzed: 'วิเคราะห์แล้ว',
+};
+
+function formatJobProgress(snapshot){
+  if (snapshot.status === 'queued') return 'กำลังรอคิว...';
+  const parts = Object.entries(JOB_STAGE_LABELS)
+    .filter(([stage]) => snapshot.progress && snapshot.progress[stage] !== undefined)
+    .map(([stage, label]) => `${label} ${snapshot.progress[stage]}`);
+  return parts.length ? `กำลังประมวลผล... ${parts.join(' · ')} ความคิดเห็น` : 'กำลังประมวลผล... โปรดรอสักครู่';
+}
+
+function waitForJob(job, onProgress){
+  return new Promise((resolve, reject) => {
+    let settled = false;
+    const isFinished = (s) => s.status === 'done' || s.status === 'failed';
+    const finish = (s) => { if (!settled) { settled = true; resolve(s); } };
+
+    async function poll(){
+      try{
+        while (!settled) {
+          const res = await fetch(job.status_url);
+          if (!res.ok) throw new Error(`HTTP ${res.status}`);
+          const snapshot = await res.json();
+          if (onProgress) onProgress(snapshot);
+          if (isFinished(snapshot)) return finish(snapshot);
+          await new Promise(r => setTimeout(r, 1000));
+        }
+      }catch(err){
+        if (!settled) { settled = true; reject(err); }
+      }
+    }
+
+    if (!window.EventSource) return poll();
+    const source = new EventSource(job.events_url);
+    source.addEventListener('progress', (e) => {
+      const snapshot = JSON.parse(e.data);
+      if (onProgress) onProgress(snapshot);
+      if (isFinished(snapshot)) { source.close(); finish(snapshot); }
+    });
+    source.onerror = () => { source.close(); if (!settled) poll(); };
+  });
+}
+
+// ส่งฟอร์มเป็นงานเบื้องหลัง แล้วเปิดหน้าผลลัพธ์เมื่องานเสร็จ
+async function runAnalysisJob(form, onProgress){
+  const res = await fetch('/jobs', { method: 'POST', body: new FormData(form) });
+  const job = await res.json().catch(() => ({}));
+  if (!res.ok) throw new Error(job.error || `HTTP ${res.status}`);
+
+  const snapshot = await waitForJob(job, onProgress);
+  if (snapshot.status !== 'done') throw new Error(snapshot.error || 'การวิเคราะห์ล้มเหลว');
+  window.location.href = job.result_url;
+}
@@ -18,12 +18,28 @@ if (loadBtn && container && !normToken(container.dataset.nextPageToken)) {
   loadBtn.style.display = 'none';
 }
 
-// จับ submit ฟอร์ม
-document.addEventListener('submit', (ev)=>{
+const loadingText = overlay ? overlay.querySelector('p') : null;
+
+// จับ submit ฟอร์ม: ส่งเป็นงานเบื้องหลังแล้วแสดงความคืบหน้า
+document.addEventListener('submit', async (ev)=>{
   const form = ev.target.closest('.analyze-form');
   if(!form) return;
   setLoading(true);
   document.querySelectorAll('.analyze-button').forEach(b=>b.disabled=true);
+
+  if (typeof runAnalysisJob !== 'function') return;
+  ev.preventDefault();
+  try{
+    await runAnalysisJob(form, (snapshot)=>{
+      if(loadingText) loadingText.textContent = formatJobProgress(snapshot);
+    });
+  }catch(err){
+    console.error('Analysis job failed:', err);
+    alert('เกิดข้อผิดพลาดในการวิเคราะห์: ' + err.message);
+    setLoading(false);
+    document.querySelectorAll('.analyze-button').forEach(b=>b.disabled=false);
+    if(loadingText) loadingText.textContent = 'กำลังประมวลผล... โปรดรอสักครู่';
+  }
 }, true);
 
 function createVideoItemHtml(video){
@@ -97,3 +113,77 @@ if (loadBtn && grid && container) {
     }
   });
 }
+
+// วิเคราะห์ทั้งช่อง: อ่านผลแบบ NDJSON ทีละบรรทัดแล้วแสดงผลของแต่ละวิดีโอทันทีที่เสร็จ
+const channelForm    = document.getElementById('channelAnalysisForm');
+const channelBtn     = document.getElementById('channelAnalysisButton');
+const channelResult  = document.getElementById('channelAnalysisResult');
+const channelTotals  = document.getElementById('channelTotals');
+const channelResults = document.getElementById('channelVideoResults');
+
+function renderChannelTotals(c, finished){
+  const pct = (r)=> (r*100).toFixed(1) + '%';
+  channelTotals.textContent =
+    `${finished ? 'เสร็จแล้ว' : 'กำลังวิเคราะห์'} ${c.videos_done}/${c.videos_total} วิดีโอ · ` +
+    `ความคิดเห็น ${c.total_comments} · บวก ${c.positive_count} (${pct(c.positive_ratio)}) · ` +
+    `ลบ ${c.negative_count} (${pct(c.negative_ratio)}) · กลาง ${c.neutral_count} · ` +
+    `quota ${c.quota_spent}/${c.quota_budget}`;
+}
+
+function renderVideoResult(v){
+  const li = document.createElement('li');
+  const title = escapeHtml(v.title);
+  li.innerHTML = v.error
+    ? `<a href="${escapeHtml(v.video_url)}" target="_blank">${title}</a> — วิเคราะห์ไม่สำเร็จ`
+    : `<a href="${escapeHtml(v.video_url)}" target="_blank">${title}</a> — ` +
+      `บวก ${v.positive_count} · ลบ ${v.negative_count} · กลาง ${v.neutral_count} จาก ${v.total_comments} ความคิดเห็น`;
+  channelResults.appendChild(li);
+}
+
+function handleChannelEvent(ev){
+  if (ev.type === 'videos') {
+    channelTotals.textContent = `กำลังวิเคราะห์ ${ev.videos.length} วิดีโอ...`;
+  } else if (ev.type === 'video') {
+    renderVideoResult(ev.video);
+    renderChannelTotals(ev.channel, false);
+  } else if (ev.type === 'done') {
+    renderChannelTotals(ev.channel, true);
+  } else if (ev.type === 'error') {
+    channelTotals.textContent = ev.message;
+  }
+}
+
+if (channelForm && container) {
+  channelForm.addEventListener('submit', async (e)=>{
+    e.preventDefault();
+    const body = new FormData(channelForm);
+    body.append('channel_id', container.dataset.channelId || '');
+
+    channelBtn.disabled = true;
+    channelResult.hidden = false;
+    channelResults.innerHTML = '';
+    channelTotals.textContent = 'กำลังเลือกวิดีโอ...';
+
+    try{
+      const res = await fetch('/analyze_channel', { method: 'POST', body });
+      if(!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for(;;){
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        for (const line of lines) if (line.trim()) handleChannelEvent(JSON.parse(line));
+      }
+      if (buffer.trim()) handleChannelEvent(JSON.parse(buffer));
+    }catch(err){
+      console.error('Error analyzing channel:', err);
+      channelTotals.textContent = 'เกิดข้อผิดพลาดในการวิเคราะห์ทั้งช่อง: ' + err.message;
+    }finally{
+      channelBtn.disabled = false;
+    }
+  });
+}
@@ -38,8 +38,16 @@ function updateForm(){
 inputTypeRadios.forEach(r => r.addEventListener('change', updateForm));
 updateForm();
 
+const loadingText = loadingOverlay ? loadingOverlay.querySelector('p') : null;
+
+function showError(message){
+  if(!errorMessageDiv) return;
+  errorMessageDiv.textContent = message;
+  errorMessageDiv.style.display = 'block';
+}
+
 // submit
-mainForm.addEventListener('submit', () => {
+mainForm.addEventListener('submit', async (ev) => {
   // ซ่อน error เก่า
   if(errorMessageDiv){
     errorMessageDiv.style.display = 'none';
@@ -48,4 +56,19 @@ mainForm.addEventListener('submit', () => {
   // โชว์ overlay + disable ปุ่ม
   setLoading(true);
   submitButton.disabled = true;
+
+  // โหมดวิดีโอ: ส่งเป็นงานเบื้องหลังแล้วแสดงความคืบหน้า (โหมดช่องส่งฟอร์มตามปกติ)
+  if(analysisModeHidden.value !== 'video' || typeof runAnalysisJob !== 'function') return;
+  ev.preventDefault();
+  try{
+    await runAnalysisJob(mainForm, (snapshot) => {
+      if(loadingText) loadingText.textContent = formatJobProgress(snapshot);
+    });
+  }catch(err){
+    console.error('Analysis job failed:', err);
+    showError(err.message);
+    setLoading(false);
+    submitButton.disabled = false;
+    if(loadingText) loadingText.textContent = 'กำลังประมวลผล... โปรดรอสักครู่';
+  }
 });
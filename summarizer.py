@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import logging
+import os
+import asyncio
+import hashlib
+from typing import TYPE_CHECKING, List, Optional
+
+from token_utils import count_tokens, get_encoding # encoder ที่โหลดครั้งเดียว + นับโทเค็นทีละหลายข้อความ
+from cache_store import TieredCache, make_cache_key # cache สรุปแบบ LRU + SQLite
+from rate_limiter import openai_limiter # จำกัดอัตรา request/โทเค็น และ concurrency ของ OpenAI
+
+if TYPE_CHECKING:
+    import openai  # ใช้เฉพาะใน type hint (openai ถูก import ตอนสร้าง client ดู main.get_openai_client)
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_MODEL = "gpt-3.5-turbo"
+SUMMARY_TEMPERATURE = 0.5
+SUMMARY_MAX_TOKENS = 512
+SUMMARY_SYSTEM_PROMPT = (
+    "คุณคือผู้ช่วยวิเคราะห์ความคิดเห็นของผู้ชมจาก YouTube "
+    "โดยจะต้องสรุปแนวโน้มความรู้สึกหลัก (เชิงบวก/ลบ/เป็นกลาง) "
+    "และประเด็นสำคัญที่ถูกพูดถึงในคอมเมนต์ โดยเขียนให้อ่านง่ายและเป็นทางการ"
+)
+SUMMARY_FAILED_MESSAGE = "ไม่สามารถสรุปความคิดเห็นได้ในขณะนี้"
+# เปลี่ยนค่านี้เมื่อแก้ prompt ของการสรุป เพื่อไม่ให้ใช้สรุปเก่าใน cache
+SUMMARY_PROMPT_VERSION = "v1"
+
+# --- การตั้งค่าการจัดข้อความเข้า prompt ---
+MAX_CHAR_LENGTH_PER_COMMENT = 120 # ตัดคอมเมนต์แต่ละรายการให้สั้นลงก่อนนำไปสรุป
+# ถ้าคอมเมนต์ทั้งหมดรวมกันไม่เกินงบนี้ จะสรุปด้วย request เดียว ไม่เช่นนั้นจะใช้ map-reduce
+SUMMARY_SINGLE_PASS_TOKEN_BUDGET = int(os.getenv("SUMMARY_SINGLE_PASS_TOKEN_BUDGET", "4000"))
+SUMMARY_CHUNK_TOKEN_BUDGET = int(os.getenv("SUMMARY_CHUNK_TOKEN_BUDGET", "4000")) # งบโทเค็นของแต่ละกลุ่มในขั้น map
+# จำนวนกลุ่มสูงสุดในขั้น map (ถ้าเกินจะเลือกคอมเมนต์แบบเว้นระยะเท่าๆ กันจากทั้งชุด) เพื่อให้เวลาสรุปคงที่
+MAX_SUMMARY_CHUNKS = int(os.getenv("MAX_SUMMARY_CHUNKS", "8"))
+MAX_CONCURRENT_SUMMARIES = int(os.getenv("MAX_CONCURRENT_SUMMARIES", "8"))
+
+# --- Cache สรุป (key = fingerprint ของข้อความที่จัดเข้า prompt แล้ว + โมเดล + เวอร์ชันของ prompt + temperature) ---
+SUMMARY_CACHE_PATH = os.getenv(
+    "SUMMARY_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "summaries.sqlite3")
+) # ตั้งเป็นค่าว่างเพื่อใช้ cache ในหน่วยความจำอย่างเดียว
+summary_cache = TieredCache(
+    "summary",
+    max_entries=int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "2000")),
+    ttl_seconds=float(os.getenv("SUMMARY_CACHE_TTL_SECONDS", str(6 * 3600))),
+    db_path=SUMMARY_CACHE_PATH or None,
+    max_disk_entries=int(os.getenv("SUMMARY_CACHE_MAX_DISK_ENTRIES", "20000")),
+)
+# ถ้าชุดคอมเมนต์ของวิดีโอเดิมเปลี่ยนไปไม่เกินสัดส่วนนี้ (Jaccard distance) จะใช้สรุปเดิมไปก่อนแล้วสรุปใหม่เบื้องหลัง
+SUMMARY_NEAR_MATCH_MAX_CHANGE = float(os.getenv("SUMMARY_NEAR_MATCH_MAX_CHANGE", "0.1"))
+SKETCH_SIZE = 256 # จำนวน hash ที่เก็บไว้ใน sketch ของชุดคอมเมนต์
+
+_refresh_tasks = {} # scope -> งานสรุปใหม่เบื้องหลังที่กำลังทำงาน
+
+
+def truncate_text_by_tokens(text: str, max_tokens: int, model_name: str = SUMMARY_MODEL) -> str:
+    """
+    ตัดข้อความที่กำหนดให้มีจำนวนโทเค็นไม่เกินที่ระบุ โดยใช้ tiktoken
+    """
+    encoding = get_encoding(model_name)
+    encoded_text = encoding.encode_ordinary(text)
+
+    if len(encoded_text) > max_tokens:
+        # เพิ่ม ... เพื่อบ่งชี้ว่าข้อความถูกตัด
+        return encoding.decode(encoded_text[:max_tokens]) + "..."
+    return text
+
+
+def prepare_comments(comments: List[str]) -> List[str]:
+    """ตัดคอมเมนต์ที่ยาวเกิน MAX_CHAR_LENGTH_PER_COMMENT และตัดคอมเมนต์ว่างออก"""
+    prepared = []
+    for comment in comments:
+        comment = " ".join(comment.split())
+        if not comment:
+            continue
+        if len(comment) > MAX_CHAR_LENGTH_PER_COMMENT:
+            comment = comment[:MAX_CHAR_LENGTH_PER_COMMENT] + "..."
+        prepared.append(comment)
+    return prepared
+
+
+def pack_comments(comments: List[str], token_budget: int, model_name: str = SUMMARY_MODEL) -> List[List[str]]:
+    """
+    จัดคอมเมนต์เป็นกลุ่มแบบ greedy ตามลำดับเดิม ให้แต่ละกลุ่ม (รวมบรรทัดใหม่ที่ใช้คั่น) มีโทเค็นไม่เกิน token_budget
+    นับโทเค็นของทุกคอมเมนต์ในครั้งเดียว (คอมเมนต์ที่ยาวเกินงบจะถูกตัดแล้วอยู่กลุ่มเดี่ยว)
+    """
+    chunks = []
+    current, current_tokens = [], 0
+    for comment, tokens in zip(comments, count_tokens(comments, model_name)):
+        tokens += 1 # บรรทัดใหม่ที่ใช้คั่นระหว่างคอมเมนต์
+        if tokens > token_budget:
+            comment = truncate_text_by_tokens(comment, token_budget - 2, model_name)
+            tokens = token_budget
+        if current and current_tokens + tokens > token_budget:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(comment)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _spread_sample(items: list, count: int) -> list:
+    """เลือก count รายการแบบเว้นระยะเท่าๆ กัน (ครอบคลุมตั้งแต่ต้นจนจบ และคงลำดับเดิม)"""
+    if count >= len(items):
+        return list(items)
+    step = len(items) / count
+    return [items[int(index * step)] for index in range(count)]
+
+
+async def _complete(openai_client: openai.AsyncOpenAI, user_prompt: str) -> str:
+    prompt_tokens = sum(count_tokens([SUMMARY_SYSTEM_PROMPT, user_prompt], SUMMARY_MODEL))
+    response = await openai_limiter.call(
+        lambda: openai_client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt},
+            ],
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=SUMMARY_TEMPERATURE,
+        ),
+        tokens=prompt_tokens + SUMMARY_MAX_TOKENS,
+        method="chat.completions",
+    )
+    return response.choices[0].message.content.strip()
+
+
+async def summarize_with_openai(text_to_summarize: str, openai_client: openai.AsyncOpenAI) -> str:
+    """สรุปคอมเมนต์ (คั่นด้วยบรรทัดใหม่) ด้วย request เดียว"""
+    try:
+        return await _complete(openai_client, (
+            f"ต่อไปนี้คือความคิดเห็นของผู้ชมจากวิดีโอ YouTube :\n\n{text_to_summarize}\n\n"
+            "โปรดสรุปภาพรวมของความคิดเห็นเหล่านี้ว่าโดยรวมมีแนวโน้มไปทางใด "
+            "(เช่น ส่วนใหญ่ชื่นชอบ, เศร้า, มีการวิจารณ์ ฯลฯ) "
+            "และมีประเด็นใดบ้างที่ถูกกล่าวถึงบ่อย โดยเขียนให้กระชับ ภายใน 100 คำ"
+        ))
+    except Exception as e:
+        logger.warning("เกิดข้อผิดพลาดระหว่างสรุปความคิดเห็น: %s", e)
+        return SUMMARY_FAILED_MESSAGE
+
+
+async def _summarize_chunk(chunk: List[str], openai_client: openai.AsyncOpenAI,
+                           semaphore: asyncio.Semaphore) -> Optional[str]:
+    """ขั้น map: สรุปคอมเมนต์หนึ่งกลุ่ม คืนค่า None ถ้าไม่สำเร็จ"""
+    async with semaphore:
+        try:
+            return await _complete(openai_client, (
+                "ต่อไปนี้คือความคิดเห็นส่วนหนึ่งของผู้ชมจากวิดีโอ YouTube :\n\n" + "\n".join(chunk) + "\n\n"
+                "โปรดสรุปแนวโน้มความรู้สึกและประเด็นที่ถูกกล่าวถึงบ่อยในความคิดเห็นชุดนี้ "
+                "เป็นข้อๆ อย่างกระชับ ภายใน 80 คำ"
+            ))
+        except Exception as e:
+            logger.warning("เกิดข้อผิดพลาดระหว่างสรุปความคิดเห็นกลุ่มย่อย: %s", e)
+            return None
+
+
+async def _reduce_summaries(partial_summaries: List[str], openai_client: openai.AsyncOpenAI) -> str:
+    """ขั้น reduce: รวมสรุปย่อยของแต่ละกลุ่มเป็นสรุปภาพรวมเดียว"""
+    numbered = "\n\n".join(f"กลุ่มที่ {index}:\n{summary}" for index, summary in enumerate(partial_summaries, start=1))
+    try:
+        return await _complete(openai_client, (
+            f"ต่อไปนี้คือสรุปย่อยของความคิดเห็นผู้ชมวิดีโอ YouTube ทีละกลุ่ม :\n\n{numbered}\n\n"
+            "โปรดรวมเป็นสรุปภาพรวมเดียวว่าโดยรวมความคิดเห็นมีแนวโน้มไปทางใด "
+            "(เช่น ส่วนใหญ่ชื่นชอบ, เศร้า, มีการวิจารณ์ ฯลฯ) "
+            "และมีประเด็นใดบ้างที่ถูกกล่าวถึงบ่อย โดยเขียนให้กระชับ ภายใน 100 คำ"
+        ))
+    except Exception as e:
+        logger.warning("เกิดข้อผิดพลาดระหว่างรวมสรุปความคิดเห็น: %s", e)
+        return SUMMARY_FAILED_MESSAGE
+
+
+def comment_set_sketch(comments: List[str], size: int = SKETCH_SIZE) -> List[int]:
+    """
+    สร้าง bottom-k sketch ของชุดคอมเมนต์ (hash 64 บิตที่น้อยที่สุด size ค่า)
+    ใช้ประมาณสัดส่วนที่ชุดคอมเมนต์สองชุดซ้ำกันโดยไม่ต้องเก็บคอมเมนต์ทั้งหมด
+    """
+    hashes = {int.from_bytes(hashlib.blake2b(comment.encode("utf-8"), digest_size=8).digest(), "big")
+              for comment in comments}
+    return sorted(hashes)[:size]
+
+
+def sketch_change(old_sketch: List[int], new_sketch: List[int], size: int = SKETCH_SIZE) -> float:
+    """ประมาณสัดส่วนที่ชุดคอมเมนต์เปลี่ยนไป (1 - Jaccard similarity) จาก sketch สองชุด"""
+    old_set, new_set = set(old_sketch), set(new_sketch)
+    union_bottom = sorted(old_set | new_set)[:size]
+    if not union_bottom:
+        return 0.0
+    shared = sum(1 for value in union_bottom if value in old_set and value in new_set)
+    return 1 - shared / len(union_bottom)
+
+
+def summary_fingerprint(chunks: List[List[str]]) -> str:
+    """key ของ cache สรุปจากข้อความที่จัดเข้า prompt แล้ว + โมเดล + เวอร์ชันของ prompt + temperature"""
+    return make_cache_key(
+        SUMMARY_MODEL, SUMMARY_PROMPT_VERSION, SUMMARY_TEMPERATURE, *("\n".join(chunk) for chunk in chunks)
+    )
+
+
+def _scope_key(scope: str) -> str:
+    return make_cache_key("scope", scope, SUMMARY_MODEL, SUMMARY_PROMPT_VERSION, SUMMARY_TEMPERATURE)
+
+
+async def _summarize_prepared(prepared: List[str], single_pass: List[List[str]],
+                              openai_client: openai.AsyncOpenAI) -> str:
+    """สรุปคอมเมนต์ที่เตรียมแล้ว (request เดียว หรือ map-reduce เมื่อเกินงบ)"""
+    if len(single_pass) == 1:
+        return await summarize_with_openai("\n".join(single_pass[0]), openai_client)
+
+    chunks = pack_comments(prepared, SUMMARY_CHUNK_TOKEN_BUDGET)
+    if len(chunks) > MAX_SUMMARY_CHUNKS:
+        # เลือกคอมเมนต์แบบเว้นระยะจากทั้งชุดให้พอดีกับจำนวนกลุ่มสูงสุด (ทุกช่วงของชุดคอมเมนต์ยังมีตัวแทน)
+        keep = len(prepared) * MAX_SUMMARY_CHUNKS // len(chunks)
+        chunks = pack_comments(_spread_sample(prepared, max(1, keep)), SUMMARY_CHUNK_TOKEN_BUDGET)[:MAX_SUMMARY_CHUNKS]
+    logger.debug("สรุปความคิดเห็นแบบ map-reduce: %d รายการ แบ่งเป็น %d กลุ่ม", len(prepared), len(chunks))
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SUMMARIES)
+    partial_summaries = await asyncio.gather(*(_summarize_chunk(chunk, openai_client, semaphore) for chunk in chunks))
+    partial_summaries = [summary for summary in partial_summaries if summary]
+    if not partial_summaries:
+        return SUMMARY_FAILED_MESSAGE
+    if len(partial_summaries) == 1:
+        return partial_summaries[0]
+    return await _reduce_summaries(partial_summaries, openai_client)
+
+
+async def _summarize_and_store(prepared: List[str], single_pass: List[List[str]], fingerprint: str,
+                               scope: Optional[str], openai_client: openai.AsyncOpenAI) -> str:
+    summary = await _summarize_prepared(prepared, single_pass, openai_client)
+    if summary != SUMMARY_FAILED_MESSAGE:
+        entries = {fingerprint: summary}
+        if scope:
+            entries[_scope_key(scope)] = {
+                "fingerprint": fingerprint, "sketch": comment_set_sketch(prepared), "summary": summary,
+            }
+        await summary_cache.aset_many(entries)
+    return summary
+
+
+def _refresh_in_background(prepared: List[str], single_pass: List[List[str]], fingerprint: str, scope: str,
+                           openai_client: openai.AsyncOpenAI) -> None:
+    """สรุปใหม่เบื้องหลัง (ไม่ซ้ำกันสำหรับ scope เดียวกัน) แล้วเก็บผลลง cache"""
+    if scope in _refresh_tasks:
+        return
+    task = asyncio.create_task(_summarize_and_store(prepared, single_pass, fingerprint, scope, openai_client))
+    _refresh_tasks[scope] = task
+    task.add_done_callback(lambda _: _refresh_tasks.pop(scope, None))
+
+
+async def cancel_background_refreshes() -> None:
+    """ยกเลิกงานสรุปใหม่เบื้องหลังที่ยังค้างอยู่ และรอให้จบก่อนปิด client (เรียกตอนปิดแอป)"""
+    tasks = list(_refresh_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def summarize_comments(comments: List[str], openai_client: openai.AsyncOpenAI, scope: Optional[str] = None) -> str:
+    """
+    สรุปแนวโน้มของคอมเมนต์ทั้งหมด
+    - ถ้าคอมเมนต์รวมกันอยู่ในงบ SUMMARY_SINGLE_PASS_TOKEN_BUDGET จะสรุปด้วย request เดียว
+    - ถ้าเกิน จะแบ่งเป็นกลุ่มตามงบโทเค็น สรุปแต่ละกลุ่มพร้อมกัน (map) แล้วรวมเป็นสรุปเดียว (reduce)
+      จำนวนกลุ่มจำกัดที่ MAX_SUMMARY_CHUNKS เวลาที่ใช้จึงไม่เพิ่มตามจำนวนคอมเมนต์
+    - ผลสรุปถูก cache ตาม fingerprint ของข้อความที่จัดเข้า prompt
+    - scope (เช่น video ID): ถ้าชุดคอมเมนต์เปลี่ยนจากครั้งก่อนไม่เกิน SUMMARY_NEAR_MATCH_MAX_CHANGE
+      จะคืนค่าสรุปเดิมทันทีแล้วสรุปใหม่เบื้องหลัง
+    """
+    prepared = prepare_comments(comments)
+    if not prepared:
+        return SUMMARY_FAILED_MESSAGE
+
+    single_pass = pack_comments(prepared, SUMMARY_SINGLE_PASS_TOKEN_BUDGET)
+    fingerprint = summary_fingerprint(single_pass)
+    cached = await summary_cache.aget(fingerprint)
+    if cached is not None:
+        return cached
+
+    if scope:
+        previous = await summary_cache.aget(_scope_key(scope))
+        if previous is not None:
+            change = sketch_change(previous["sketch"], comment_set_sketch(prepared))
+            if change <= SUMMARY_NEAR_MATCH_MAX_CHANGE:
+                logger.debug("ใช้สรุปเดิมของ %s (ชุดคอมเมนต์เปลี่ยนไป %.1f%%) และสรุปใหม่เบื้องหลัง", scope, change * 100)
+                _refresh_in_background(prepared, single_pass, fingerprint, scope, openai_client)
+                return previous["summary"]
+
+    return await _summarize_and_store(prepared, single_pass, fingerprint, scope, openai_client)
@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+from batch_scheduler import MicroBatcher
+
+
+def test_failed_submission_is_not_dispatched_again():
+    processed = []
+
+    async def process_batch(items):
+        processed.append(list(items))
+        if len(processed) == 1:
+            raise RuntimeError("backend down")
+        return [item * 2 for item in items]
+
+    async def run():
+        batcher = MicroBatcher(process_batch, max_batch_size=2, max_wait_ms=1, max_concurrent_batches=1)
+        try:
+            with pytest.raises(RuntimeError):
+                await batcher.submit([1, 2, 3, 4, 5])
+            assert await batcher.submit([6]) == [12]
+            return batcher.stats()
+        finally:
+            await batcher.aclose()
+
+    stats = asyncio.run(run())
+    assert processed == [[1, 2], [6]]
+    assert stats["pending_items"] == 0
+    assert stats["cancelled"] == 0
@@ -0,0 +1,54 @@
+import random
+import re
+
+import pytest
+
+import clean_text
+from clean_text import clean_batch, normalize
+
+# กรณีพิเศษ: ช่องว่างแปลกๆ, สระซ้อน, zero-width space, URL ติดข้อความ, อิโมจิ, เลขไทย และภาษาอื่น
+GOLDEN_CASES = [
+    "", "   ", "\n\t", "เเปลก", "นานาาา", "\u0e4aกขค", "ก\u200bข\u200cค", "ww\u200bw.example.com ok",
+    "ดูที่ https://youtu.be/abc?t=1 นะ", "ahttp://x.y b", "www.example.com/ไทย!", "สุดยอด!!! 👍👍 🇹🇭",
+    "ราคา ฿100.50 (ถูกมาก)", "ok\u00a0\u00a0spaces\u3000here", "emoji😂in😂text", "๑๒๓ ๙๙ ๏ ๚ ๛",
+    "Привет, мир!", "日本語のコメント。", "tab\tand\nnewline\r\nend", "café naïve", "a_b-c.d",
+    "คลิปนี้ดีมากเลยครับ ขอบคุณที่ทำมาให้ดู", "I don't get why people hate this, คลิปนี้ดีออก",
+]
+FUZZ_ALPHABET = list(" \t\n\u00a0\u200b\u200c.,!?:/#@_-'\"()😂👍🇹🇭ก่้๊๋ัิีเแาำะๆ๏๙฿ewhtpsABC123日Пéๅํฺ")
+
+
+def clean_text_reference(text):
+    """การทำความสะอาดแบบเดิม (ก่อนรวม pattern และข้าม normalize) ที่ clean_batch ต้องให้ผลตรงกันทุกตัวอักษร"""
+    text = normalize(text)
+    text = re.sub(r"http\S+|www\S+|https\S+", "", text, flags=re.MULTILINE)
+    text = re.sub(r"[^\w\sก-๙]", "", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+@pytest.fixture(scope="module")
+def golden_corpus():
+    pytest.importorskip("pythainlp")
+    rng = random.Random(0)
+    fuzz = ["".join(rng.choice(FUZZ_ALPHABET) for _ in range(rng.randint(0, 60))) for _ in range(2000)]
+    texts = GOLDEN_CASES + fuzz
+    return texts, [clean_text_reference(text) for text in texts]
+
+
+@pytest.mark.parametrize("mode", sorted(clean_text.CLEANERS))
+def test_clean_batch_matches_reference(golden_corpus, mode):
+    texts, expected = golden_corpus
+    assert clean_batch(texts, mode=mode, process_threshold=0) == expected
+
+
+def test_process_pool_matches_reference(golden_corpus):
+    texts, expected = golden_corpus
+    try:
+        assert clean_batch(texts, mode="regex", process_threshold=1, max_workers=2) == expected
+    finally:
+        clean_text.shutdown_process_pool()
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        clean_batch(["a"], mode="unknown")
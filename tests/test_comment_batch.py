@@ -0,0 +1,88 @@
+import random
+
+import numpy as np
+
+from comment_batch import (CommentBatch, LABEL_NAMES, LABEL_POSITIVE, LABEL_SKIPPED, LABEL_UNANALYZABLE,
+                           SKIPPED_BY_LENGTH_LABEL, STATUS_ANALYZED, STATUS_CLEANED, STATUS_SKIPPED,
+                           STATUS_TRANSLATED, STATUS_TRANSLATION_FAILED, UNANALYZABLE_LABEL)
+from pipeline import new_tally, tally_batch
+
+
+def make_batch():
+    rows = [{"comment_id": f"c{index}", "text": f"text {index}", "published_at": f"2024-01-0{index + 1}"}
+            for index in range(6)]
+    batch = CommentBatch.from_rows(rows)
+    batch.translations = [f"translated {index}" for index in range(6)]
+    batch.status |= STATUS_TRANSLATED
+    batch.mark_translation_failed([4])
+    batch.mark_skipped(np.array([1]))
+    to_clean = np.array([0, 2, 3, 4, 5])
+    batch.set_cleaned(to_clean, [f"cleaned {index}" for index in to_clean.tolist()])
+    # แถว 3 ไม่มีผล (backend ล้มเหลว) แถว 5 ไม่มีผลเพราะ results สั้นกว่า
+    batch.set_predictions(to_clean, [{"label": "positive", "score": 0.9}, {"label": "negative", "score": 0.8},
+                                     None, {"label": "neutral", "score": 0.7}])
+    return batch
+
+
+def test_status_bitmask():
+    batch = make_batch()
+    assert batch.indexes_with_status(STATUS_SKIPPED).tolist() == [1]
+    assert batch.indexes_with_status(STATUS_CLEANED).tolist() == [0, 2, 3, 4, 5]
+    assert batch.indexes_with_status(STATUS_ANALYZED).tolist() == [0, 2, 4]
+    assert batch.indexes_with_status(STATUS_TRANSLATION_FAILED).tolist() == [4]
+    assert batch.has_status(STATUS_TRANSLATED).all()
+    # ได้ผลสุดท้าย: ทำนายสำเร็จหรือข้ามเพราะความยาว และแปลสำเร็จ
+    assert np.flatnonzero(batch.final_rows()).tolist() == [0, 1, 2]
+
+
+def test_store_rows_stay_aligned():
+    batch = make_batch()
+    rows = list(batch.store_rows())
+    assert [row[:5] for row in rows] == [
+        (index, f"c{index}", f"text {index}", f"2024-01-0{index + 1}", f"translated {index}") for index in range(6)
+    ]
+    assert [row[5] for row in rows] == ["positive", SKIPPED_BY_LENGTH_LABEL, "negative", UNANALYZABLE_LABEL,
+                                        "neutral", UNANALYZABLE_LABEL]
+    assert [row[6] for row in rows] == [0.9, None, 0.8, None, 0.7, None]
+    assert [row[7] for row in rows] == [False, True, False, False, False, False] # skipped
+    assert [row[8] for row in rows] == [False, False, False, True, True, True] # failed
+
+
+def test_display_and_summary_rows():
+    batch = make_batch()
+    assert batch.display_rows()[1] == {"text": "text 1", "sentiment": SKIPPED_BY_LENGTH_LABEL}
+    assert batch.summary_texts() == ["text 0", "text 2", "text 3", "text 4", "text 5"]
+
+
+def dict_tally(sentiments):
+    """การนับแบบเดิม: วนทีละแถวด้วยชื่อ label"""
+    tally = new_tally()
+    for sentiment in sentiments:
+        tally["total_comments"] += 1
+        if sentiment in ("positive", "negative", "neutral"):
+            tally[f"{sentiment}_count"] += 1
+            tally["total_comments_analyzed"] += 1
+        elif sentiment == SKIPPED_BY_LENGTH_LABEL:
+            tally["total_comments_skipped_by_length"] += 1
+    return tally
+
+
+def test_bincount_tally_matches_dict_tally():
+    rng = random.Random(0)
+    batch = CommentBatch([f"comment {index}" for index in range(1000)])
+    batch.labels[:] = rng.choices(range(len(LABEL_NAMES)), k=len(batch))
+    tally = new_tally()
+    tally_batch(batch, tally)
+    assert tally == dict_tally(batch.label_names())
+
+    rows = batch.labels != LABEL_UNANALYZABLE
+    subset = new_tally()
+    tally_batch(batch, subset, rows)
+    assert subset == dict_tally(np.array(batch.label_names())[rows].tolist())
+
+
+def test_label_counts_include_every_code():
+    batch = CommentBatch(["a", "b"])
+    batch.labels[:] = [LABEL_POSITIVE, LABEL_SKIPPED]
+    assert batch.label_counts().tolist() == [0, 0, 1, 0, 1]
+    assert CommentBatch([]).label_counts().tolist() == [0] * len(LABEL_NAMES)
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pipeline
+from comment_store import CommentResultStore
+from pipeline import run_comment_pipeline, with_pending_counts
+from translate_text import translate_to_thai
+
+PAGE = [
+    {"comment_id": "c3", "text": "This video is really great, thank you", "published_at": "2024-01-03T00:00:00Z"},
+    {"comment_id": "c2", "text": "คลิปนี้ดีมากเลยครับ", "published_at": "2024-01-02T00:00:00Z"},
+    {"comment_id": "c1", "text": "The audio is a bit quiet in this one", "published_at": "2024-01-01T00:00:00Z"},
+]
+
+
+async def _pages(*pages):
+    for page in pages:
+        yield page
+
+
+async def _all_positive(texts):
+    return [{"label": "positive", "score": 0.9} for _ in texts]
+
+
+def _analyze(store, monkeypatch, page=PAGE):
+    monkeypatch.setattr(pipeline, "predict_sentiment", _all_positive)
+    return asyncio.run(run_comment_pipeline(_pages(page), None,
+                                            on_page=lambda batch: store.asave_page("v1", batch)))
+
+
+def test_no_openai_client_is_a_final_result():
+    failed = []
+    texts = [row["text"] for row in PAGE]
+    assert asyncio.run(translate_to_thai(texts, None, failed_indexes=failed)) == texts
+    assert failed == []
+
+
+def test_no_openai_key_keeps_non_thai_comments(tmp_path, monkeypatch):
+    store = CommentResultStore(str(tmp_path / "comments.sqlite3"))
+    result = _analyze(store, monkeypatch)
+
+    totals = with_pending_counts(store.get_video_totals("v1"), result)
+    assert totals["total_comments"] == 3
+    assert totals["positive_count"] == 3
+    assert [row["comment_id"] for row in store.recent_comments("v1")] == ["c3", "c2", "c1"]
+    # ทุกแถวได้ผลสุดท้ายแล้ว การวิเคราะห์ครั้งถัดไปหยุดที่คอมเมนต์เหล่านี้ได้
+    assert store.known_comment_ids("v1") == {"c1", "c2", "c3"}
+
+
+def test_transient_translation_failure_is_counted_and_retried(tmp_path, monkeypatch):
+    async def fail_first(texts, openai_client, failed_indexes=None):
+        failed_indexes.append(0)
+        return list(texts)
+
+    monkeypatch.setattr(pipeline, "translate_to_thai", fail_first)
+    store = CommentResultStore(str(tmp_path / "comments.sqlite3"))
+    result = _analyze(store, monkeypatch)
+
+    # แถวที่ล้มเหลวยังอยู่ในผลของรอบนี้ แต่ไม่อยู่ในยอดรวมที่เก็บไว้
+    assert store.get_video_totals("v1")["total_comments"] == 2
+    assert with_pending_counts(store.get_video_totals("v1"), result)["total_comments"] == 3
+    assert len(result["comments"]) == 3
+    assert "c3" not in {row["comment_id"] for row in store.recent_comments("v1")}
+    # การไล่อ่านครั้งถัดไปผ่าน c3 (ที่ล้มเหลว) ก่อนหยุดที่คอมเมนต์ที่เก่ากว่า
+    assert store.known_comment_ids("v1") == {"c1", "c2"}
+
+    # รอบถัดไปแปลสำเร็จ: แถวเดิมถูกนับเพิ่มครั้งเดียว และไม่ต้องไล่อ่านซ้ำอีก
+    monkeypatch.setattr(pipeline, "translate_to_thai", translate_to_thai)
+    result = _analyze(store, monkeypatch)
+    assert store.get_video_totals("v1")["total_comments"] == 3
+    assert with_pending_counts(store.get_video_totals("v1"), result)["total_comments"] == 3
+    assert store.known_comment_ids("v1") == {"c1", "c2", "c3"}
+
+
+def test_recent_comments_before_run_excludes_rows_saved_by_the_run(tmp_path, monkeypatch):
+    store = CommentResultStore(str(tmp_path / "comments.sqlite3"))
+    _analyze(store, monkeypatch, PAGE[1:])
+    run_started_at = time.time()
+    _analyze(store, monkeypatch, PAGE[:1])
+    assert [row["comment_id"] for row in store.recent_comments("v1", analyzed_before=run_started_at)] == ["c2", "c1"]
@@ -0,0 +1,30 @@
+import numpy as np
+
+from detect_language import (SCRIPT_AMBIGUOUS, SCRIPT_KEEP, SCRIPT_TRANSLATE, classify_scripts,
+                             needs_translation_batch, script_ratios)
+
+
+def test_classify_scripts():
+    texts = [
+        "คลิปนี้ดีมากเลยครับ ขอบคุณที่ทำมาให้ดู", # ไทยล้วน
+        "ชอบมากค่ะ รอติดตามตอนต่อไปนะคะ ok", # ไทยเป็นส่วนใหญ่
+        "This is the best video I have seen all week",
+        "Отличное видео, спасибо",
+        "I don't get why people hate this, คลิปนี้ดีออก", # ผสม ต้องใช้ langdetect
+    ]
+    assert classify_scripts(texts).tolist() == [SCRIPT_KEEP, SCRIPT_KEEP, SCRIPT_TRANSLATE, SCRIPT_TRANSLATE,
+                                                SCRIPT_AMBIGUOUS]
+
+
+def test_script_ratios_ignore_symbols_and_emoji():
+    ratios = script_ratios(["ดีมาก 😂😂", "nice 👍", "😂", ""])
+    assert ratios.tolist() == [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]]
+
+
+def test_lone_surrogate_does_not_fail_the_batch():
+    texts = ["great video \ud83d thanks", "ดีมาก\udc00ครับ", "nice"]
+    ratios = script_ratios(texts)
+    # surrogate ไม่ถูกนับเป็นตัวอักษร และไม่ทำให้ข้อความถัดไปเลื่อนตำแหน่ง
+    assert np.allclose(ratios, [[0.0, 1.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    assert classify_scripts(texts).tolist() == [SCRIPT_TRANSLATE, SCRIPT_KEEP, SCRIPT_TRANSLATE]
+    assert needs_translation_batch(texts) == [True, False, False] # "nice" สั้นเกินกว่าจะแปล
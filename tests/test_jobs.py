@@ -0,0 +1,52 @@
+import asyncio
+
+from jobs import JOB_DONE, JobQueue
+from metrics import _request_timings, record_stage
+
+
+def test_job_timings_do_not_leak_into_the_submitting_request():
+    async def run():
+        queue = JobQueue(results=None)
+        request_timings = {}
+        _request_timings.set(request_timings) # เหมือน MetricsMiddleware ของ request ที่ submit งานแรก
+
+        async def analyze(job):
+            record_stage("inference", 0.5)
+            return {}
+
+        try:
+            job = queue.submit("video", analyze)
+            while job.status != JOB_DONE:
+                await asyncio.sleep(0.01)
+        finally:
+            await queue.aclose()
+        return request_timings
+
+    assert asyncio.run(run()) == {}
+
+
+def test_forgotten_job_is_read_back_from_results(tmp_path):
+    from cache_store import TieredCache
+
+    async def run():
+        queue = JobQueue(num_workers=1, max_tracked_jobs=1,
+                         results=TieredCache("job_results", max_entries=1, db_path=str(tmp_path / "jobs.sqlite3")))
+
+        async def analyze(job):
+            return {"video_title": job.kind}
+
+        try:
+            first = queue.submit("first", analyze)
+            while first.status != JOB_DONE:
+                await asyncio.sleep(0.01)
+            second = queue.submit("second", analyze) # ลืม first จากหน่วยความจำ (และจาก LRU ของ results)
+            while second.status != JOB_DONE:
+                await asyncio.sleep(0.01)
+            assert queue.get(first.id) is None
+            return await queue.aget_snapshot(first.id), await queue.aget_result(first.id)
+        finally:
+            await queue.aclose()
+
+    snapshot, result = asyncio.run(run())
+    assert snapshot["status"] == JOB_DONE
+    assert result == {"video_title": "first"}
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+import predict_sentiment
+from fake_upstreams import FakeUpstreams, FakeUpstreamServer
+from rate_limiter import TokenBucket, hf_limiter
+from sentiment_backends import id2label
+
+
+@pytest.fixture(scope="module")
+def upstream_server():
+    """server จำลองจาก fake_upstreams.py บน socket จริง (uvicorn ใน thread แยก) ใช้ร่วมกันทั้งโมดูล"""
+    upstreams = FakeUpstreams(hf_latency="uniform:0:20") # ผลของแต่ละกลุ่มกลับมาไม่ตรงลำดับที่ส่ง
+    server = FakeUpstreamServer(upstreams)
+    base_url = server.start()
+    yield upstreams, base_url
+    server.stop()
+
+
+@pytest.fixture
+def backoff_delays(monkeypatch):
+    """เวลารอก่อนลองใหม่ที่คำนวณได้ (บันทึกไว้แทนการรอจริง)"""
+    delays = []
+    backoff_delay = predict_sentiment._backoff_delay
+
+    def recording_backoff_delay(attempt, response=None):
+        delays.append(backoff_delay(attempt, response))
+        return 0
+
+    monkeypatch.setattr(predict_sentiment, "_backoff_delay", recording_backoff_delay)
+    return delays
+
+
+@pytest.fixture
+def hf_server(upstream_server, backoff_delays, monkeypatch):
+    """
+    ชี้ predict_sentiment ไปยัง Inference API จำลอง แล้วคืนค่า FakeUpstreams ที่ใช้กำหนดคำตอบ
+    (scripted_responses["inference"], rejected_texts) และดูจำนวน request (requests["inference"])
+    """
+    upstreams, base_url = upstream_server
+    upstreams.requests.clear()
+    upstreams.scripted_responses.clear()
+    upstreams.rejected_texts.clear()
+
+    monkeypatch.setattr(predict_sentiment, "API_URL", f"{base_url}/hf/models/{predict_sentiment.MODEL_ID}")
+    monkeypatch.setattr(predict_sentiment, "_hf_client", None) # client ใหม่ใน event loop ของแต่ละเทสต์
+    monkeypatch.setattr(hf_limiter, "requests", TokenBucket(1e9, 1e9)) # ไม่ให้ตัวจำกัดอัตราหน่วงเทสต์
+    return upstreams
+
+
+def run_with_client(coroutine):
+    """รัน coroutine แล้วปิด client ที่ใช้ร่วมกันก่อน event loop ของเทสต์จะปิด"""
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await predict_sentiment.close_hf_client()
+
+    return asyncio.run(run())
+
+
+def expected_label(upstreams, text):
+    scores = [prediction["score"] for prediction in upstreams.sentiment_prediction(text)]
+    return id2label[scores.index(max(scores))]
+
+
+def test_split_into_chunks_at_size_limits():
+    texts = ["a" * 10] * 7
+    assert predict_sentiment.split_into_chunks(texts, max_texts=3, max_chars=1000) == [[0, 1, 2], [3, 4, 5], [6]]
+    # รวมได้พอดีขีดจำกัดตัวอักษรอยู่ในกลุ่มเดียว เกินหนึ่งตัวอักษรขึ้นกลุ่มใหม่
+    assert predict_sentiment.split_into_chunks(texts[:3], max_texts=10, max_chars=30) == [[0, 1, 2]]
+    assert predict_sentiment.split_into_chunks(texts[:3], max_texts=10, max_chars=29) == [[0, 1], [2]]
+    # ข้อความที่ยาวเกินขีดจำกัดเองอยู่ในกลุ่มของตัวเอง
+    assert predict_sentiment.split_into_chunks(["a" * 50, "b"], max_texts=10, max_chars=20) == [[0], [1]]
+    assert predict_sentiment.split_into_chunks([]) == []
+
+
+def test_query_retries_503_and_honours_retry_after(hf_server, backoff_delays):
+    hf_server.scripted_responses["inference"] = [
+        (503, {"Retry-After": "3"}, {"error": "model is loading"}),
+        (429, {}, {"error": "rate limited"}),
+    ]
+    result = run_with_client(predict_sentiment.query_hf_api({"inputs": ["positive-1"]}))
+
+    assert result == [hf_server.sentiment_prediction("positive-1")]
+    assert hf_server.requests["inference"] == 3
+    assert backoff_delays[0] >= 3
+
+
+def test_query_gives_up_after_max_retries(hf_server):
+    hf_server.scripted_responses["inference"] = [(503, {}, {})] * (predict_sentiment.MAX_RETRIES + 1)
+    assert run_with_client(predict_sentiment.query_hf_api({"inputs": ["neutral-1"]})) == []
+    assert hf_server.requests["inference"] == predict_sentiment.MAX_RETRIES + 1
+
+
+def test_query_does_not_retry_client_errors(hf_server):
+    hf_server.scripted_responses["inference"] = [(400, {}, {"error": "bad request"})]
+    assert run_with_client(predict_sentiment.query_hf_api({"inputs": ["neutral-1"]})) == []
+    assert hf_server.requests["inference"] == 1
+
+
+def test_results_are_reassembled_in_input_order(hf_server):
+    chunk_size = predict_sentiment.MAX_TEXTS_PER_CHUNK
+    texts = [f"comment-{index}" for index in range(chunk_size * 2 + 5)]
+
+    results = run_with_client(predict_sentiment._predict_uncached(texts))
+
+    assert hf_server.requests["inference"] == 3
+    assert [result["label"] for result in results] == [expected_label(hf_server, text) for text in texts]
+
+
+def test_failed_chunk_only_loses_its_own_rows(hf_server):
+    chunk_size = predict_sentiment.MAX_TEXTS_PER_CHUNK
+    texts = [f"comment-{index}" for index in range(chunk_size * 3)]
+    hf_server.rejected_texts.add(texts[chunk_size + 1]) # ทำให้กลุ่มที่สองล้มเหลว
+
+    results = run_with_client(predict_sentiment._predict_uncached(texts))
+
+    assert results[chunk_size:chunk_size * 2] == [None] * chunk_size
+    assert [result["label"] for result in results[:chunk_size] + results[chunk_size * 2:]] == [
+        expected_label(hf_server, text) for text in texts[:chunk_size] + texts[chunk_size * 2:]
+    ]
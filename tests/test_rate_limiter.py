@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limiter
+from rate_limiter import AIMDConcurrency, QuotaExceededError, QuotaLedger, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """นาฬิกาที่เลื่อนเองได้ แทน time.monotonic ของ rate_limiter"""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def utc_now(monkeypatch):
+    """กำหนดเวลาปัจจุบัน (UTC) ที่ QuotaLedger เห็น"""
+    current = SimpleNamespace(value=datetime(2024, 3, 1, 12, 0, tzinfo=timezone.utc))
+
+    class FakeDatetime:
+        @staticmethod
+        def now(tz=None):
+            return current.value.astimezone(tz)
+
+    monkeypatch.setattr(rate_limiter, "datetime", FakeDatetime)
+    return current
+
+
+def test_token_bucket_refills_at_rate_up_to_capacity(clock):
+    bucket = TokenBucket(rate_per_second=2, capacity=4)
+    assert [bucket._reserve(1) for _ in range(4)] == [0, 0, 0, 0] # burst เท่าความจุ
+    assert bucket._reserve(1) == pytest.approx(0.5) # ติดลบหนึ่งโทเค็น รอ 1/rate
+    clock.now += 1.0 # เติม 2 โทเค็น: -1 → 1
+    assert bucket._reserve(1) == 0
+    clock.now += 100 # เติมได้ไม่เกินความจุ
+    assert [bucket._reserve(1) for _ in range(4)] == [0, 0, 0, 0]
+    assert bucket._reserve(1) == pytest.approx(0.5)
+
+
+def test_token_bucket_caps_oversized_requests(clock):
+    bucket = TokenBucket(rate_per_second=10, capacity=5)
+    assert bucket._reserve(50) == 0 # ใช้ได้ไม่เกินความจุ จึงไม่ต้องรอตลอดไป
+    assert bucket._reserve(5) == pytest.approx(0.5)
+
+
+def test_quota_rolls_over_at_pacific_midnight(utc_now):
+    ledger = QuotaLedger(daily_units=150, costs={"search": 100})
+    ledger.charge("search")
+    ledger.charge("videos")
+    with pytest.raises(QuotaExceededError):
+        ledger.charge("search")
+    assert ledger.stats()["spent_by_method"] == {"search": 100, "videos": 1}
+
+    # 07:59 UTC ของวันถัดไปยังเป็นวันเดิมตามเวลาแปซิฟิก (UTC-8)
+    utc_now.value = datetime(2024, 3, 2, 7, 59, tzinfo=timezone.utc)
+    with pytest.raises(QuotaExceededError):
+        ledger.charge("search")
+
+    utc_now.value = datetime(2024, 3, 2, 8, 0, tzinfo=timezone.utc) # เที่ยงคืนเวลาแปซิฟิก
+    ledger.charge("search")
+    assert ledger.stats()["day"] == "2024-03-02"
+    assert ledger.stats()["spent"] == 100
+
+
+def test_quota_mark_exhausted_lasts_until_rollover(utc_now):
+    ledger = QuotaLedger(daily_units=100, costs={})
+    ledger.mark_exhausted()
+    with pytest.raises(QuotaExceededError):
+        ledger.charge("videos")
+    utc_now.value = datetime(2024, 3, 2, 8, 0, tzinfo=timezone.utc)
+    ledger.charge("videos")
+
+
+def test_aimd_increases_additively_and_decreases_once_per_window(clock):
+    concurrency = AIMDConcurrency(initial=4, minimum=1, maximum=5, latency_target=1.0)
+    concurrency.record(started_at=clock.now, latency=0.1, overloaded=False)
+    assert concurrency.limit == pytest.approx(4.25) # +1/limit
+
+    started_before = clock.now
+    clock.now += 1
+    concurrency.record(started_at=started_before, latency=0.1, overloaded=True)
+    assert concurrency.limit == pytest.approx(2.125)
+    # request ที่เริ่มก่อนการลดครั้งล่าสุดไม่ลดซ้ำ
+    concurrency.record(started_at=started_before, latency=0.1, overloaded=True)
+    assert concurrency.limit == pytest.approx(2.125)
+
+    clock.now += 1
+    concurrency.record(started_at=clock.now, latency=2.0, overloaded=False) # ช้ากว่า latency_target
+    assert concurrency.limit == pytest.approx(1.0625)
+    clock.now += 1
+    concurrency.record(started_at=clock.now, latency=0.1, overloaded=True)
+    assert concurrency.limit == 1 # ไม่ต่ำกว่า minimum
+    assert concurrency.stats()["decreases"] == 3
+
+    for _ in range(100):
+        concurrency.record(started_at=clock.now, latency=0.1, overloaded=False)
+    assert concurrency.limit == 5 # ไม่เกิน maximum
+
+
+def test_aimd_queues_beyond_the_limit():
+    async def run():
+        concurrency = AIMDConcurrency(initial=2, minimum=1, maximum=4, latency_target=1.0)
+        await concurrency.acquire()
+        await concurrency.acquire()
+        third = asyncio.create_task(concurrency.acquire())
+        await asyncio.sleep(0)
+        waiting = not third.done()
+        concurrency.release()
+        await asyncio.wait_for(third, timeout=1)
+        return waiting, concurrency.in_flight
+
+    assert asyncio.run(run()) == (True, 2)
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from fetch_comments import ReservoirSampler
+from pipeline import SummarySample
+
+
+def sample(items, k, seed=0):
+    sampler = ReservoirSampler(k, random.Random(seed))
+    for item in items:
+        sampler.add(item)
+    return sampler
+
+
+def test_zero_size_keeps_nothing_but_counts():
+    sampler = sample(range(10), 0)
+    assert sampler.items == []
+    assert sampler.seen == 10
+
+
+@pytest.mark.parametrize("count", [0, 3, 5])
+def test_keeps_everything_up_to_k_in_order(count):
+    sampler = sample(range(count), 5)
+    assert sampler.items == list(range(count))
+    assert sampler.seen == count
+
+
+def test_same_seed_gives_same_sample():
+    assert sample(range(1000), 10, seed=7).items == sample(range(1000), 10, seed=7).items
+    assert sample(range(1000), 10, seed=7).items != sample(range(1000), 10, seed=8).items
+
+
+def test_every_item_is_equally_likely():
+    count, k, trials = 20, 5, 4000
+    picks = [0] * count
+    for seed in range(trials):
+        sampled = sample(range(count), k, seed).items
+        assert len(sampled) == k and len(set(sampled)) == k
+        for item in sampled:
+            picks[item] += 1
+    # ความน่าจะเป็นที่แต่ละรายการถูกเลือกคือ k/count (ช่วงนี้กว้างประมาณ 5 เท่าของส่วนเบี่ยงเบนมาตรฐาน)
+    assert all(abs(pick / trials - k / count) < 0.035 for pick in picks)
+
+
+def test_summary_sample_is_deterministic_and_bounded():
+    texts = [f"comment {index}" for index in range(500)]
+    first, second = SummarySample(limit=50), SummarySample(limit=50)
+    first.extend(texts[:200])
+    first.extend(texts[200:])
+    second.extend(texts)
+    assert first.texts == second.texts # ผลไม่ขึ้นกับการแบ่งหน้า
+    assert len(first.texts) == 50
+    assert set(first.texts) <= set(texts)
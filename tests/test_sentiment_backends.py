@@ -0,0 +1,43 @@
+import pytest
+
+from sentiment_backends import LocalTransformersBackend, SentimentBackend
+
+TEXTS = [
+    "ดีมาก",
+    "This is the best video I have seen all week, thank you so much for making it",
+    "555",
+    "เสียงเบาไปหน่อย แต่เนื้อหาดีมาก",
+    "nice video",
+    "The editing is great but the audio is a bit quiet, please fix it next time",
+    "first",
+]
+
+
+@pytest.fixture(scope="module")
+def tiny_model_path(tmp_path_factory):
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    from benchmark import make_tiny_checkpoint
+
+    return make_tiny_checkpoint(str(tmp_path_factory.mktemp("tiny-model")))
+
+
+def test_sentiment_backend_requires_predict():
+    with pytest.raises(TypeError):
+        SentimentBackend()
+
+
+def test_length_bucketing_keeps_input_order(tiny_model_path):
+    bucketed = LocalTransformersBackend(tiny_model_path, max_batch_size=3, max_batch_tokens=60)
+    # ทีละข้อความ: ไม่มีการเรียงใหม่และไม่มี padding
+    one_by_one = LocalTransformersBackend(tiny_model_path, max_batch_size=1)
+
+    assert len(bucketed.make_buckets([len(text) for text in TEXTS])) > 1
+    results = bucketed.predict_sync(TEXTS)
+    expected = one_by_one.predict_sync(TEXTS)
+
+    assert len(results) == len(TEXTS)
+    assert [result["label"] for result in results] == [result["label"] for result in expected]
+    for result, reference in zip(results, expected):
+        assert set(result["scores"]) == {"negative", "neutral", "positive"}
+        assert result["scores"] == pytest.approx(reference["scores"], abs=1e-4)
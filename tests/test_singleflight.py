@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import singleflight
+from singleflight import SingleFlight
+
+
+def test_error_is_delivered_to_every_waiter():
+    async def run():
+        flights = SingleFlight()
+        calls = 0
+
+        async def fail(notify):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream down")
+
+        results = await asyncio.gather(*(flights.do("video", fail) for _ in range(3)), return_exceptions=True)
+        # exception ไม่ถูกเก็บเป็นผลล่าสุด ผู้เรียกรายถัดไปเริ่มงานใหม่
+        with pytest.raises(ValueError):
+            await flights.do("video", fail)
+        return results, calls, flights.stats()
+
+    results, calls, stats = asyncio.run(run())
+    assert [type(result) for result in results] == [ValueError] * 3
+    assert calls == 2
+    assert stats["errors"] == 2 and stats["followers"] == 2
+
+
+def test_cancelling_the_leader_does_not_cancel_followers():
+    async def run():
+        flights = SingleFlight()
+        release = asyncio.Event()
+        events = []
+
+        async def work(notify):
+            notify("fetched", 1)
+            await release.wait()
+            notify("analyzed", 1)
+            return "result"
+
+        leader = asyncio.create_task(flights.do("video", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("video", work, listener=lambda *event: events.append(event)))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return leader, await follower, events
+
+    leader, result, events = asyncio.run(run())
+    assert leader.cancelled()
+    assert result == "result"
+    assert events == [("analyzed", 1)] # follower ได้ event หลังเข้าร่วม แม้ leader จะถูกยกเลิกไปแล้ว
+
+
+def test_work_is_cancelled_when_the_last_waiter_leaves():
+    async def run():
+        flights = SingleFlight()
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def work(notify):
+            started.set()
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(flights.do("video", work)) for _ in range(2)]
+        await started.wait()
+        waiters[0].cancel()
+        await asyncio.sleep(0)
+        assert not cancelled.is_set() # ยังมีผู้รออีกหนึ่งราย
+        waiters[1].cancel()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        return flights.stats()
+
+    stats = asyncio.run(run())
+    assert stats["abandoned"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_recent_result_expires_after_result_ttl(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(singleflight, "time", SimpleNamespace(monotonic=lambda: clock.now))
+
+    async def run():
+        flights = SingleFlight(result_ttl=10)
+        calls = 0
+
+        async def work(notify):
+            nonlocal calls
+            calls += 1
+            return calls
+
+        first = await flights.do("video", work)
+        clock.now += 9.9
+        cached = await flights.do("video", work)
+        clock.now += 0.1
+        refreshed = await flights.do("video", work)
+        return first, cached, refreshed
+
+    assert asyncio.run(run()) == (1, 1, 2)
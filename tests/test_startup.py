@@ -0,0 +1,47 @@
+import asyncio
+
+import startup
+
+
+def test_not_ready_until_background_warm_up_finishes(monkeypatch):
+    monkeypatch.setattr(startup, "WARM_UP_TASKS", {})
+    monkeypatch.setattr(startup, "_status", {"state": "starting", "seconds": None, "tasks": {}})
+
+    async def run():
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+
+        task = asyncio.create_task(startup.warm_up({"slow": slow})) # เหมือน lifespan: แอปรับ request ระหว่างนี้
+        await asyncio.sleep(0)
+        during = startup.is_ready()
+        release.set()
+        await task
+        return during, startup.is_ready()
+
+    assert asyncio.run(run()) == (False, True)
+
+
+def test_timeout_cancels_unfinished_tasks(monkeypatch):
+    monkeypatch.setattr(startup, "WARM_UP_TASKS", {})
+    monkeypatch.setattr(startup, "WARM_UP_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(startup, "_status", {"state": "starting", "seconds": None, "tasks": {}})
+
+    async def run():
+        cancelled = asyncio.Event()
+
+        async def hang():
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        status = await startup.warm_up({"hang": hang})
+        return status, cancelled.is_set()
+
+    status, cancelled = asyncio.run(run())
+    assert cancelled
+    assert status["state"] == "ready"
+    assert "hang" not in status["tasks"]
@@ -0,0 +1,124 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import summarizer
+import token_utils
+from cache_store import TieredCache
+from summarizer import comment_set_sketch, count_tokens, pack_comments, sketch_change, summarize_comments
+
+
+@pytest.fixture(autouse=True)
+def approximate_encoding(monkeypatch):
+    """นับโทเค็นด้วย ApproximateEncoding (ไม่โหลด tiktoken) และใช้ cache สรุปในหน่วยความจำ"""
+    monkeypatch.setattr(token_utils, "TOKEN_ENCODING", "approximate")
+    monkeypatch.setattr(summarizer, "summary_cache", TieredCache("summary", max_entries=100))
+    token_utils.get_encoding.cache_clear()
+    yield
+    token_utils.get_encoding.cache_clear()
+
+
+class FakeOpenAI:
+    """client ที่มีเฉพาะ chat.completions.create ตอบเป็น "summary <ครั้งที่เรียก>" """
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"summary {self.calls}"))])
+
+
+def chunk_tokens(chunk):
+    return sum(count_tokens(chunk)) + len(chunk) # รวมบรรทัดใหม่ที่ใช้คั่น
+
+
+def test_pack_comments_respects_token_budget():
+    comments = [f"comment {index} " * (index % 7 + 1) for index in range(200)] + ["x" * 600, "ไทย" * 10]
+    chunks = pack_comments(comments, token_budget=50)
+    assert all(chunk_tokens(chunk) <= 50 for chunk in chunks)
+    # ลำดับเดิมคงอยู่ คอมเมนต์ที่ยาวเกินงบถูกตัดและอยู่กลุ่มเดี่ยว
+    flattened = [comment for chunk in chunks for comment in chunk]
+    assert flattened[:200] == comments[:200] and flattened[-1] == comments[-1]
+    assert [comment for comment in flattened if comment.startswith("xxx")] == ["x" * 144 + "..."]
+    assert ["x" * 144 + "..."] in chunks
+    # greedy: รวมกลุ่มที่ติดกันไม่ได้โดยไม่เกินงบ
+    assert all(chunk_tokens(first + second[:1]) > 50 for first, second in zip(chunks, chunks[1:]))
+
+
+def test_sketch_change_estimates_jaccard_distance():
+    comments = [f"comment {index}" for index in range(2000)]
+    sketch = comment_set_sketch(comments)
+    assert len(sketch) == summarizer.SKETCH_SIZE
+    assert sketch_change(sketch, comment_set_sketch(list(reversed(comments)))) == 0
+    assert sketch_change(sketch, comment_set_sketch([f"other {index}" for index in range(2000)])) == 1
+    changed = comments[:1600] + [f"new {index}" for index in range(400)]
+    assert sketch_change(sketch, comment_set_sketch(changed)) == pytest.approx(1 - 1600 / 2400, abs=0.06)
+
+
+def test_near_match_reuses_previous_summary_and_refreshes_in_background(monkeypatch):
+    monkeypatch.setattr(summarizer, "SUMMARY_SINGLE_PASS_TOKEN_BUDGET", 100_000)
+    comments = [f"comment {index}" for index in range(1000)]
+    slightly_changed = comments[20:] + [f"new {index}" for index in range(20)] # เปลี่ยนไปราว 4%
+    mostly_changed = comments[:500] + [f"other {index}" for index in range(500)]
+
+    async def run():
+        client = FakeOpenAI()
+        first = await summarize_comments(comments, client, scope="video")
+        near = await summarize_comments(slightly_changed, client, scope="video")
+        calls_before_refresh = client.calls
+        await asyncio.gather(*summarizer._refresh_tasks.values())
+        refreshed = await summarize_comments(slightly_changed, client, scope="video")
+        far = await summarize_comments(mostly_changed, client, scope="video")
+        return first, near, calls_before_refresh, refreshed, far
+
+    first, near, calls_before_refresh, refreshed, far = asyncio.run(run())
+    assert (first, near, calls_before_refresh) == ("summary 1", "summary 1", 1) # คืนสรุปเดิมทันที
+    assert refreshed == "summary 2" # ผลของการสรุปใหม่เบื้องหลังถูกเก็บลง cache
+    assert far == "summary 3" # เปลี่ยนเกิน SUMMARY_NEAR_MATCH_MAX_CHANGE จึงสรุปใหม่ทันที
+
+
+def test_background_refreshes_are_cancelled_on_shutdown(monkeypatch):
+    async def run():
+        cancelled = asyncio.Event()
+
+        async def hang(*args):
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        monkeypatch.setattr(summarizer, "_summarize_and_store", hang)
+        summarizer._refresh_in_background(["a"], [["a"]], "fingerprint", "video", None)
+        await asyncio.sleep(0)
+        await summarizer.cancel_background_refreshes()
+        return cancelled.is_set(), dict(summarizer._refresh_tasks)
+
+    assert asyncio.run(run()) == (True, {})
+
+
+def test_map_reduce_chunks_fit_budget_and_are_capped(monkeypatch):
+    monkeypatch.setattr(summarizer, "SUMMARY_SINGLE_PASS_TOKEN_BUDGET", 200)
+    monkeypatch.setattr(summarizer, "SUMMARY_CHUNK_TOKEN_BUDGET", 200)
+    monkeypatch.setattr(summarizer, "MAX_SUMMARY_CHUNKS", 4)
+    chunks = []
+    summarize_chunk = summarizer._summarize_chunk
+
+    async def recording_summarize_chunk(chunk, openai_client, semaphore):
+        chunks.append(chunk)
+        return await summarize_chunk(chunk, openai_client, semaphore)
+
+    monkeypatch.setattr(summarizer, "_summarize_chunk", recording_summarize_chunk)
+    comments = [f"ความคิดเห็นที่ {index} comment" for index in range(2000)]
+    client = FakeOpenAI()
+    summary = asyncio.run(summarize_comments(comments, client))
+
+    assert len(chunks) == 4 # ชุดคอมเมนต์ที่ต้องใช้หลายสิบกลุ่มถูกสุ่มแบบเว้นระยะให้เหลือ MAX_SUMMARY_CHUNKS กลุ่ม
+    assert all(chunk_tokens(chunk) <= 200 for chunk in chunks)
+    sampled = [comment for chunk in chunks for comment in chunk]
+    assert sampled == sorted(sampled, key=comments.index) # คงลำดับเดิม
+    assert comments.index(sampled[-1]) > 1500 # ครอบคลุมถึงช่วงท้ายของชุดคอมเมนต์
+    assert (client.calls, summary) == (5, "summary 5") # map 4 กลุ่ม + reduce 1 ครั้ง
@@ -0,0 +1,72 @@
+import os
+import re
+import logging
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Union
+
+if TYPE_CHECKING:
+    import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# ใช้แทน tiktoken เมื่อโหลด encoding ไม่ได้: ตัวอักษร ASCII ประมาณ 3 ตัวต่อโทเค็น ตัวอักษรอื่น (เช่น ภาษาไทย) 1 ตัวต่อโทเค็น
+# ประเมินเกินจริงเล็กน้อยดีกว่าประเมินต่ำ เพราะใช้จัดกลุ่มข้อความให้อยู่ในงบโทเค็นของ request
+_APPROXIMATE_TOKEN_PATTERN = re.compile(r"[\x00-\x7f]{1,3}|[^\x00-\x7f]")
+_fallback_warned = False
+
+# "approximate" = ไม่โหลด tiktoken เลย ใช้ ApproximateEncoding (เช่น ใน benchmark ที่ต้องไม่ใช้ network)
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "tiktoken").lower()
+
+
+class ApproximateEncoding:
+    """
+    encoding สำรองที่มี method ชุดเดียวกับที่แอปใช้จาก tiktoken.Encoding (encode_ordinary, encode_ordinary_batch, decode)
+    "โทเค็น" คือชิ้นของข้อความตาม _APPROXIMATE_TOKEN_PATTERN จึงตัดข้อความตามจำนวนโทเค็นแล้ว decode กลับได้
+    """
+
+    name = "approximate"
+
+    def encode_ordinary(self, text: str) -> List[str]:
+        return _APPROXIMATE_TOKEN_PATTERN.findall(text)
+
+    def encode_ordinary_batch(self, texts: List[str]) -> List[List[str]]:
+        return [self.encode_ordinary(text) for text in texts]
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=8)
+def get_encoding(model_name: str = "gpt-3.5-turbo") -> Union["tiktoken.Encoding", ApproximateEncoding]:
+    """
+    คืนค่า tiktoken encoding ของโมเดลที่ระบุ (โหลดครั้งเดียวแล้วเก็บไว้ใช้ซ้ำ)
+    tiktoken ถูก import ตอนเรียกครั้งแรก (หรือในขั้น warm-up ของ startup.py) ไม่ใช่ตอน import แอป
+    ถ้าโหลดไม่ได้ (เช่น ออฟไลน์แล้วดาวน์โหลดไฟล์ BPE ไม่ได้) จะใช้ ApproximateEncoding แทน
+    """
+    global _fallback_warned
+    if TOKEN_ENCODING == "approximate":
+        return ApproximateEncoding()
+    try:
+        import tiktoken  # ใช้สำหรับนับโทเค็นให้ตรงกับโมเดลของ OpenAI
+
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            # Fallback ไปยัง encoding พื้นฐานหากไม่พบ model_name
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        if not _fallback_warned:
+            _fallback_warned = True
+            logger.warning("โหลด tiktoken encoding ไม่ได้ (%s: %s) ใช้การประมาณจำนวนโทเค็นจากจำนวนตัวอักษรแทน",
+                           type(e).__name__, e)
+        return ApproximateEncoding()
+
+
+def count_tokens(texts: List[str], model_name: str = "gpt-3.5-turbo") -> List[int]:
+    """
+    นับจำนวนโทเค็นของข้อความหลายข้อความในครั้งเดียว (ใช้ encode_ordinary_batch)
+    """
+    if not texts:
+        return []
+    encoding = get_encoding(model_name)
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
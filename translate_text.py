@@ -1,70 +1,230 @@
-import openai
-from langdetect import detect, LangDetectException # นำเข้า detect และ Exception
+from __future__ import annotations
+
+import logging
+import os
+import asyncio
+from typing import TYPE_CHECKING, Optional
+from detect_language import needs_translation_batch # ตรวจสอบทั้ง batch ว่าข้อความใดต้องแปล
 import re # นำเข้า regex สำหรับการตรวจสอบตัวอักษร
+from token_utils import count_tokens # ใช้นับโทเค็นเพื่อจัดกลุ่มคอมเมนต์ให้อยู่ในงบโทเค็น
+from cache_store import TieredCache, make_cache_key, normalize_cache_text # cache คำแปลแบบ LRU + SQLite
+from rate_limiter import openai_limiter # จำกัดอัตรา request/โทเค็น และ concurrency ของ OpenAI
+from metrics import timed_stage # จับเวลาขั้นตอนตรวจจับภาษาและแปล
+
+if TYPE_CHECKING:
+    import openai  # ใช้เฉพาะใน type hint (openai ถูก import ตอนสร้าง client ดู main.get_openai_client)
+
+logger = logging.getLogger(__name__)
+
+TRANSLATION_MODEL = "gpt-3.5-turbo"
+TRANSLATION_SYSTEM_PROMPT = "คุณคือผู้ช่วยที่เชี่ยวชาญในการแปลข้อความเป็นภาษาไทยอย่างแม่นยำและเป็นธรรมชาติ"
+# เปลี่ยนค่านี้เมื่อแก้ prompt ของการแปล เพื่อไม่ให้ใช้คำแปลเก่าใน cache
+TRANSLATION_PROMPT_VERSION = "v1"
+
+# --- การตั้งค่าการแปลแบบกลุ่ม (batch) และแบบขนาน ---
+MAX_CONCURRENT_TRANSLATIONS = 8 # จำนวน request ไปยัง OpenAI ที่ส่งพร้อมกันได้สูงสุด
+MAX_COMMENTS_PER_BATCH = 20 # จำนวนคอมเมนต์สูงสุดในหนึ่ง prompt
+BATCH_TOKEN_BUDGET = 1500 # จำนวนโทเค็นของคอมเมนต์รวมกันสูงสุดในหนึ่ง prompt
+# Regex สำหรับแยกคำตอบแบบมีหมายเลข เช่น "[1] ข้อความ"
+NUMBERED_LINE_PATTERN = re.compile(r'^\s*\[(\d+)\]\s?', re.MULTILINE)
+
+# --- Cache คำแปล (key = hash ของข้อความที่ normalize แล้ว + โมเดล + เวอร์ชันของ prompt) ---
+TRANSLATION_CACHE_PATH = os.getenv(
+    "TRANSLATION_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "translations.sqlite3")
+) # ตั้งเป็นค่าว่างเพื่อใช้ cache ในหน่วยความจำอย่างเดียว
+translation_cache = TieredCache(
+    "translation",
+    max_entries=int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "20000")),
+    ttl_seconds=float(os.getenv("TRANSLATION_CACHE_TTL_SECONDS", str(30 * 24 * 3600))),
+    db_path=TRANSLATION_CACHE_PATH or None,
+    max_disk_entries=int(os.getenv("TRANSLATION_CACHE_MAX_DISK_ENTRIES", "500000")),
+)
+
+
+def translation_cache_key(text: str) -> str:
+    """สร้าง key ของ cache คำแปลสำหรับข้อความต้นฉบับ"""
+    return make_cache_key(normalize_cache_text(text), TRANSLATION_MODEL, TRANSLATION_PROMPT_VERSION)
+
+
+def build_translation_batches(texts: list, token_budget: int = BATCH_TOKEN_BUDGET,
+                              max_items: int = MAX_COMMENTS_PER_BATCH) -> list:
+    """
+    จัดกลุ่มข้อความแบบ greedy ให้แต่ละกลุ่มมีจำนวนโทเค็นรวมไม่เกิน token_budget
+    และจำนวนข้อความไม่เกิน max_items (ข้อความที่ยาวเกินงบจะอยู่กลุ่มเดี่ยว)
+    คืนค่า list ของกลุ่ม โดยแต่ละกลุ่มเป็น list ของ index ใน texts
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for index, tokens in enumerate(count_tokens(texts, TRANSLATION_MODEL)):
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def split_numbered_response(content: str, expected_count: int):
+    """
+    แยกคำตอบแบบมีหมายเลข "[1] ... [2] ..." กลับเป็นคำแปลรายข้อความตามลำดับ
+    คืนค่า None ถ้าหมายเลขไม่ครบหรือไม่เรียงตามลำดับ (ให้ผู้เรียก fallback ไปแปลทีละข้อความ)
+    """
+    markers = list(NUMBERED_LINE_PATTERN.finditer(content))
+    if [int(marker.group(1)) for marker in markers] != list(range(1, expected_count + 1)):
+        return None
+
+    parts = []
+    for position, marker in enumerate(markers):
+        end = markers[position + 1].start() if position + 1 < len(markers) else len(content)
+        part = content[marker.end():end].strip()
+        if not part:
+            return None
+        parts.append(part)
+    return parts
+
+
+async def _create_translation(openai_client: openai.AsyncOpenAI, user_prompt: str, max_tokens: int):
+    """ส่ง request แปลภาษาไปยัง OpenAI ผ่านตัวจำกัดอัตรา"""
+    messages = [
+        {"role": "system", "content": TRANSLATION_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+    prompt_tokens = sum(count_tokens([TRANSLATION_SYSTEM_PROMPT, user_prompt], TRANSLATION_MODEL))
+    return await openai_limiter.call(
+        lambda: openai_client.chat.completions.create(
+            model=TRANSLATION_MODEL,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=0.2,
+        ),
+        tokens=prompt_tokens + max_tokens,
+        method="chat.completions",
+    )
+
 
-async def translate_to_thai(texts: list, openai_client: openai.AsyncOpenAI) -> list:
+async def _translate_single(text: str, openai_client: openai.AsyncOpenAI, semaphore: asyncio.Semaphore):
+    """แปลข้อความเดียวด้วย OpenAI (คืนค่า None หากเกิดข้อผิดพลาด เพื่อไม่ให้ถูกเก็บลง cache)"""
+    import openai  # ถูก import ไปแล้วตอนสร้าง openai_client จึงไม่มีค่าใช้จ่ายเพิ่ม
 
-    translated_texts = []
+    try:
+        # เรียกใช้ OpenAI API เพื่อแปลข้อความ (เฉพาะกรณีที่จำเป็น)
+        async with semaphore:
+            response = await _create_translation(
+                openai_client, f"โปรดแปลข้อความต่อไปนี้เป็นภาษาไทย:\n\n{text}", max_tokens=500
+            )
+        if response.choices and response.choices[0].message and response.choices[0].message.content:
+            return response.choices[0].message.content
+        logger.warning("OpenAI API คืนค่าโครงสร้างที่ไม่คาดคิดสำหรับการแปล: %s", response)
+        return None # โครงสร้างคำตอบไม่ถูกต้อง
+    except openai.APIError as e:
+        logger.warning("เกิดข้อผิดพลาดจาก OpenAI API ระหว่างการแปล: %s", e)
+        return None # เกิดข้อผิดพลาดจาก API
+    except Exception as e:
+        logger.warning("เกิดข้อผิดพลาดที่ไม่คาดคิดระหว่างการแปลด้วย OpenAI: %s", e)
+        return None # เกิดข้อผิดพลาดอื่นๆ
+
+
+async def _translate_batch(texts: list, openai_client: openai.AsyncOpenAI, semaphore: asyncio.Semaphore) -> list:
+    """
+    แปลหลายข้อความใน prompt เดียวแบบมีหมายเลข แล้วแยกคำตอบกลับตามลำดับ
+    หากแยกคำตอบไม่ได้หรือเรียก API ไม่สำเร็จ จะ fallback ไปแปลทีละข้อความ
+    รายการที่แปลไม่สำเร็จจะมีค่าเป็น None
+    """
+    if len(texts) == 1:
+        return [await _translate_single(texts[0], openai_client, semaphore)]
+
+    # ขึ้นบรรทัดใหม่ในคอมเมนต์จะทำให้แยกหมายเลขผิด จึงรวมเป็นบรรทัดเดียว
+    numbered = "\n".join(f"[{number}] {' '.join(text.split())}" for number, text in enumerate(texts, start=1))
+    try:
+        async with semaphore:
+            response = await _create_translation(
+                openai_client,
+                (
+                    f"โปรดแปลข้อความ {len(texts)} รายการต่อไปนี้เป็นภาษาไทยทีละรายการ "
+                    "ตอบกลับเป็นคำแปลเท่านั้น บรรทัดละหนึ่งรายการ "
+                    "โดยขึ้นต้นด้วยหมายเลขในวงเล็บเหลี่ยมเดียวกับต้นฉบับ เช่น [1] คำแปล\n\n"
+                    f"{numbered}"
+                ),
+                max_tokens=min(4000, 500 + 100 * len(texts)),
+            )
+        content = response.choices[0].message.content if response.choices and response.choices[0].message else None
+        parts = split_numbered_response(content or "", len(texts))
+        if parts is not None:
+            return parts
+        logger.debug("แยกคำแปลแบบกลุ่มไม่สำเร็จ (%d รายการ) จะแปลทีละข้อความแทน", len(texts))
+    except Exception as e:
+        logger.warning("เกิดข้อผิดพลาดระหว่างการแปลแบบกลุ่มด้วย OpenAI: %s จะแปลทีละข้อความแทน", e)
+
+    return list(await asyncio.gather(*(_translate_single(text, openai_client, semaphore) for text in texts)))
+
+
+async def translate_to_thai(texts: list, openai_client: openai.AsyncOpenAI,
+                            max_concurrency: int = MAX_CONCURRENT_TRANSLATIONS,
+                            batch_token_budget: int = BATCH_TOKEN_BUDGET,
+                            failed_indexes: Optional[list] = None) -> list:
+    """
+    แปลข้อความที่ไม่ใช่ภาษาไทยเป็นภาษาไทย โดยคืนค่า list ที่มีลำดับตรงกับ texts
+    - ข้อความที่เคยแปลแล้วจะถูกดึงจาก cache โดยไม่เรียก OpenAI
+    - ข้อความที่เหลือจะถูกจัดกลุ่มเป็น prompt เดียวภายในงบโทเค็น
+    - แต่ละกลุ่มถูกส่งไปยัง OpenAI พร้อมกันได้ไม่เกิน max_concurrency request
+    ข้อความที่ต้องแปลแต่แปลไม่สำเร็จจะคืนค่าเป็นข้อความต้นฉบับ และ (ถ้าส่ง list มาใน failed_indexes) index ของข้อความนั้นจะถูกเพิ่มลงไป
+    เฉพาะเมื่อ OpenAI ล้มเหลวชั่วคราว ถ้าไม่ได้ตั้งค่า client ข้อความต้นฉบับคือผลสุดท้าย (ไม่นับว่าล้มเหลว)
+    """
+    translated_texts = list(texts) # เป็นภาษาไทยอยู่แล้ว หรือไม่จำเป็นต้องแปล ให้ใช้ข้อความเดิม
     if not openai_client:
-        print("ERROR: OpenAI client ไม่ได้ถูกตั้งค่าสำหรับฟังก์ชันแปลภาษา")
-        return texts # คืนค่าข้อความต้นฉบับหาก client ไม่พร้อมใช้งาน
-
-    MIN_CHARS_FOR_TRANSLATION = 5 # กำหนดจำนวนอักขระขั้นต่ำที่จะพิจารณาแปล
-    # Regex สำหรับตรวจสอบว่าข้อความมีตัวอักษรที่เป็นคำ (ตัวอักษรภาษาอังกฤษหรือไทย) หรือไม่
-    ALPHANUMERIC_PATTERN = re.compile(r'[a-zA-Z0-9ก-ฮ]')
-    # Regex สำหรับตรวจจับตัวอักษรไทย
-    THAI_CHAR_PATTERN = re.compile(r'[ก-ฮ]')
-
-    for text in texts:
-        # 1. ตรวจสอบข้อความที่สั้นเกินไป หรือไม่มีตัวอักษรที่เป็นคำเลย (เช่น อิโมจิล้วน, ตัวเลขล้วน)
-        if len(text.strip()) < MIN_CHARS_FOR_TRANSLATION or not ALPHANUMERIC_PATTERN.search(text):
-            translated_texts.append(text) # ไม่แปลข้อความประเภทนี้
-            continue # ไปยังข้อความถัดไป
-
-        # 2. ตรวจจับภาษาสำหรับข้อความที่ผ่านการกรองเบื้องต้น
-        should_translate = False
-        try:
-            detected_lang = detect(text)
-            if detected_lang != 'th': # ถ้าไม่ใช่ภาษาไทย ให้แปล
-                should_translate = True
-        except LangDetectException:
-            # หากตรวจจับภาษาไม่ได้ (เช่น ข้อความสั้นเกินไป)
-            # ตรวจสอบว่ามีตัวอักษรไทยหรือไม่ ถ้ามี ให้ถือว่าเป็นภาษาไทย ไม่ต้องแปล
-            if THAI_CHAR_PATTERN.search(text):
-                print(f"DEBUG: LangDetectException: ข้อความมีตัวอักษรไทย, ไม่แปล: '{text[:50]}...'")
-                should_translate = False
-            else:
-                # ไม่มีตัวอักษรไทย และตรวจจับภาษาไม่ได้ ให้ทำการแปล (อาจเป็นภาษาอังกฤษสั้นๆ หรือภาษาอื่น)
-                print(f"ไม่สามารถตรวจจับภาษาได้สำหรับข้อความ: '{text[:50]}...' จะทำการแปล")
-                should_translate = True
-        except Exception as e:
-            print(f"เกิดข้อผิดพลาดในการตรวจจับภาษา: {e}. จะทำการแปลข้อความ")
-            should_translate = True
-
-        if should_translate:
-            try:
-                # เรียกใช้ OpenAI API เพื่อแปลข้อความ (เฉพาะกรณีที่จำเป็น)
-                response = await openai_client.chat.completions.create(
-                    model="gpt-3.5-turbo", 
-                    messages=[
-                        {"role": "system", "content": "คุณคือผู้ช่วยที่เชี่ยวชาญในการแปลข้อความเป็นภาษาไทยอย่างแม่นยำและเป็นธรรมชาติ"},
-                        {"role": "user", "content": f"โปรดแปลข้อความต่อไปนี้เป็นภาษาไทย:\n\n{text}"}
-                    ],
-                    max_tokens=500, #
-                    temperature=0.2, 
-                )
-                if response.choices and response.choices[0].message and response.choices[0].message.content:
-                    translated_texts.append(response.choices[0].message.content)
-                else:
-                    print(f"OpenAI API คืนค่าโครงสร้างที่ไม่คาดคิดสำหรับการแปล: {response}")
-                    translated_texts.append(text) # คืนค่าข้อความต้นฉบับหากโครงสร้างคำตอบไม่ถูกต้อง
-            except openai.APIError as e:
-                print(f"เกิดข้อผิดพลาดจาก OpenAI API ระหว่างการแปล: {e}")
-                translated_texts.append(text) # คืนค่าข้อความต้นฉบับหากเกิดข้อผิดพลาดจาก API
-            except Exception as e:
-                print(f"เกิดข้อผิดพลาดที่ไม่คาดคิดระหว่างการแปลด้วย OpenAI: {e}")
-                translated_texts.append(text) # คืนค่าข้อความต้นฉบับหากเกิดข้อผิดพลาดอื่นๆ
+        logger.debug("OpenAI client ไม่ได้ถูกตั้งค่าสำหรับฟังก์ชันแปลภาษา ใช้ข้อความต้นฉบับ")
+        return translated_texts # คืนค่าข้อความต้นฉบับหาก client ไม่พร้อมใช้งาน
+
+    with timed_stage("language_detection"):
+        candidate_indexes = [index for index, needed in enumerate(needs_translation_batch(texts)) if needed]
+    if not candidate_indexes:
+        return translated_texts
+
+    with timed_stage("translation"):
+        return await _translate_candidates(texts, candidate_indexes, translated_texts, openai_client,
+                                           max_concurrency, batch_token_budget, failed_indexes)
+
+
+async def _translate_candidates(texts: list, candidate_indexes: list, translated_texts: list,
+                                openai_client: openai.AsyncOpenAI, max_concurrency: int,
+                                batch_token_budget: int, failed_indexes: Optional[list] = None) -> list:
+    """แปลข้อความที่ต้องแปล (cache → จัดกลุ่ม → ส่งไปยัง OpenAI) แล้วเติมคำแปลลงใน translated_texts"""
+    # ดึงคำแปลที่มีอยู่แล้วจาก cache ก่อน
+    cache_keys = {index: translation_cache_key(texts[index]) for index in candidate_indexes}
+    cached = await translation_cache.aget_many(cache_keys.values())
+    pending_indexes = []
+    for index in candidate_indexes:
+        if cache_keys[index] in cached:
+            translated_texts[index] = cached[cache_keys[index]]
         else:
-            translated_texts.append(text) # เป็นภาษาไทยอยู่แล้ว หรือไม่จำเป็นต้องแปล
-            
+            pending_indexes.append(index)
+    if not pending_indexes:
+        return translated_texts
+
+    # ข้อความซ้ำกันใน request เดียวกัน (เช่น คอมเมนต์สแปม) ให้แปลเพียงครั้งเดียว
+    unique_keys = list(dict.fromkeys(cache_keys[index] for index in pending_indexes))
+    text_by_key = {cache_keys[index]: texts[index] for index in reversed(pending_indexes)}
+    pending_texts = [text_by_key[key] for key in unique_keys]
+
+    batches = build_translation_batches(pending_texts, token_budget=batch_token_budget)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    batch_results = await asyncio.gather(*(
+        _translate_batch([pending_texts[i] for i in batch], openai_client, semaphore) for batch in batches
+    ))
+    new_translations = {}
+    for batch, results in zip(batches, batch_results):
+        for i, translated_text in zip(batch, results):
+            if translated_text is not None:
+                new_translations[unique_keys[i]] = translated_text
+    await translation_cache.aset_many(new_translations)
+
+    for index in pending_indexes:
+        # ถ้าแปลไม่สำเร็จ ให้คืนค่าข้อความต้นฉบับเหมือนเดิม
+        translated_texts[index] = new_translations.get(cache_keys[index], texts[index])
+        if failed_indexes is not None and cache_keys[index] not in new_translations:
+            failed_indexes.append(index)
+
     return translated_texts
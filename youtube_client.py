@@ -0,0 +1,104 @@
+import os
+from typing import Optional, Tuple
+import httpx
+from dotenv import load_dotenv
+from rate_limiter import youtube_limiter # จำกัดอัตรา, quota รายวัน และ concurrency ของ YouTube
+
+# โหลดค่า environment จากไฟล์ .env
+load_dotenv()
+
+# ดึง API Key สำหรับ YouTube จาก environment variables
+YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
+
+# Endpoint หลักของ YouTube Data API v3
+YOUTUBE_API_BASE_URL = os.getenv("YOUTUBE_API_BASE_URL", "https://www.googleapis.com/youtube/v3") # เปลี่ยนได้เพื่อชี้ไปยัง server จำลอง (fake_upstreams.py)
+
+# ค่าเริ่มต้นของ connection pool (keep-alive) ที่ใช้ร่วมกันทั้ง process
+DEFAULT_TIMEOUT = httpx.Timeout(15.0, connect=5.0)
+DEFAULT_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=30.0)
+
+
+class YouTubeClient:
+    """
+    Client แบบ async สำหรับ YouTube Data API v3
+    ใช้ httpx.AsyncClient ตัวเดียวที่มี connection pool แบบ keep-alive
+    แทนการเรียก googleapiclient.discovery.build() ใหม่ทุกครั้ง
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = YOUTUBE_API_BASE_URL,
+                 http_client: Optional[httpx.AsyncClient] = None):
+        self.api_key = api_key if api_key is not None else YOUTUBE_API_KEY
+        self.base_url = base_url.rstrip("/")
+        self._http = http_client
+        self._owns_http = http_client is None
+
+    def _get_http(self) -> httpx.AsyncClient:
+        # สร้าง AsyncClient ครั้งแรกเมื่อถูกใช้งาน (ต้องอยู่ภายใน event loop)
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(base_url=self.base_url, timeout=DEFAULT_TIMEOUT, limits=DEFAULT_LIMITS)
+            self._owns_http = True
+        return self._http
+
+    async def list(self, resource: str, **params) -> dict:
+        """
+        เรียก `<resource>.list` ของ YouTube Data API แล้วคืนค่า JSON response
+        เช่น await client.list("videos", part="snippet", id=video_id)
+        พารามิเตอร์ที่เป็น None จะไม่ถูกส่งไป (เช่น pageToken ของหน้าแรก)
+        """
+        response = await self._get(resource, params)
+        response.raise_for_status()
+        return response.json()
+
+    async def list_if_changed(self, resource: str, etag: Optional[str] = None, **params) -> Tuple[Optional[dict], Optional[str]]:
+        """
+        เหมือน list แต่ส่ง If-None-Match ด้วย ETag ของ response ครั้งก่อน
+        คืนค่า (response, etag) โดย response เป็น None ถ้าข้อมูลไม่เปลี่ยน (HTTP 304)
+        """
+        headers = {"If-None-Match": etag} if etag else None
+        response = await self._get(resource, params, headers=headers)
+        if response.status_code == 304:
+            return None, etag
+        response.raise_for_status()
+        data = response.json()
+        return data, response.headers.get("ETag") or data.get("etag")
+
+    async def _get(self, resource: str, params: dict, headers: Optional[dict] = None) -> httpx.Response:
+        if not self.api_key:
+            raise ValueError("YouTube API Key is not set.")
+
+        query = {key: value for key, value in params.items() if value is not None}
+        query["key"] = self.api_key
+
+        http = self._get_http()
+        response = await youtube_limiter.call(
+            lambda: http.get(f"/{resource}", params=query, headers=headers), method=resource
+        )
+        if response.status_code == 403 and "quotaExceeded" in response.text:
+            youtube_limiter.quota.mark_exhausted()
+        return response
+
+    async def aclose(self) -> None:
+        """ปิด connection pool (เรียกตอน shutdown ของแอป)"""
+        if self._http is not None and self._owns_http and not self._http.is_closed:
+            await self._http.aclose()
+        self._http = None
+
+
+# --- Client ที่ใช้ร่วมกันทั้ง process ---
+_youtube_client: Optional[YouTubeClient] = None
+
+
+def get_youtube_client() -> YouTubeClient:
+    """คืนค่า YouTubeClient ตัวเดียวที่ใช้ร่วมกันทุกฟังก์ชันใน fetch_comments และ fetch_channel_data"""
+    global _youtube_client
+    if _youtube_client is None:
+        _youtube_client = YouTubeClient()
+    return _youtube_client
+
+
+async def close_youtube_client() -> None:
+    """ปิด client ที่ใช้ร่วมกัน (เรียกจาก lifespan ของ FastAPI)"""
+    global _youtube_client
+    if _youtube_client is not None:
+        await _youtube_client.aclose()
+        _youtube_client = None